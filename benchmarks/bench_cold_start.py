@@ -0,0 +1,107 @@
+"""搜图插件冷启动基准
+
+每轮在全新的子进程中执行（与 `nb run --reload` 检测到改动后重启进程的开销一致）：
+- plugin_load：nonebot.load_plugin("qqbot.plugins.pixiv") 的耗时（导入插件及其依赖）
+- process_ready：从解释器启动到驱动 startup 钩子全部执行完（插件后台任务已启动）的总耗时
+
+输出各项的中位数 / 最小值，以及插件导入期间新增的模块数。
+
+示例：
+    python -m benchmarks.bench_cold_start --runs 10
+    python -m benchmarks.bench_cold_start --runs 10 --json cold_start.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.absolute()
+
+# 子进程中执行的探针：打印一行 JSON
+PROBE = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import nonebot
+from nonebot.adapters.onebot.v11 import Adapter
+nonebot.init(driver="~none", log_level="WARNING")
+driver = nonebot.get_driver()
+driver.register_adapter(Adapter)
+modules_before = len(sys.modules)
+load_started = time.perf_counter()
+nonebot.load_plugin("qqbot.plugins.pixiv")
+plugin_load = time.perf_counter() - load_started
+modules_added = len(sys.modules) - modules_before
+result = {{}}
+
+@driver.on_startup
+async def _ready():
+    result.update(
+        plugin_load=plugin_load,
+        process_ready=time.perf_counter() - started + {interpreter_start},
+        modules_added=modules_added,
+        pil_loaded="PIL.Image" in sys.modules,
+    )
+
+    async def _exit():
+        driver.exit()
+    asyncio.get_running_loop().create_task(_exit())
+
+nonebot.run()
+print("RESULT " + json.dumps(result), flush=True)
+"""
+
+
+def _run_once(config_path: Path, data_dir: Path) -> dict:
+    """启动一个子进程并解析探针输出"""
+    # 解释器自身启动时间用空进程测量后计入
+    interpreter_started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    interpreter_start = time.perf_counter() - interpreter_started
+    env = dict(os.environ, PIXIV_PLUGIN_CONFIG=str(config_path), PIXIV_PLUGIN_DATA_DIR=str(data_dir))
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(root=str(ROOT), interpreter_start=interpreter_start)],
+        check=True, capture_output=True, text=True, env=env, cwd=tempfile.gettempdir(),
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="搜图插件冷启动基准")
+    parser.add_argument("--runs", type=int, default=7, help="子进程启动次数")
+    parser.add_argument("--json", type=Path, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="pixiv_cold_") as workdir:
+        # 后台任务指向不可达地址，避免启动探测访问外网；数据目录放在临时目录中
+        config_path = Path(workdir) / "config.conf"
+        config_path.write_text(
+            "[DEFAULT]\n"
+            "PIXIV_API_BASE = http://127.0.0.1:9\n"
+            "PROXY_URL = http://127.0.0.1:9/\n"
+            "USE_PROXY = False\n",
+            encoding="utf-8",
+        )
+        runs = [_run_once(config_path, Path(workdir) / "data") for _ in range(args.runs)]
+    summary = {"runs": args.runs}
+    for key in ("plugin_load", "process_ready"):
+        values = [run[key] for run in runs]
+        summary[f"{key}_s"] = {
+            "median": round(statistics.median(values), 3),
+            "min": round(min(values), 3),
+        }
+    summary["modules_added"] = runs[-1]["modules_added"]
+    summary["pil_loaded_at_startup"] = runs[-1]["pil_loaded"]
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if args.json:
+        args.json.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""搜图插件热点函数微基准与性能回归检查
+
+覆盖请求路径上的纯函数：
+- 解析：搜索结果 JSON 解码并转换为 Artwork（parse_search_payload）
+- 评分/过滤：_extract_tag_names、_is_r18_content、_calculate_quality_scores、
+  _process_search_results、_select_best_image（含已填满的近似重复索引）、_replace_image_domain
+- 压缩：_find_optimal_size、_fine_tune_quality
+
+运行前先检查 JSON 解析的标准库回退：模拟未安装 orjson（可选依赖 qqbot[fast]）时
+http_utils 应使用 json.loads，且与当前解析器对搜索结果的解析结果一致。
+
+输入为 60~5000 条的合成搜索结果，以及 JPEG/PNG/RGBA、1~60MP 的合成图片。
+每个用例记录耗时（多次取中位数）、内存分配峰值（tracemalloc）和 JPEG 编码次数，
+并与保存的基线比较，出现回归时以非零状态退出。
+
+不同机器（以及同一机器在不同负载下）的绝对耗时差异很大，因此耗时按同一进程内的校准循环归一化：
+每次运行用例前先运行一次对应的校准循环（纯 Python，或与压缩路径参数相同的 PIL 缩放编码），
+用例的最短耗时除以校准循环的最短耗时得到“校准单位”，基线保存并比较的是校准单位，毫秒数只用于显示。
+疑似回归的用例会重新测量，多次都超出容差才判定为回归。
+
+示例：
+    python -m benchmarks.bench_hot_paths                 # 与基线比较
+    python -m benchmarks.bench_hot_paths --save-baseline # 更新基线
+    python -m benchmarks.bench_hot_paths --full          # 包含 24MP / 60MP 大图
+"""
+import argparse
+import io
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(ROOT))
+
+import nonebot
+from PIL import Image
+
+# 导入插件包需要先初始化 NoneBot
+nonebot.init(driver="~none", log_level="WARNING")
+from qqbot.plugins.pixiv.utils import pixiv_utils
+from qqbot.plugins.pixiv.utils.artwork_utils import parse_search_items
+from qqbot.plugins.pixiv.utils.dedup_utils import DuplicateIndex, MAX_SENT
+from qqbot.plugins.pixiv.utils import http_utils
+from qqbot.plugins.pixiv.utils.http_utils import json_loads
+
+logging.getLogger().setLevel(logging.WARNING)
+
+BASELINE_PATH = Path(__file__).parent / "hot_paths_baseline.json"
+PAYLOAD_SIZES = (60, 500, 5000)
+IMAGE_MP_QUICK = (1, 8)
+IMAGE_MP_FULL = (1, 8, 24, 60)
+IMAGE_KINDS = ("JPEG", "PNG", "RGBA")
+NOW = datetime(2025, 1, 1, tzinfo=timezone.utc)
+# 用例名前缀 -> 归一化所用的校准循环，其余用例使用纯 Python 校准
+IMAGE_CASE_PREFIXES = ("find_optimal_size", "fine_tune_quality")
+
+
+class EncodeCounter:
+    """统计 Image.save 的调用次数（即编码次数）"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self._original = Image.Image.save
+
+    def __enter__(self):
+        counter = self
+        original = self._original
+
+        def _save(img, *args, **kwargs):
+            counter.count += 1
+            return original(img, *args, **kwargs)
+
+        Image.Image.save = _save
+        return self
+
+    def __exit__(self, *exc):
+        Image.Image.save = self._original
+
+
+def make_payload(size: int, seed: int = 0) -> list:
+    """生成合成的搜索结果（结构与 /ajax/search/artworks 返回一致）"""
+    rng = random.Random(seed + size)
+    items = []
+    for index in range(size):
+        pid = 100_000_000 + index
+        views = rng.randint(100, 300_000)
+        tags = [{"tag": rng.choice(["オリジナル", "女の子", "Genshin", "鳴潮", "風景", "少女"])} for _ in range(rng.randint(3, 12))]
+        if rng.random() < 0.08:
+            tags.append({"tag": rng.choice(["R-18", "R-18G", "r18"])})
+        created = NOW - timedelta(days=rng.randint(0, 720))
+        items.append({
+            "id": str(pid),
+            "title": f"bench-{pid}",
+            "url": f"https://i.pximg.net/c/250x250_80_a2/img-master/img/2024/01/01/00/00/00/{pid}_p0_square1200.jpg",
+            "tags": tags,
+            "userId": str(rng.randint(1, 10_000_000)),
+            "userName": f"artist-{index}",
+            "width": rng.randint(800, 4000),
+            "height": rng.randint(800, 4000),
+            "pageCount": 1,
+            "isAdContainer": 1 if rng.random() < 0.01 else 0,
+            "bookmarkCount": rng.randint(0, views // 5),
+            "likeCount": rng.randint(0, views // 3),
+            "viewCount": views,
+            "createDate": created.strftime("%Y-%m-%dT%H:%M:%S+09:00"),
+        })
+    return items
+
+
+def make_image(megapixels: float, kind: str) -> Image.Image:
+    """生成合成图片（渐变 + 噪声，压缩特性接近插画）"""
+    side = int((megapixels * 1_000_000) ** 0.5)
+    gradient = Image.linear_gradient("L").resize((side, side))
+    noise = Image.effect_noise((side, side), 48)
+    base = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    if kind == "RGBA":
+        img = base.convert("RGBA")
+        img.putalpha(gradient)
+        # 与 compress_image 一致：RGBA 先合成到白底
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    buffer = io.BytesIO()
+    base.save(buffer, format="PNG" if kind == "PNG" else "JPEG", quality=95)
+    buffer.seek(0)
+    decoded = Image.open(buffer)
+    decoded.load()
+    return decoded.convert("RGB")
+
+
+def _jpeg_size(img: Image.Image) -> int:
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=95, optimize=True, progressive=True)
+    return buffer.tell()
+
+
+def _python_workload() -> None:
+    """纯 Python 校准负载：字典/字符串/排序，与评分、过滤路径的开销构成相近"""
+    items = [{"id": str(i), "tags": [f"tag{i % 37}", f"tag{i % 11}"], "score": (i * 7919) % 1000}
+             for i in range(20000)]
+    tags = {}
+    for item in items:
+        for tag in item["tags"]:
+            tags[tag] = tags.get(tag, 0) + 1
+    sorted(items, key=lambda item: item["score"])
+    ",".join(item["id"] for item in items if item["score"] > 500)
+
+
+def _make_image_workload():
+    img = make_image(2, "JPEG")
+
+    def _image_workload() -> None:
+        """PIL 校准负载：与压缩路径相同的缩放 + JPEG 编码参数（optimize/progressive 的内存开销与基础编码差别很大）"""
+        buffer = io.BytesIO()
+        img.resize((img.width * 3 // 4, img.height * 3 // 4), Image.LANCZOS).save(
+            buffer, format="JPEG", quality=95, optimize=True, progressive=True
+        )
+
+    return _image_workload
+
+
+def _timed(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def measure(fn, repeat: int, workload) -> dict:
+    """测量耗时（中位数与最小值）、校准单位、内存分配峰值与编码次数
+
+    每次运行用例前运行一次校准循环，两者交替执行，经历相同的机器负载变化；
+    校准单位 = 用例最短耗时 / 校准循环最短耗时（干扰只会让耗时变长，最小值最接近真实开销）。
+    """
+    timings = []
+    calibration = []
+    for index in range(repeat):
+        calibration.append(_timed(workload))
+        if index == 0:
+            # 首次运行同时统计编码次数
+            with EncodeCounter() as encodes:
+                timings.append(_timed(fn))
+        else:
+            timings.append(_timed(fn))
+    calibration.extend(_timed(workload) for _ in range(2))
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "time_s": statistics.median(timings),
+        "best_s": min(timings),
+        "units": min(timings) / min(calibration),
+        "peak_alloc_bytes": peak,
+        "encodes": encodes.count,
+    }
+
+
+def _make_dedup_index(candidates: list) -> DuplicateIndex:
+    rng = random.Random(1)
+    index = DuplicateIndex(threshold=6, window=86400)
+    for i in range(MAX_SENT):
+        index.add(f"sent{i}", rng.getrandbits(64))
+        index.remember(f"sent{i}")
+    for item in candidates:
+        index.add(item.pid, rng.getrandbits(64))
+    return index
+
+
+def build_cases(full: bool) -> dict:
+    """构建全部基准用例：名称 -> (函数, 重复次数)"""
+    cases = {}
+    for size in PAYLOAD_SIZES:
+        payload = make_payload(size)
+        body = json.dumps({"error": False, "body": {"illustManga": {"data": payload}}}).encode()
+        artworks = parse_search_items(payload)
+        repeat = 20 if size <= 500 else 5
+
+        def _parse(body=body):
+            # 保留解析结果，内存峰值包含缓存候选所占的内存
+            return parse_search_items(json_loads(body)["body"]["illustManga"]["data"])
+
+        def _tags(payload=payload):
+            for item in payload:
+                pixiv_utils._extract_tag_names(item)
+
+        def _r18(payload=payload):
+            for item in payload:
+                pixiv_utils._is_r18_content(pixiv_utils._extract_tag_names(item))
+
+        def _scores(artworks=artworks):
+            pixiv_utils._calculate_quality_scores(artworks, NOW)
+
+        def _process(artworks=artworks):
+            pixiv_utils._process_search_results(artworks, False, NOW)
+
+        candidates = pixiv_utils._process_search_results(artworks, False, NOW)
+
+        def _select(candidates=candidates):
+            random.seed(0)
+            for _ in range(100):
+                pixiv_utils._select_best_image(candidates, False)
+
+        # 近似重复索引已满：记住 MAX_SENT 个已发送作品，所有候选的哈希均已知（且都不重复）
+        dedup_index = _make_dedup_index(candidates)
+
+        def _select_dedup(candidates=candidates, dedup_index=dedup_index):
+            random.seed(0)
+            previous, pixiv_utils.DEDUP_INDEX = pixiv_utils.DEDUP_INDEX, dedup_index
+            try:
+                for _ in range(100):
+                    pixiv_utils._select_best_image(candidates, False)
+            finally:
+                pixiv_utils.DEDUP_INDEX = previous
+
+        def _replace(payload=payload):
+            for item in payload:
+                pixiv_utils._replace_image_domain(item["url"])
+
+        cases[f"parse_search_payload[{size}]"] = (_parse, repeat)
+        cases[f"extract_tag_names[{size}]"] = (_tags, repeat)
+        cases[f"is_r18_content[{size}]"] = (_r18, repeat)
+        cases[f"calculate_quality_scores[{size}]"] = (_scores, repeat)
+        cases[f"process_search_results[{size}]"] = (_process, repeat)
+        cases[f"select_best_image[{size}]x100"] = (_select, repeat)
+        cases[f"select_best_image_dedup[{size}]x100"] = (_select_dedup, repeat)
+        cases[f"replace_image_domain[{size}]"] = (_replace, repeat)
+
+    for megapixels in IMAGE_MP_FULL if full else IMAGE_MP_QUICK:
+        for kind in IMAGE_KINDS:
+            img = make_image(megapixels, kind)
+            # 目标设为 95% 质量编码体积的 40%，确保走缩放 + 质量搜索路径
+            target = _jpeg_size(img) * 0.4
+            target_range = (target * 0.95, target * 0.98)
+            repeat = 3 if megapixels <= 8 else 1
+
+            def _optimal(img=img, target_range=target_range):
+                pixiv_utils._find_optimal_size(img, img.size[0], img.size[1], target_range)
+
+            def _quality(img=img, target_range=target_range):
+                pixiv_utils._fine_tune_quality(img, target_range)
+
+            cases[f"find_optimal_size[{kind},{megapixels}MP]"] = (_optimal, repeat)
+            cases[f"fine_tune_quality[{kind},{megapixels}MP]"] = (_quality, repeat)
+    return cases
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float, alloc_tolerance: float) -> list:
+    """与基线比较，返回回归列表（耗时比较校准单位，与机器快慢无关）"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or "units" not in base:
+            continue
+        # 换算回本机耗时后低于 1ms 的波动视为噪声
+        seconds_per_unit = current["best_s"] / current["units"] if current["units"] else 0
+        if (current["units"] > base["units"] * (1 + time_tolerance)
+                and (current["units"] - base["units"]) * seconds_per_unit > 0.001):
+            regressions.append(f"{name}: 耗时 {base['units']:.3f} → {current['units']:.3f} 校准单位"
+                               f"（本机 {current['best_s']*1000:.2f}ms）")
+        if current["peak_alloc_bytes"] > base["peak_alloc_bytes"] * (1 + alloc_tolerance) + 4096:
+            regressions.append(f"{name}: 内存峰值 {base['peak_alloc_bytes']} → {current['peak_alloc_bytes']} 字节")
+        if current["encodes"] > base["encodes"]:
+            regressions.append(f"{name}: 编码次数 {base['encodes']} → {current['encodes']}")
+    return regressions
+
+
+def check_json_fallback() -> list:
+    """检查未安装 orjson 时的标准库回退，返回错误列表"""
+    saved = sys.modules.get("orjson")
+    sys.modules["orjson"] = None    # 使 import orjson 抛出 ImportError
+    try:
+        fallback = http_utils._select_json_loads()
+    finally:
+        if saved is None:
+            del sys.modules["orjson"]
+        else:
+            sys.modules["orjson"] = saved
+    if fallback is not json.loads:
+        return [f"未安装 orjson 时应回退到 json.loads，实际为 {fallback!r}"]
+    body = json.dumps(
+        {"error": False, "body": {"illustManga": {"data": make_payload(60)}}}, ensure_ascii=False
+    )
+    errors = []
+    # aiohttp 的 response.json(loads=...) 传入 str，直接解析时传入 bytes
+    for data in (body, body.encode()):
+        if fallback(data) != json_loads(data):
+            errors.append(f"标准库与 {json_loads.__module__} 对 {type(data).__name__} 的解析结果不一致")
+    return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="搜图插件热点函数微基准")
+    parser.add_argument("--full", action="store_true", help="包含 24MP / 60MP 大图用例")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="允许的耗时增长比例")
+    parser.add_argument("--alloc-tolerance", type=float, default=0.10, help="允许的内存峰值增长比例")
+    parser.add_argument("--retries", type=int, default=2, help="疑似回归用例的重新测量次数")
+    args = parser.parse_args()
+
+    errors = check_json_fallback()
+    if errors:
+        print("❌ JSON 解析回退检查失败:")
+        for line in errors:
+            print(f"  {line}")
+        return 1
+
+    image_workload = _make_image_workload()
+    cases = {name: case for name, case in build_cases(args.full).items() if args.filter in name}
+
+    def _run(name):
+        fn, repeat = cases[name]
+        workload = image_workload if name.startswith(IMAGE_CASE_PREFIXES) else _python_workload
+        return measure(fn, repeat, workload)
+
+    results = {}
+    for name in cases:
+        results[name] = r = _run(name)
+        print(f"{name:<44} {r['time_s']*1000:>10.2f}ms {r['units']:>9.3f}u "
+              f"{r['peak_alloc_bytes']/1024:>10.1f}KB  encodes={r['encodes']}")
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+        # 旧格式（只有绝对耗时）的条目无法比较，直接丢弃
+        baseline = {name: entry for name, entry in baseline.items() if "units" in entry}
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"基线已保存: {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print("未找到基线文件，使用 --save-baseline 生成")
+        return 0
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = compare(results, baseline, args.time_tolerance, args.alloc_tolerance)
+    # 疑似回归的用例重新测量，保留校准单位最小的一次，排除偶发干扰
+    for _ in range(args.retries):
+        suspects = [name for name in results
+                    if compare({name: results[name]}, baseline, args.time_tolerance, args.alloc_tolerance)]
+        if not suspects:
+            break
+        for name in suspects:
+            retry = _run(name)
+            if retry["units"] < results[name]["units"]:
+                results[name] = retry
+        regressions = compare(results, baseline, args.time_tolerance, args.alloc_tolerance)
+    if regressions:
+        print("\n❌ 性能回归:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\n✅ 未发现性能回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""搜图插件端到端吞吐基准
+
+在子进程中启动本地 Pixiv 模拟服务（benchmarks/pixiv_simulator.py），
+把插件的 API / 图片代理地址指向它，然后以 N 个并发用户直接调用真实的
+handle_pixiv_command（并等待入队的作业完成），用假 Bot 记录发送的消息。
+
+输出：命令延迟 p50/p95/p99、吞吐量、峰值 RSS、上游各接口请求数。
+
+示例：
+    python -m benchmarks.bench_pixiv_e2e --users 8 --rounds 5 --latency 0.1 --image-mp 4 24
+    python -m benchmarks.bench_pixiv_e2e --users 16 --failure-rate 0.1 --json result.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.pixiv_simulator import SimulatorConfig, serve
+
+
+class FakeMessage(str):
+    """模拟消息对象（插件只用到 str()）"""
+
+
+class FakeEvent:
+    """模拟 OneBot 消息事件"""
+
+    def __init__(self, user_id: int, group_id: int, text: str) -> None:
+        self.user_id = user_id
+        self.group_id = group_id
+        self.text = text
+
+    def get_user_id(self) -> str:
+        return str(self.user_id)
+
+    def get_session_id(self) -> str:
+        return f"group_{self.group_id}_{self.user_id}"
+
+    def get_message(self) -> FakeMessage:
+        return FakeMessage(self.text)
+
+    def get_plaintext(self) -> str:
+        return self.text
+
+
+class FakeBot:
+    """记录插件发出的所有消息与 API 调用"""
+
+    self_id = "10000"
+
+    def __init__(self) -> None:
+        self.sent = []
+        self.api_calls = []
+
+    async def send(self, event, message, **kwargs):
+        self.sent.append((time.perf_counter(), event.user_id, _describe(message)))
+        return {"message_id": len(self.sent)}
+
+    async def call_api(self, api: str, **data):
+        self.api_calls.append((time.perf_counter(), api))
+        return {"message_id": len(self.api_calls)}
+
+    def __getattr__(self, name: str):
+        # 兼容 bot.send_group_forward_msg(...) 等写法
+        async def _api(**data):
+            return await self.call_api(name, **data)
+        return _api
+
+
+def _describe(message) -> str:
+    """把消息归类为 text / image / forward"""
+    segments = getattr(message, "type", None)
+    if segments == "image":
+        return "image"
+    if isinstance(message, str):
+        return "text"
+    types = {getattr(seg, "type", "text") for seg in message} if hasattr(message, "__iter__") else set()
+    return "image" if "image" in types else "text"
+
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def _fetch_stats(port: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/__stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def _write_config(port: int, args, directory: Path) -> Path:
+    """生成指向模拟服务的插件配置"""
+    path = directory / "config.conf"
+    path.write_text(
+        "[DEFAULT]\n"
+        f"PIXIV_API_BASE = http://127.0.0.1:{port}\n"
+        f"PROXY_URL = http://127.0.0.1:{port}/\n"
+        "USE_PROXY = False\n"
+        "API_ROUTES = direct\n"
+        "IMAGE_ROUTES = worker\n"
+        "COOLDOWN_TIME = 0\n"
+        f"DOWNLOAD_TIMEOUT = {args.download_timeout}\n"
+        "MAX_ATTEMPTS = 2\n"
+        "EXCLUDE_DURATION = 3600\n"
+        f"JOB_WORKERS = {args.workers}\n"
+        "JOB_QUEUE_SIZE = 1000\n"
+        "JOB_GROUP_MAX_PENDING = 1000\n",
+        encoding="utf-8",
+    )
+    return path
+
+
+async def _user_session(handler, bot: FakeBot, user_id: int, args, latencies: list, first_images: list,
+                        outcomes: Counter):
+    """单个用户：依次发送 rounds 条搜图命令"""
+    for round_index in range(args.rounds):
+        tag = args.tags[(user_id + round_index) % len(args.tags)]
+        text = f"/p {tag} {args.batch}" if args.batch > 1 else f"/p {tag}"
+        event = FakeEvent(user_id, 10_000 + user_id % args.groups, text)
+        sent_before = len(bot.sent)
+        started = time.perf_counter()
+        try:
+            job = await handler(bot, event)
+            if job is not None:
+                # 命令只负责入队，等待作业队列处理完成
+                await job.wait()
+        except Exception as e:
+            outcomes[f"error:{type(e).__name__}"] += 1
+        latencies.append(time.perf_counter() - started)
+        sent = [(at, kind) for at, uid, kind in bot.sent[sent_before:] if uid == user_id]
+        # 首张图片（可能是先行发送的预览图）的送达时间
+        first_image = next((at for at, kind in sent if kind == "image"), None)
+        if first_image is not None:
+            first_images.append(first_image - started)
+        kinds = Counter(kind for _, kind in sent)
+        if args.batch > 1:
+            continue  # 批量模式的结果以合并转发发送，见 forward_msgs
+        outcomes["image" if kinds["image"] else "no_image"] += 1
+
+
+async def run_benchmark(args, port: int) -> dict:
+    from qqbot.plugins.pixiv import handle_pixiv_command
+
+    bot = FakeBot()
+    latencies = []
+    first_images = []
+    outcomes = Counter()
+    stats_before = _fetch_stats(port)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _user_session(handle_pixiv_command, bot, user_id, args, latencies, first_images, outcomes)
+        for user_id in range(args.users)
+    ))
+    wall = time.perf_counter() - started
+    stats_after = _fetch_stats(port)
+    upstream = {
+        key: value - stats_before["requests"].get(key, 0)
+        for key, value in stats_after["requests"].items()
+    }
+    return {
+        "users": args.users,
+        "commands": len(latencies),
+        "wall_s": round(wall, 3),
+        "throughput_cmd_per_s": round(len(latencies) / wall, 3) if wall else 0,
+        "latency_s": {
+            "p50": round(_percentile(latencies, 50), 3),
+            "p95": round(_percentile(latencies, 95), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+            "max": round(max(latencies), 3) if latencies else 0,
+        },
+        "first_image_s": {
+            "p50": round(_percentile(first_images, 50), 3) if first_images else None,
+            "max": round(max(first_images), 3) if first_images else None,
+        },
+        "outcomes": dict(outcomes),
+        "forward_msgs": sum(1 for _, api in bot.api_calls if api.endswith("forward_msg")),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "upstream_requests": upstream,
+        "upstream_bytes": stats_after["bytes_sent"] - stats_before["bytes_sent"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="搜图插件端到端吞吐基准（离线）")
+    parser.add_argument("--users", type=int, default=4, help="并发用户数")
+    parser.add_argument("--rounds", type=int, default=3, help="每个用户发送的命令数")
+    parser.add_argument("--groups", type=int, default=2, help="用户分布的群数量")
+    parser.add_argument("--tags", nargs="+", default=["鸣潮", "原神", "初音ミク"])
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--bandwidth", type=int, default=0, help="图片带宽（字节/秒），0 为不限速")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-mp", type=float, nargs="+", default=[2.0, 8.0])
+    parser.add_argument("--manga-ratio", type=float, default=0.0, help="多页作品比例")
+    parser.add_argument("--ugoira-ratio", type=float, default=0.0, help="动图作品比例")
+    parser.add_argument("--repost-ratio", type=float, default=0.0, help="转载作品比例")
+    parser.add_argument("--image-format", choices=["JPEG", "PNG"], default="JPEG")
+    parser.add_argument("--download-timeout", type=int, default=60)
+    parser.add_argument("--batch", type=int, default=1, help="每条命令请求的张数（>1 为批量模式）")
+    parser.add_argument("--workers", type=int, default=3, help="插件作业队列 worker 数")
+    parser.add_argument("--json", type=Path, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    sim_config = SimulatorConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        bandwidth=args.bandwidth,
+        failure_rate=args.failure_rate,
+        image_mp=args.image_mp,
+        image_format=args.image_format,
+        manga_ratio=args.manga_ratio,
+        ugoira_ratio=args.ugoira_ratio,
+        repost_ratio=args.repost_ratio,
+    )
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(sim_config, args.port, ready), daemon=True)
+    server.start()
+    ready.wait()
+    for _ in range(50):  # 等待端口可用
+        try:
+            _fetch_stats(args.port)
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    # 配置与数据目录均放在临时目录中，模拟数据不会写入插件的真实数据目录
+    workdir = tempfile.TemporaryDirectory(prefix="pixiv_bench_")
+    os.environ["PIXIV_PLUGIN_CONFIG"] = str(_write_config(args.port, args, Path(workdir.name)))
+    os.environ["PIXIV_PLUGIN_DATA_DIR"] = str(Path(workdir.name) / "data")
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter
+
+    nonebot.init(driver="~none", log_level="WARNING")
+    driver = nonebot.get_driver()
+    driver.register_adapter(Adapter)
+    nonebot.load_plugin("qqbot.plugins.pixiv")
+
+    result = {}
+
+    @driver.on_startup
+    async def _start_benchmark():
+        async def _run():
+            try:
+                result.update(await run_benchmark(args, args.port))
+            finally:
+                driver.exit()
+        asyncio.get_running_loop().create_task(_run())
+
+    try:
+        nonebot.run()
+    finally:
+        server.terminate()
+        workdir.cleanup()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        args.json.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""本地 Pixiv / 图片代理模拟服务
+
+提供与插件实际调用一致的接口：
+- GET  /ajax/search/artworks/{tag}
+- GET  /ajax/illust/{id}
+- GET  /ajax/user/extra（账号健康检查）
+- HEAD/GET 图片地址（img-original / img-master / 缩略图）
+
+可配置延迟、带宽、失败率和图片尺寸，并统计每类接口的请求次数。
+
+单独运行：
+    python -m benchmarks.pixiv_simulator --port 18080 --latency 0.05 --image-mp 4 24
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import time
+import zipfile
+import zlib
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+
+from aiohttp import web
+from PIL import Image
+
+ITEMS_PER_PAGE = 60
+IMAGE_HOST = "https://i.pximg.net"
+
+
+@dataclass
+class SimulatorConfig:
+    """模拟服务参数"""
+    latency: float = 0.05          # 每个请求的基础延迟（秒）
+    jitter: float = 0.02           # 延迟随机抖动（秒）
+    bandwidth: int = 0             # 图片下行带宽（字节/秒，0 为不限速）
+    failure_rate: float = 0.0      # 随机返回 503 的概率
+    image_mp: list = field(default_factory=lambda: [2.0, 8.0])  # 原图像素数（百万）
+    image_format: str = "JPEG"     # 原图格式（JPEG/PNG）
+    pages: int = 5                 # 每个标签可搜索的页数
+    r18_ratio: float = 0.05        # 搜索结果中 R-18 作品比例
+    manga_ratio: float = 0.0       # 多页作品比例（2~6 页）
+    ugoira_ratio: float = 0.0      # 动图作品比例
+    ugoira_frames: int = 30        # 动图帧数（600x600）
+    repost_ratio: float = 0.0      # 转载作品比例（与同组第一个作品缩略图相同）
+    seed: int = 42
+
+
+class PixivSimulator:
+    """aiohttp 实现的 Pixiv 接口替身"""
+
+    def __init__(self, config: SimulatorConfig) -> None:
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.counters = Counter()
+        self.bytes_sent = 0
+        self.originals = []
+        self.preview_noise = None
+        self.thumbnails = {}
+        self.previews = OrderedDict()
+
+    def prepare_images(self) -> None:
+        """预生成图片（噪声图，压缩率接近真实插画的最坏情况）"""
+        for mp in self.config.image_mp:
+            side = int((mp * 1_000_000) ** 0.5)
+            self.originals.append(_noise_image(side, side, self.config.image_format))
+        self.preview_noise = Image.frombytes("RGB", (1200, 1200), os.urandom(1200 * 1200 * 3))
+        self.ugoira_zip = _ugoira_zip(self.config.ugoira_frames) if self.config.ugoira_ratio else b""
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/ajax/search/artworks/{tag}", self.handle_search)
+        app.router.add_get("/ajax/illust/{pid}", self.handle_illust)
+        app.router.add_get("/ajax/illust/{pid}/pages", self.handle_pages)
+        app.router.add_get("/ajax/illust/{pid}/ugoira_meta", self.handle_ugoira_meta)
+        app.router.add_get("/ajax/user/extra", self.handle_user_extra)
+        app.router.add_get("/__stats", self.handle_stats)
+        app.router.add_route("*", "/{path:(img-original|img-master|img-zip-ugoira|c)/.*}", self.handle_image)
+        return app
+
+    async def _delay(self) -> None:
+        await asyncio.sleep(max(0.0, self.config.latency + self.random.uniform(-1, 1) * self.config.jitter))
+
+    def _should_fail(self) -> bool:
+        return self.random.random() < self.config.failure_rate
+
+    async def handle_search(self, request: web.Request) -> web.Response:
+        self.counters["search"] += 1
+        await self._delay()
+        if self._should_fail():
+            self.counters["search_failed"] += 1
+            return web.Response(status=503)
+        tag = request.match_info["tag"]
+        page = int(request.query.get("p", 1))
+        if page > self.config.pages:
+            return web.json_response({"error": False, "body": {"illustManga": {"data": []}}})
+        items = [self._search_item(tag, page, index) for index in range(ITEMS_PER_PAGE)]
+        return web.json_response({"error": False, "body": {"illustManga": {"data": items, "total": len(items) * self.config.pages}}})
+
+    def _search_item(self, tag: str, page: int, index: int) -> dict:
+        pid = 100_000_000 + (zlib.crc32(tag.encode()) % 1000) * 10_000 + page * 100 + index
+        rng = random.Random(pid)
+        tags = [tag, "オリジナル", "女の子"]
+        if self._is_r18(pid):
+            tags.append("R-18")
+        views = rng.randint(500, 200_000)
+        return {
+            "id": str(pid),
+            "title": f"sim-{pid}",
+            "illustType": 2 if self._is_ugoira(pid) else 0,
+            "xRestrict": 1 if "R-18" in tags else 0,
+            "url": f"{IMAGE_HOST}/c/250x250_80_a2/img-master/img/2024/01/01/00/00/00/{pid}_p0_square1200.jpg",
+            "tags": tags,
+            "userId": str(rng.randint(1, 9_999_999)),
+            "userName": f"artist-{pid % 997}",
+            "width": 2000,
+            "height": 3000,
+            "pageCount": self._page_count(pid),
+            "isAdContainer": False,
+            "bookmarkCount": rng.randint(0, views // 5),
+            "likeCount": rng.randint(0, views // 3),
+            "viewCount": views,
+            "createDate": "2024-01-01T00:00:00+09:00",
+        }
+
+    def _is_r18(self, pid: int) -> bool:
+        return random.Random(pid * 7 + 1).random() < self.config.r18_ratio
+
+    def _page_count(self, pid: int) -> int:
+        if self._is_ugoira(pid):
+            return 1
+        rng = random.Random(pid * 13 + 5)
+        return rng.randint(2, 6) if rng.random() < self.config.manga_ratio else 1
+
+    def _is_ugoira(self, pid: int) -> bool:
+        return random.Random(pid * 17 + 3).random() < self.config.ugoira_ratio
+
+    async def handle_illust(self, request: web.Request) -> web.Response:
+        self.counters["illust"] += 1
+        await self._delay()
+        if self._should_fail():
+            self.counters["illust_failed"] += 1
+            return web.Response(status=503)
+        pid = request.match_info["pid"]
+        ext = "png" if self.config.image_format == "PNG" else "jpg"
+        date_path = "2024/01/01/00/00/00"
+        tags = ["オリジナル", "女の子"]
+        if self._is_r18(int(pid)):
+            tags.append("R-18")
+        return web.json_response({
+            "error": False,
+            "message": "",
+            "body": {
+                "illustId": pid,
+                "title": f"sim-{pid}",
+                "userId": "1",
+                "userName": f"artist-{int(pid) % 997}",
+                "tags": {"tags": [{"tag": t} for t in tags]},
+                "urls": {
+                    "original": f"{IMAGE_HOST}/img-original/img/{date_path}/{pid}_p0.{ext}",
+                    "regular": f"{IMAGE_HOST}/img-master/img/{date_path}/{pid}_p0_master1200.jpg",
+                    "small": f"{IMAGE_HOST}/c/540x540_70/img-master/img/{date_path}/{pid}_p0_master1200.jpg",
+                },
+                "pageCount": self._page_count(int(pid)),
+                "illustType": 2 if self._is_ugoira(int(pid)) else 0,
+            },
+        })
+
+    async def handle_ugoira_meta(self, request: web.Request) -> web.Response:
+        self.counters["ugoira_meta"] += 1
+        await self._delay()
+        pid = request.match_info["pid"]
+        if not self._is_ugoira(int(pid)):
+            return web.json_response({"error": True, "message": "not ugoira", "body": []})
+        date_path = "2024/01/01/00/00/00"
+        return web.json_response({
+            "error": False,
+            "message": "",
+            "body": {
+                "src": f"{IMAGE_HOST}/img-zip-ugoira/img/{date_path}/{pid}_ugoira600x600.zip",
+                "originalSrc": f"{IMAGE_HOST}/img-zip-ugoira/img/{date_path}/{pid}_ugoira1920x1080.zip",
+                "mime_type": "image/jpeg",
+                "frames": [
+                    {"file": f"{index:06d}.jpg", "delay": 80} for index in range(self.config.ugoira_frames)
+                ],
+            },
+        })
+
+    async def handle_pages(self, request: web.Request) -> web.Response:
+        self.counters["pages"] += 1
+        await self._delay()
+        if self._should_fail():
+            self.counters["pages_failed"] += 1
+            return web.Response(status=503)
+        pid = request.match_info["pid"]
+        ext = "png" if self.config.image_format == "PNG" else "jpg"
+        date_path = "2024/01/01/00/00/00"
+        return web.json_response({
+            "error": False,
+            "message": "",
+            "body": [
+                {
+                    "urls": {
+                        "original": f"{IMAGE_HOST}/img-original/img/{date_path}/{pid}_p{page}.{ext}",
+                        "regular": f"{IMAGE_HOST}/img-master/img/{date_path}/{pid}_p{page}_master1200.jpg",
+                    },
+                    "width": 2000,
+                    "height": 3000,
+                }
+                for page in range(self._page_count(int(pid)))
+            ],
+        })
+
+    async def handle_user_extra(self, request: web.Request) -> web.Response:
+        self.counters["user_extra"] += 1
+        await self._delay()
+        if "PHPSESSID=" not in request.headers.get("Cookie", ""):
+            return web.json_response({"error": True, "message": "Please log in", "body": []})
+        return web.json_response({"error": False, "message": "", "body": {"following": 0, "followers": 0}})
+
+    def _image_for(self, path: str) -> bytes:
+        if path.startswith("img-zip-ugoira/"):
+            return self.ugoira_zip
+        pid = int("".join(ch for ch in path.rsplit("/", 1)[-1].split("_")[0] if ch.isdigit()) or 0)
+        if path.startswith("c/"):
+            return self._thumbnail_for(pid)
+        if path.startswith("img-master/"):
+            return self._preview_for(pid)
+        if not self.originals:
+            return self._preview_for(pid)
+        return self.originals[pid % len(self.originals)]
+
+    def _image_seed(self, pid: int) -> int:
+        """转载作品与同组（10 个连续ID）第一个作品使用相同的画面"""
+        if random.Random(pid * 19 + 7).random() < self.config.repost_ratio:
+            pid -= pid % 10
+        return pid
+
+    def _thumbnail_for(self, pid: int) -> bytes:
+        seed = self._image_seed(pid)
+        if seed not in self.thumbnails:
+            self.thumbnails[seed] = _pattern_image(seed, 250)
+        return self.thumbnails[seed]
+
+    def _preview_for(self, pid: int) -> bytes:
+        """预览图：作品画面叠加噪声（体积与真实预览图接近），只缓存最近的若干张"""
+        seed = self._image_seed(pid)
+        if seed in self.previews:
+            self.previews.move_to_end(seed)
+            return self.previews[seed]
+        pattern = Image.open(io.BytesIO(_pattern_image(seed, 1200))).convert("RGB")
+        buffer = io.BytesIO()
+        Image.blend(pattern, self.preview_noise, 0.3).save(buffer, format="JPEG", quality=85)
+        self.previews[seed] = buffer.getvalue()
+        if len(self.previews) > 32:
+            self.previews.popitem(last=False)
+        return self.previews[seed]
+
+    async def handle_image(self, request: web.Request) -> web.StreamResponse:
+        kind = "image_head" if request.method == "HEAD" else "image_get"
+        self.counters[kind] += 1
+        await self._delay()
+        if self._should_fail():
+            self.counters["image_failed"] += 1
+            return web.Response(status=503)
+        path = request.match_info["path"]
+        ext = ".png" if self.config.image_format == "PNG" else ".jpg"
+        if path.startswith("img-original/") and not path.endswith(ext):
+            self.counters["image_not_found"] += 1
+            return web.Response(status=404)
+        data = self._image_for(path)
+        content_type = "image/png" if data[:4] == b"\x89PNG" else "image/jpeg"
+        if request.method == "HEAD":
+            return web.Response(headers={"Content-Length": str(len(data)), "Content-Type": content_type})
+        response = web.StreamResponse(headers={"Content-Type": content_type})
+        response.content_length = len(data)
+        await response.prepare(request)
+        chunk_size = 64 * 1024
+        for offset in range(0, len(data), chunk_size):
+            chunk = data[offset:offset + chunk_size]
+            await response.write(chunk)
+            self.bytes_sent += len(chunk)
+            if self.config.bandwidth:
+                await asyncio.sleep(len(chunk) / self.config.bandwidth)
+        await response.write_eof()
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"requests": dict(self.counters), "bytes_sent": self.bytes_sent})
+
+
+def _noise_image(width: int, height: int, fmt: str, quality: int = 95) -> bytes:
+    """生成随机噪声图片"""
+    img = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    if fmt == "PNG":
+        img.save(buffer, format="PNG", compress_level=1)
+    else:
+        img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _pattern_image(seed: int, side: int) -> bytes:
+    """生成由随机色块组成的缩略图（同一 seed 结果相同）"""
+    rng = random.Random(seed)
+    blocks = Image.frombytes("RGB", (8, 8), bytes(rng.randrange(256) for _ in range(8 * 8 * 3)))
+    buffer = io.BytesIO()
+    blocks.resize((side, side), Image.BILINEAR).save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def _ugoira_zip(frames: int) -> bytes:
+    """生成动图帧压缩包（移动的色块 + 噪点，每帧 600x600 JPEG）"""
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as archive:
+        for index in range(frames):
+            img = Image.frombytes("RGB", (600, 600), os.urandom(600 * 600 * 3)).resize((600, 600))
+            block = Image.new("RGB", (200, 200), (index * 8 % 256, 120, 200))
+            img.paste(block, (index * 13 % 400, index * 7 % 400))
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=80)
+            archive.writestr(f"{index:06d}.jpg", buffer.getvalue())
+    return output.getvalue()
+
+
+def serve(config: SimulatorConfig, port: int, ready=None) -> None:
+    """启动模拟服务（阻塞，供子进程调用）"""
+    simulator = PixivSimulator(config)
+    started = time.perf_counter()
+    simulator.prepare_images()
+    print(f"[simulator] 图片生成耗时 {time.perf_counter() - started:.1f}s, 原图大小: "
+          + ", ".join(f"{len(b)/1024/1024:.1f}MB" for b in simulator.originals), flush=True)
+    if ready is not None:
+        ready.set()
+    web.run_app(simulator.build_app(), host="127.0.0.1", port=port, print=None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地 Pixiv 接口模拟服务")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--bandwidth", type=int, default=0, help="字节/秒，0 为不限速")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-mp", type=float, nargs="+", default=[2.0, 8.0])
+    parser.add_argument("--image-format", choices=["JPEG", "PNG"], default="JPEG")
+    parser.add_argument("--manga-ratio", type=float, default=0.0, help="多页作品比例")
+    parser.add_argument("--ugoira-ratio", type=float, default=0.0, help="动图作品比例")
+    parser.add_argument("--repost-ratio", type=float, default=0.0, help="转载作品比例")
+    args = parser.parse_args()
+    config = SimulatorConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        bandwidth=args.bandwidth,
+        failure_rate=args.failure_rate,
+        image_mp=args.image_mp,
+        image_format=args.image_format,
+        manga_ratio=args.manga_ratio,
+        ugoira_ratio=args.ugoira_ratio,
+        repost_ratio=args.repost_ratio,
+    )
+    print(json.dumps(config.__dict__, ensure_ascii=False))
+    serve(config, args.port)
+
+
+if __name__ == "__main__":
+    main()
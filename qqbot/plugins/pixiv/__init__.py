@@ -1,49 +1,213 @@
 import os
 import asyncio
-import traceback
 import time
 import logging
 import aiofiles
 import json  
-from nonebot import on_command, logger
-from nonebot.adapters.onebot.v11 import MessageSegment, Bot, Event
+from nonebot import on_command, logger, get_driver
+from nonebot.adapters.onebot.v11 import Message, MessageSegment, Bot, Event
+from nonebot.permission import SUPERUSER
 from .config.config import (
     COOLDOWN_TIME, 
     PROXY, 
-    PROXY_URL
+    PROXY_URL,
+    LOOP_MONITOR_ENABLED,
+    LOOP_MONITOR_INTERVAL,
+    LOOP_LAG_THRESHOLD,
+    LOG_QUEUE_SIZE,
+    LOG_REPEAT_LIMIT,
+    LOG_REPEAT_WINDOW,
+    PROFILE_SAMPLE_INTERVAL,
+    BREAKER_PROBE_INTERVAL,
+    ACCOUNT_HEALTH_INTERVAL,
+    TAG_STATS_FLUSH_INTERVAL,
+    PREFETCH_ENABLED,
+    JANITOR_INTERVAL,
+    JOB_WORKERS,
+    JOB_QUEUE_SIZE,
+    JOB_GROUP_MAX_PENDING,
+    JOB_TIMEOUT,
+    JOB_GROUP_WEIGHTS,
+    DELIVERY_SLA,
+    DELIVERY_LATE_ORIGINAL,
+    BATCH_MAX_COUNT,
+    BATCH_CONCURRENCY,
+    COLLAGE_COUNT,
+    COLLAGE_CELL,
+    PROCESS_POOL_WORKERS,
+    PAGE_CONCURRENCY,
+    PAGE_CHUNK_SIZE,
+    UGOIRA_ENABLED
 )
 from .api.pixiv_api import (
     search_pixiv_by_tag,
+    search_pixiv_works,
+    search_pixiv_thumbnails,
+    search_pixiv_by_pid,
     download_original_image,
-    cleanup_temp_files,
-    download_and_process_preview
+    resolve_original_url,
+    rendition_key,
+    get_cached_rendition,
+    record_thumbnail_hashes,
+    record_sent_hash,
+    cancel_hash_tasks,
+    resolve_page_urls,
+    get_ugoira_animation,
+    download_and_process_preview,
+    TAG_STATS,
+    JANITOR,
+    PREFETCHER,
+    PROFILE_DIR
 )
+from .utils import metrics_utils, profile_utils
+from .utils.profile_utils import profile_stage
+from .utils.loop_utils import LoopLagMonitor
+from .utils.http_utils import close_session, run_health_probe
+from .utils.pixiv_utils import run_account_health_check
+from .utils.tag_stats_utils import run_tag_stats_flush
+from .utils.janitor_utils import run_janitor
+from .utils.job_queue_utils import FairJobQueue, QueueFullError
+from .utils.pool_utils import configure_process_pool, run_in_process, shutdown_process_pool
+from .utils.collage_utils import compose_collage
+from .utils.log_utils import setup_logging, shutdown_logging
 # 创建日志
 logger = logging.getLogger()
-logging.basicConfig(level = logging.INFO,format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 # 请求冷却机制
 last_request_time = {}
-# 加载角色数据文件
+# 角色数据（驱动启动后在后台加载）与别名索引 {小写角色名/别名: (归属, 角色)}
 character_data = {}
+alias_index = {}
 config_dir = os.path.dirname(os.path.abspath(__file__))
 character_file = os.path.join(config_dir, 'character.json')
-if os.path.exists(character_file):
+
+def _read_character_file() -> dict:
+    """读取角色数据文件（在线程中执行）"""
+    if not os.path.exists(character_file):
+        logger.warning("角色数据文件 character.json 不存在，将使用空数据")
+        return {}
     try:
         with open(character_file, 'r', encoding='utf-8') as f:
-            character_data = json.load(f)
-        logger.info(f"角色数据加载成功，共 {len(character_data)} 个角色")
+            return json.load(f)
     except Exception as e:
-        logger.info(f"加载角色数据失败: {str(e)}")
-        character_data = {}  # 加载失败时清空数据
-else:
-    logger.warning("角色数据文件 character.json 不存在，将使用空数据")
+        logger.info("加载角色数据失败: %s", e)
+        return {}  # 加载失败时使用空数据
+
+async def _load_character_data():
+    """加载角色数据并建立别名索引"""
+    data = await asyncio.to_thread(_read_character_file)
+    index = {}
+    for franchise, characters in data.items():
+        for character, info in characters.items():
+            for name in [character, *info.get("别名", [])]:
+                index.setdefault(name.strip().lower(), (franchise, character))
+    character_data.clear()
+    character_data.update(data)
+    alias_index.clear()
+    alias_index.update(index)
+    logger.info("角色数据加载成功，共 %s 个归属, %s 个名称", len(character_data), len(alias_index))
+
+# 事件循环阻塞检测（仅在配置开启时运行）
+loop_monitor = LoopLagMonitor(LOOP_MONITOR_INTERVAL, LOOP_LAG_THRESHOLD) if LOOP_MONITOR_ENABLED else None
+driver = get_driver()
+# 图片处理进程池（首次使用时创建）
+configure_process_pool(PROCESS_POOL_WORKERS)
+# 搜图作业队列（按群加权公平调度）
+PIXIV_JOBS = FairJobQueue(JOB_WORKERS, JOB_QUEUE_SIZE, JOB_GROUP_MAX_PENDING, JOB_TIMEOUT, JOB_GROUP_WEIGHTS)
+# 后台任务（线路健康探测、账号健康检查等）
+background_tasks = []
+# 临时文件后台删除任务
+cleanup_tasks = set()
+
+@driver.on_startup
+async def _start_background_tasks():
+    """启动插件后台任务"""
+    setup_logging(queue_size=LOG_QUEUE_SIZE, repeat_limit=LOG_REPEAT_LIMIT, repeat_window=LOG_REPEAT_WINDOW)
+    background_tasks.append(asyncio.create_task(_load_character_data()))
+    await asyncio.to_thread(TAG_STATS.load)
+    if loop_monitor:
+        loop_monitor.start()
+    background_tasks.append(asyncio.create_task(run_health_probe(BREAKER_PROBE_INTERVAL)))
+    background_tasks.append(asyncio.create_task(run_account_health_check(ACCOUNT_HEALTH_INTERVAL)))
+    background_tasks.append(asyncio.create_task(run_tag_stats_flush(TAG_STATS, TAG_STATS_FLUSH_INTERVAL)))
+    background_tasks.append(asyncio.create_task(run_janitor(JANITOR, JANITOR_INTERVAL)))
+    background_tasks.extend(PIXIV_JOBS.start())
+    if PREFETCH_ENABLED:
+        background_tasks.append(asyncio.create_task(PREFETCHER.run()))
+
+@driver.on_shutdown
+async def _stop_background_tasks():
+    """停止插件后台任务"""
+    if loop_monitor:
+        await loop_monitor.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    PIXIV_JOBS.cancel_pending()
+    await cancel_hash_tasks()
+    await TAG_STATS.flush()
+    shutdown_process_pool()
+    await close_session()
+    shutdown_logging()
 
 # 核心command命令
 pixiv_cmd = on_command("搜图", aliases={"p"}, priority=5, block=True)
 @pixiv_cmd.handle()
 async def handle_pixiv_command(bot: Bot, event: Event):
     """处理 /pixiv 命令 - 原图优先模式"""
-    # ===== 新增：冷却机制检查 =====
+    if not await _check_cooldown(bot, event):
+        return
+    args = _command_args(event)
+    if not args:
+        await bot.send(event, "请提供搜索标签，例如：\n/pixiv 鸣潮\n/p 鸣潮\n/p 鸣潮 3（一次获取多张）")
+        return
+    tags = [tag.strip() for tag in args.split() if tag.strip()]
+    # 末尾的数字为批量张数
+    count = 1
+    if len(tags) > 1 and tags[-1].isdigit():
+        count = max(1, min(int(tags.pop()), BATCH_MAX_COUNT))
+    logger.info("Pixiv搜索请求: %s", tags)
+    if count > 1:
+        return await _submit_job(bot, event, " ".join(tags), lambda: _run_pixiv_batch(bot, event, tags, count))
+    return await _submit_job(bot, event, " ".join(tags), lambda: _run_pixiv_pipeline(bot, event, tags))
+
+# 拼图命令：候选作品缩略图拼成一张图，再用 /pid 获取原图
+collage_cmd = on_command("拼图", aliases={"pc"}, priority=5, block=True)
+@collage_cmd.handle()
+async def handle_collage_command(bot: Bot, event: Event):
+    """处理 /拼图 标签 - 发送候选作品缩略图网格"""
+    if not await _check_cooldown(bot, event):
+        return
+    args = _command_args(event)
+    if not args:
+        await bot.send(event, "请提供搜索标签，例如：\n/拼图 鸣潮\n/pc 鸣潮")
+        return
+    tags = [tag.strip() for tag in args.split() if tag.strip()]
+    logger.info("Pixiv拼图请求: %s", tags)
+    return await _submit_job(bot, event, " ".join(tags), lambda: _run_pixiv_collage(bot, event, tags))
+
+# 按作品ID获取原图
+pid_cmd = on_command("pid", priority=5, block=True)
+@pid_cmd.handle()
+async def handle_pid_command(bot: Bot, event: Event):
+    """处理 /pid 作品ID - 获取指定作品的原图"""
+    if not await _check_cooldown(bot, event):
+        return
+    pid = _command_args(event).lstrip("#")
+    if not pid.isdigit():
+        await bot.send(event, "请提供作品ID，例如：/pid 123456")
+        return
+    logger.info("Pixiv作品请求: %s", pid)
+    return await _submit_job(bot, event, f"pid:{pid}", lambda: _run_pixiv_pipeline(bot, event, pid=pid))
+
+def _command_args(event: Event) -> str:
+    """去掉命令前缀后的参数"""
+    raw_message = str(event.get_message()).strip()
+    command_str = event.get_plaintext().split()[0]
+    return raw_message[len(command_str):].strip()
+
+async def _check_cooldown(bot: Bot, event: Event) -> bool:
+    """冷却机制检查：冷却中时提示并返回 False"""
     user_id = event.get_user_id()
     current_time = time.time()
     # 检查是否在冷却中
@@ -52,20 +216,46 @@ async def handle_pixiv_command(bot: Bot, event: Event):
         if elapsed < COOLDOWN_TIME:
             remaining = COOLDOWN_TIME - elapsed
             await bot.send(event, f"请求过于频繁，请等待 {remaining:.1f} 秒后再试")
-            return
+            return False
     # 更新最后请求时间
     last_request_time[user_id] = current_time
-    raw_message = str(event.get_message()).strip()
-    command_str = event.get_plaintext().split()[0]
-    args = raw_message[len(command_str):].strip()
-    if not args:
-        await bot.send(event, "请提供搜索标签，例如：\n/pixiv 鸣潮\n/p 鸣潮")
-        return
-    tags = [tag.strip() for tag in args.split() if tag.strip()]
-    logger.info(f"Pixiv搜索请求: {tags}")
+    return True
+
+async def _submit_job(bot: Bot, event: Event, label: str, run):
+    """把作业（run 为无参协程函数）加入搜图队列并回复排队位置，返回作业"""
+    user_id = event.get_user_id()
+    group_id = getattr(event, "group_id", None)
+    group = str(group_id) if group_id else f"private_{user_id}"
+
+    async def _on_timeout():
+        await bot.send(event, "⌛ 搜图请求处理超时，已取消，请稍后再试")
+
+    try:
+        job, position = PIXIV_JOBS.submit(group, label, lambda: _run_profiled(label, run), _on_timeout)
+    except QueueFullError:
+        # 排队已满，撤销本次冷却计时
+        last_request_time.pop(user_id, None)
+        await bot.send(event, "当前搜图请求过多，请稍后再试")
+        return None
+    if position > 0:
+        await bot.send(event, f"⏳ 已加入搜图队列，前面还有 {position} 个请求")
+    return job
+
+async def _run_profiled(label: str, run):
+    """作业队列 worker 中执行的作业（分析模式开启时记录报告）"""
+    profiler = profile_utils.begin_command(label, PROFILE_DIR, PROFILE_SAMPLE_INTERVAL)
+    try:
+        await run()
+    finally:
+        if profiler:
+            await profiler.finish()
+
+async def _run_pixiv_pipeline(bot: Bot, event: Event, tags: list = None, pid: str = None):
+    """搜索（或按作品ID获取） → 下载 → 发送 的完整流程（失败时降级为预览图）"""
     try:
         # 1. 搜索作品
-        result = await search_pixiv_by_tag(tags)
+        with profile_stage("search"):
+            result = await (search_pixiv_by_pid(pid) if pid else search_pixiv_by_tag(tags))
         # 2. 构建消息内容
         msg_content = (
             f"🎨 作品标题: {result['title']}\n"
@@ -74,120 +264,360 @@ async def handle_pixiv_command(bot: Bot, event: Event):
             f"🔗 作品链接: {result['work_url']}\n\n"
             f"⏳ 正在下载原图 (可能需要较长时间)..."
         )
-        # 发送初步信息
-        await bot.send(event, msg_content)
-        # 3. 安全下载原图
+        if result.get('is_ugoira') and UGOIRA_ENABLED:
+            msg_content += "\n🎞️ 动图作品，正在合成动图..."
+        elif result.get('page_count', 1) > 1:
+            msg_content += f"\n📚 多页作品（共 {result['page_count']} 页），将以合并消息分批发送"
+        # 发送初步信息（与原图下载并行）
+        info_task = asyncio.create_task(bot.send(event, msg_content))
         try:
-            # 清理旧临时文件
-            await cleanup_temp_files()
-            # 下载原图
-            file_path = await download_original_image(result['image_url'])
-            # 检查文件是否存在
-            if not file_path or not file_path.exists():
-                if file_path is None:
-                    logger.warning("⚠️ 原图压缩失败，将使用预览图")
-                else:
-                    raise FileNotFoundError(f"文件不存在: {file_path}")
-                # 降级发送预览图
-                fallback_msg = (
-                    f"⚠️ 原图过大或压缩失败，已自动降级为预览图\n"
-                    f"🔗 原图下载: {result['image_url']}\n\n"
-                    f"🖼️ 当前显示预览图（点击链接下载原图）:"
-                )
-                await bot.send(event, fallback_msg)
-                # 发送预览图
-                preview_data = await download_and_process_preview(result['preview_url'])
-                await bot.send(event, MessageSegment.image(preview_data))
-                return
-            # 检查文件大小
-            file_size = file_path.stat().st_size
-            if file_size > 10 * 1024 * 1024:  # 超过10MB
-                logger.warning(f"⚠️ 图片过大 ({file_size/1024/1024:.1f}MB)，已自动降级为预览图")
-                fallback_msg = (
-                    f"⚠️ 原图过大（{file_size/1024/1024:.1f}MB），已自动降级为预览图\n"
-                    f"🔗 原图下载: {result['image_url']}\n\n"
-                    f"🖼️ 当前显示预览图（点击链接下载原图）:"
-                )
-                await bot.send(event, fallback_msg)
-                # 发送预览图
-                preview_data = await download_and_process_preview(result['preview_url'])
-                await bot.send(event, MessageSegment.image(preview_data))
-                return
-            # 发送原图
-            logger.info(f"准备发送文件路径: {file_path}")
-            start_time = time.time()
-            # 读取文件内容
-            try:
-                async with aiofiles.open(file_path, 'rb') as f:
-                    image_data = await f.read()
-                await bot.send(event, MessageSegment.image(image_data))
-                logger.info(f"✅ 原图发送成功! 耗时: {time.time()-start_time:.1f}s")
-            except Exception as e:
-                logger.info(f"发送失败: {str(e)}")
-                raise e
-            # 4. 同步清理文件（确保发送完成后再删除）
-            try:
-                # 等待一小段时间确保消息完全发送
-                await asyncio.sleep(1)
-                if file_path.exists():
-                    file_path.unlink()
-                    logger.debug(f"✅ 已清理临时文件: {file_path}")
-            except Exception as e:
-                logger.warning(f"清理文件警告 {file_path}: {str(e)}")
+            # 3. 下载并发送原图（超过 SLA 时先发送预览图；多页作品按页分批发送）
+            if result.get('is_ugoira') and UGOIRA_ENABLED:
+                await _deliver_ugoira(bot, event, result, info_task)
+            elif result.get('page_count', 1) > 1:
+                await _deliver_pages(bot, event, result, info_task)
+            else:
+                await _deliver_image(bot, event, result, info_task)
+        finally:
+            if not info_task.done():
+                info_task.cancel()
+    except Exception as e:
+        logger.info("Pixiv搜索失败: %s", e, exc_info=True)
+        await bot.send(event, f"❌ 搜索失败: {_format_search_error(str(e))}")
+
+def _format_search_error(error_msg: str) -> str:
+    """把搜索流程的异常转换为用户提示"""
+    # 优化错误提示
+    if "Cookie" in error_msg or "cookie" in error_msg.lower():
+        error_msg = (
+            "⚠️ Cookie无效！请重新获取Pixiv Cookie:\n"
+            "1. 登录 https://www.pixiv.net\n"
+            "2. 按 F12 打开开发者工具\n"
+            "3. 进入 Application → Storage → Cookies\n"
+            "4. 复制整个 Cookie 内容"
+        )
+    elif "代理" in error_msg or "proxy" in error_msg.lower() or "Proxy" in error_msg:
+        error_msg = (
+            f"⚠️ 代理配置问题！请检查:\n"
+            f"- 本地代理: {PROXY}\n"
+            f"- Cloudflare 代理: {PROXY_URL}\n"
+            "- 确保代理软件正常运行"
+        )
+    elif "timeout" in error_msg.lower() or "超时" in error_msg:
+        error_msg = (
+            "⚠️ 请求超时！可能是网络不稳定或代理延迟过高\n"
+            "建议:\n"
+            "1. 检查代理是否正常运行\n"
+            "2. 尝试更换标签\n"
+            "3. 检查Cloudflare Workers是否可用"
+        )
+    elif "memory access out of bounds" in error_msg or "内存" in error_msg:
+        error_msg = (
+            "⚠️ 内存溢出！原图过大导致\n"
+            "已自动降级发送预览图\n"
+            "您也可以通过作品链接下载原图"
+        )
+    elif "404" in error_msg or "403" in error_msg:
+        error_msg = (
+            "⚠️ 无法访问图片资源\n"
+            "可能是代理配置有误或Pixiv限制"
+        )
+    else:
+        error_msg = f"发生未知错误: {error_msg}"
+    return error_msg
+
+class OriginalUnavailable(Exception):
+    """原图无法发送（压缩失败或过大），需降级为预览图"""
+
+def _remove_file(file_path):
+    try:
+        file_path.unlink(missing_ok=True)
+        logger.debug("✅ 已清理临时文件: %s", file_path)
+    except Exception as e:
+        logger.warning("清理文件警告 %s: %s", file_path, e)
+
+def _cleanup_file(file_path):
+    """后台删除临时文件，不阻塞发送流程（遗漏的由磁盘清理任务兜底）"""
+    task = asyncio.create_task(asyncio.to_thread(_remove_file, file_path))
+    cleanup_tasks.add(task)
+    task.add_done_callback(cleanup_tasks.discard)
+
+async def _prepare_original(result: dict) -> bytes:
+    """下载原图并读入内存（读入后临时文件即可删除），返回图片数据；
+    之前压缩过的超大原图直接使用缓存的压缩结果"""
+    cached = await get_cached_rendition(result)
+    if cached is not None:
+        logger.info("作品[%s]使用缓存的压缩图: %.2fMB", result['pid'], len(cached)/1024/1024)
+        return cached
+    # 快速路径推测的地址先确认扩展名
+    file_size = await resolve_original_url(result)
+    return await _load_original(result['image_url'], file_size, rendition_key(result))
+
+async def _load_original(image_url: str, file_size: int = 0, cache_key: tuple = None) -> bytes:
+    """下载（必要时压缩）原图并检查大小，返回图片数据"""
+    file_path = await download_original_image(image_url, file_size, cache_key)
+    if file_path is None:
+        raise OriginalUnavailable("原图过大或压缩失败")
+    if not file_path.exists():
+        raise FileNotFoundError(f"文件不存在: {file_path}")
+    file_size = file_path.stat().st_size
+    if file_size > 10 * 1024 * 1024:  # 超过10MB
+        _cleanup_file(file_path)
+        raise OriginalUnavailable(f"原图过大（{file_size/1024/1024:.1f}MB）")
+    async with aiofiles.open(file_path, 'rb') as f:
+        image_data = await f.read()
+    _cleanup_file(file_path)
+    return image_data
+
+async def _get_preview(preview_task, preview_url: str, result: dict) -> bytes:
+    """取预览图数据：优先使用并行下载的结果，失败且地址已更新（回退到作品详情）时重新下载"""
+    if preview_task is not None:
+        try:
+            return await preview_task
+        except Exception:
+            if preview_url == result['preview_url']:
+                raise
+    return await download_and_process_preview(result['preview_url'])
+
+async def _send_original(bot: Bot, event: Event, image_data: bytes):
+    """发送原图"""
+    logger.info("准备发送原图: %.2fMB", len(image_data)/1024/1024)
+    start_time = time.time()
+    with profile_stage("send"):
+        await bot.send(event, MessageSegment.image(image_data))
+    logger.info("✅ 原图发送成功! 耗时: %.1fs", time.time()-start_time)
+
+def _finished_result(task):
+    """已成功完成的任务的结果，否则为 None"""
+    if task is None or not task.done() or task.cancelled() or task.exception() is not None:
+        return None
+    return task.result()
+
+async def _deliver_image(bot: Bot, event: Event, result: dict, info_task: asyncio.Task):
+    """原图与预览图并行下载：原图在 DELIVERY_SLA 秒内就绪则发送原图，否则先发送预览图。
+    info_task 为并行发送的作品信息消息，图片在其之后发送"""
+    original_task = asyncio.create_task(_prepare_original(result))
+    preview_url = result['preview_url']
+    preview_task = None
+    if DELIVERY_SLA > 0:
+        preview_task = asyncio.create_task(download_and_process_preview(preview_url))
+    try:
+        if preview_task is not None:
+            await asyncio.wait({original_task}, timeout=DELIVERY_SLA)
+            if not original_task.done():
+                # 超过 SLA：原图与预览图谁先就绪用谁
+                await asyncio.wait({original_task, preview_task}, return_when=asyncio.FIRST_COMPLETED)
+        await info_task
+        if preview_task is not None and not original_task.done() and preview_task.exception() is None:
+            metrics_utils.incr("delivery.preview_first")
+            await _send_preview_first(bot, event, result, original_task, preview_task.result())
+            return
+        try:
+            image_data = await original_task
         except Exception as e:
-            error_msg = str(e)
-            logger.info(f"原图发送失败: {error_msg}\n{traceback.format_exc()}")
-            # 降级方案：发送预览图 + 原图链接
-            fallback_msg = (
-                f"⚠️ 原图发送失败（可能文件过大或网络问题），已自动降级\n"
-                f"🔗 原图下载: {result['image_url']}\n\n"
-                f"🖼️ 当前显示预览图（点击链接下载原图）:"
-            )
-            await bot.send(event, fallback_msg)
-            # 发送预览图
-            preview_data = await download_and_process_preview(result['preview_url'])
-            await bot.send(event, MessageSegment.image(preview_data))
+            reason = str(e) if isinstance(e, OriginalUnavailable) else "原图下载失败（可能文件过大或网络问题）"
+            logger.info("原图下载失败: %s", e, exc_info=True)
+            await _send_preview_fallback(bot, event, result, reason, preview_task, preview_url)
+            return
+        # 去重哈希优先使用已下载好的预览图（解码开销远小于原图）
+        preview_data = _finished_result(preview_task)
+        if preview_task is not None:
+            preview_task.cancel()
+        try:
+            await _send_original(bot, event, image_data)
+            metrics_utils.incr("delivery.original")
+            record_sent_hash(result['pid'], preview_data or image_data)
+        except Exception as e:
+            logger.info("原图发送失败: %s", e, exc_info=True)
+            await _send_preview_fallback(bot, event, result, "原图发送失败（可能文件过大或网络问题）", None, preview_url)
+    finally:
+        if not original_task.done():
+            original_task.cancel()
+        if preview_task is not None and not preview_task.done():
+            preview_task.cancel()
+
+async def _send_preview_first(bot: Bot, event: Event, result: dict, original_task: asyncio.Task, preview_data: bytes):
+    """原图未在 SLA 内就绪：先发送预览图，按配置在原图就绪后补发"""
+    if DELIVERY_LATE_ORIGINAL:
+        notice = "⏱️ 原图较大，先发送预览图，原图下载完成后补发"
+    else:
+        notice = f"⏱️ 原图较大，先发送预览图\n🔗 原图下载: {result['image_url']}"
+    await bot.send(event, notice)
+    await bot.send(event, MessageSegment.image(preview_data))
+    record_sent_hash(result['pid'], preview_data)
+    if not DELIVERY_LATE_ORIGINAL:
+        return
+    try:
+        image_data = await original_task
     except Exception as e:
-        error_msg = str(e)
-        logger.info(f"Pixiv搜索失败: {error_msg}\n{traceback.format_exc()}")
-        # 优化错误提示
-        if "Cookie" in error_msg or "cookie" in error_msg.lower():
-            error_msg = (
-                "⚠️ Cookie无效！请重新获取Pixiv Cookie:\n"
-                "1. 登录 https://www.pixiv.net\n"
-                "2. 按 F12 打开开发者工具\n"
-                "3. 进入 Application → Storage → Cookies\n"
-                "4. 复制整个 Cookie 内容"
-            )
-        elif "代理" in error_msg or "proxy" in error_msg.lower() or "Proxy" in error_msg:
-            error_msg = (
-                f"⚠️ 代理配置问题！请检查:\n"
-                f"- 本地代理: {PROXY}\n"
-                f"- Cloudflare 代理: {PROXY_URL}\n"
-                "- 确保代理软件正常运行"
-            )
-        elif "timeout" in error_msg.lower() or "超时" in error_msg:
-            error_msg = (
-                "⚠️ 请求超时！可能是网络不稳定或代理延迟过高\n"
-                "建议:\n"
-                "1. 检查代理是否正常运行\n"
-                "2. 尝试更换标签\n"
-                "3. 检查Cloudflare Workers是否可用"
-            )
-        elif "memory access out of bounds" in error_msg or "内存" in error_msg:
-            error_msg = (
-                "⚠️ 内存溢出！原图过大导致\n"
-                "已自动降级发送预览图\n"
-                "您也可以通过作品链接下载原图"
-            )
-        elif "404" in error_msg or "403" in error_msg:
-            error_msg = (
-                "⚠️ 无法访问图片资源\n"
-                "可能是代理配置有误或Pixiv限制"
-            )
+        logger.info("原图补发取消: %s", e)
+        return
+    try:
+        await _send_original(bot, event, image_data)
+        metrics_utils.incr("delivery.original_late")
+    except Exception as e:
+        logger.info("原图补发失败: %s", e)
+
+async def _send_preview_fallback(bot: Bot, event: Event, result: dict, reason: str, preview_task, preview_url: str):
+    """降级方案：发送预览图 + 原图链接"""
+    metrics_utils.incr("delivery.fallback")
+    fallback_msg = (
+        f"⚠️ {reason}，已自动降级为预览图\n"
+        f"🔗 原图下载: {result['image_url']}\n\n"
+        f"🖼️ 当前显示预览图（点击链接下载原图）:"
+    )
+    await bot.send(event, fallback_msg)
+    preview_data = await _get_preview(preview_task, preview_url, result)
+    await bot.send(event, MessageSegment.image(preview_data))
+    record_sent_hash(result['pid'], preview_data)
+
+async def _deliver_ugoira(bot: Bot, event: Event, result: dict, info_task: asyncio.Task):
+    """动图作品：发送编码后的动图，失败时退回为发送第一帧"""
+    try:
+        animation = await get_ugoira_animation(result)
+    except Exception as e:
+        logger.warning("动图[%s]处理失败，改为发送第一帧: %s", result['pid'], e)
+        await _deliver_image(bot, event, result, info_task)
+        return
+    await info_task
+    with profile_stage("send"):
+        await bot.send(event, MessageSegment.image(animation))
+    metrics_utils.incr("delivery.ugoira")
+
+async def _deliver_pages(bot: Bot, event: Event, result: dict, info_task: asyncio.Task):
+    """多页作品：各页并发下载（受 PAGE_CONCURRENCY 限制），按页序每凑满 PAGE_CHUNK_SIZE 页发送一条合并转发"""
+    try:
+        pages = await resolve_page_urls(result)
+    except Exception as e:
+        logger.warning("作品[%s]分页获取失败，只发送第一页: %s", result['pid'], e)
+        await _deliver_image(bot, event, result, info_task)
+        return
+    semaphore = asyncio.Semaphore(PAGE_CONCURRENCY)
+    tasks = [asyncio.create_task(_fetch_image_or_preview(page, semaphore)) for page in pages]
+    try:
+        await info_task
+        chunk = []
+        for index, (page, task) in enumerate(zip(pages, tasks), 1):
+            image_data, is_preview = await task
+            text = f"📄 第 {index}/{len(pages)} 页"
+            if image_data is None:
+                text += "\n❌ 图片获取失败"
+            elif is_preview:
+                text += f"\n⚠️ 原图获取失败，当前为预览图\n🔗 原图下载: {page['image_url']}"
+            content = Message(text)
+            if image_data is not None:
+                content += MessageSegment.image(image_data)
+            chunk.append(MessageSegment.node_custom(int(bot.self_id), "Pixiv搜图", content))
+            if len(chunk) >= PAGE_CHUNK_SIZE or index == len(pages):
+                with profile_stage("send"):
+                    await _send_forward(bot, event, chunk)
+                chunk = []
+        metrics_utils.incr("pages.delivered", len(pages))
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+async def _run_pixiv_batch(bot: Bot, event: Event, tags: list, count: int):
+    """批量模式：一次搜索选出多个作品，并发下载后以一条合并转发消息发送"""
+    try:
+        with profile_stage("search"):
+            results = await search_pixiv_works(tags, count)
+        info_task = asyncio.create_task(
+            bot.send(event, f"🎨 找到 {len(results)} 个作品，正在下载，稍后以合并消息发送...")
+        )
+        try:
+            semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+            images = await asyncio.gather(*(_fetch_image_or_preview(result, semaphore) for result in results))
+            await info_task
+        finally:
+            if not info_task.done():
+                info_task.cancel()
+        nodes = [_build_batch_node(bot, result, *image) for result, image in zip(results, images)]
+        with profile_stage("send"):
+            await _send_forward(bot, event, nodes)
+        for result, (image_data, _) in zip(results, images):
+            record_sent_hash(result['pid'], image_data)
+    except Exception as e:
+        logger.info("Pixiv批量搜索失败: %s", e, exc_info=True)
+        await bot.send(event, f"❌ 搜索失败: {_format_search_error(str(e))}")
+
+async def _fetch_image_or_preview(result: dict, semaphore: asyncio.Semaphore):
+    """下载单个作品的图片，返回 (图片数据, 是否为预览图)；原图失败降级为预览图，均失败时数据为 None"""
+    async with semaphore:
+        try:
+            return await _prepare_original(result), False
+        except Exception as e:
+            logger.info("作品[%s]原图获取失败，降级为预览图: %s", result['pid'], e)
+        try:
+            return await download_and_process_preview(result['preview_url']), True
+        except Exception as e:
+            logger.warning("作品[%s]预览图获取失败: %s", result['pid'], e)
+            return None, True
+
+def _build_batch_node(bot: Bot, result: dict, image_data, is_preview: bool) -> MessageSegment:
+    """构建合并转发中的单个作品节点"""
+    text = (
+        f"🎨 {result['title']}\n"
+        f"👤 {result['author']} (ID: {result['author_id']})\n"
+        f"🆔 {result['pid']}  🔗 {result['work_url']}"
+    )
+    if image_data is None:
+        text += "\n❌ 图片获取失败"
+    elif is_preview:
+        text += f"\n⚠️ 原图获取失败，当前为预览图\n🔗 原图下载: {result['image_url']}"
+    content = Message(text)
+    if image_data is not None:
+        content += MessageSegment.image(image_data)
+    metrics_utils.incr("batch.preview" if is_preview else "batch.original")
+    return MessageSegment.node_custom(int(bot.self_id), "Pixiv搜图", content)
+
+async def _send_forward(bot: Bot, event: Event, nodes: list):
+    """发送合并转发消息（群聊/私聊），失败时逐条发送"""
+    group_id = getattr(event, "group_id", None)
+    try:
+        if group_id:
+            await bot.call_api("send_group_forward_msg", group_id=group_id, messages=nodes)
         else:
-            error_msg = f"发生未知错误: {error_msg}"
-        await bot.send(event, f"❌ 搜索失败: {error_msg}")
+            await bot.call_api("send_private_forward_msg", user_id=int(event.get_user_id()), messages=nodes)
+    except Exception as e:
+        logger.warning("合并转发发送失败，改为逐条发送: %s", e)
+        for node in nodes:
+            await bot.send(event, node.data["content"])
+
+async def _run_pixiv_collage(bot: Bot, event: Event, tags: list):
+    """拼图模式：并发下载候选作品缩略图，在进程池中拼成带作品ID的网格图后发送"""
+    try:
+        with profile_stage("search"):
+            works = await search_pixiv_thumbnails(tags, COLLAGE_COUNT)
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY * 2)
+
+        async def _fetch_thumb(work):
+            async with semaphore:
+                try:
+                    return await download_and_process_preview(work['thumb_url'])
+                except Exception as e:
+                    logger.info("作品[%s]缩略图获取失败: %s", work['pid'], e)
+                    return None
+
+        thumbs = await asyncio.gather(*(_fetch_thumb(work) for work in works))
+        if not any(thumbs):
+            raise Exception("缩略图全部下载失败")
+        with profile_stage("compose"):
+            collage = await run_in_process(
+                compose_collage, [(work['pid'], thumb) for work, thumb in zip(works, thumbs)], COLLAGE_CELL
+            )
+        caption = "\n".join(f"#{i} {work['pid']} {work['title']}" for i, work in enumerate(works, 1))
+        msg = Message(f"🧩 「{' '.join(tags)}」候选作品：\n{caption}\n\n💡 发送 /pid 作品ID 获取原图")
+        with profile_stage("send"):
+            await bot.send(event, msg + MessageSegment.image(collage))
+        try:
+            await record_thumbnail_hashes(works, thumbs)
+        except Exception as e:
+            logger.info("缩略图哈希计算失败: %s", e)
+    except Exception as e:
+        logger.info("Pixiv拼图失败: %s", e, exc_info=True)
+        await bot.send(event, f"❌ 搜索失败: {_format_search_error(str(e))}")
 
 # 搜图帮助命令
 help_cmd = on_command("搜图帮助", aliases={"sotu"}, priority=5, block=True)
@@ -208,7 +638,7 @@ async def handle_help_command(bot: Bot, event: Event):
             # 只移除第一个匹配的前缀
             args = args[len(prefix):].strip()
             break
-    logger.debug(f"处理搜图帮助命令，参数: '{args}'")
+    logger.debug("处理搜图帮助命令，参数: '%s'", args)
     # 情况1: 无参数 - 显示所有归属
     if not args:
         if not character_data:
@@ -217,7 +647,7 @@ async def handle_help_command(bot: Bot, event: Event):
         franchises = sorted(character_data.keys())
         msg = "📚 当前支持的作品归属:\n\n"
         msg += "• " + "\n• ".join(f"「{f}」" for f in franchises)
-        msg += "\n\n💡 使用方法: /搜图帮助 [归属名] [角色名]"
+        msg += "\n\n💡 使用方法: /搜图帮助 [归属名] [角色名]\n或直接查询: /搜图帮助 [角色名/别名]"
         await bot.send(event, msg)
         return
     # 拆分参数 (最多两部分)
@@ -227,6 +657,10 @@ async def handle_help_command(bot: Bot, event: Event):
         franchise = parts[0]
         # 验证归属是否存在
         if franchise not in character_data:
+            # 按角色名或别名查找
+            if franchise.lower() in alias_index:
+                await bot.send(event, _format_aliases(*alias_index[franchise.lower()]))
+                return
             # 尝试模糊匹配归属
             matches = [f for f in character_data if franchise in f]
             if matches:
@@ -269,10 +703,13 @@ async def handle_help_command(bot: Bot, event: Event):
         await bot.send(event, msg)
         return
     # 获取并展示别名
-    aliases = franchise_data[character].get("别名", [])
+    await bot.send(event, _format_aliases(franchise, character))
+
+def _format_aliases(franchise: str, character: str) -> str:
+    """角色别名列表消息"""
+    aliases = character_data[franchise][character].get("别名", [])
     if not aliases:
-        await bot.send(event, f"ℹ️ 角色「{character}」(归属: {franchise}) 未设置别名")
-        return
+        return f"ℹ️ 角色「{character}」(归属: {franchise}) 未设置别名"
     # 格式化别名列表
     alias_list = []
     for i, alias in enumerate(aliases, 1):
@@ -282,4 +719,27 @@ async def handle_help_command(bot: Bot, event: Event):
     msg += f"所属作品: {franchise}\n\n"
     msg += "\n".join(alias_list)
     msg += "\n\n💡 使用这些别名进行搜图效果更佳"
-    await bot.send(event, msg)
\ No newline at end of file
+    return msg
+
+# 运行状态命令（仅超级用户）
+status_cmd = on_command("搜图状态", aliases={"pstat"}, permission=SUPERUSER, priority=5, block=True)
+@status_cmd.handle()
+async def handle_status_command(bot: Bot, event: Event):
+    """处理 /搜图状态 - 查看插件运行指标"""
+    msg = metrics_utils.format_report()
+    if loop_monitor:
+        msg += "\n\n" + loop_monitor.format_report()
+    await bot.send(event, msg)
+
+# 命令分析模式（仅超级用户）
+profile_cmd = on_command("搜图分析", aliases={"pprof"}, permission=SUPERUSER, priority=5, block=True)
+@profile_cmd.handle()
+async def handle_profile_command(bot: Bot, event: Event):
+    """处理 /搜图分析 [次数] - 对接下来 N 次搜图进行 CPU/内存分析，0 为关闭"""
+    args = event.get_plaintext().split()[1:]
+    count = int(args[0]) if args and args[0].isdigit() else 1
+    profile_utils.arm(count)
+    if count:
+        await bot.send(event, f"🔬 已开启分析模式：接下来 {count} 次搜图将记录 CPU 采样与分阶段内存峰值，报告保存在 data/pixiv_profiles")
+    else:
+        await bot.send(event, "🔬 已关闭分析模式")
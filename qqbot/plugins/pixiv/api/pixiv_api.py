@@ -1,6 +1,5 @@
 import urllib.parse
 import logging
-import aiohttp
 import aiofiles
 import io
 import time
@@ -9,193 +8,559 @@ import os
 import ssl
 import asyncio
 from http import HTTPStatus
+from datetime import datetime, timezone
 from pathlib import Path
-from PIL import Image
 from ..utils.pixiv_utils import (
     _is_r18_request,
-    _is_r18_content,
-    _extract_tag_names,
     _build_search_strategies,
     _execute_search_strategy,
     _select_best_image,
+    _process_search_results,
     _validate_and_build_response,
+    _build_response_from_search,
+    _fetch_illust_detail,
+    _fetch_illust_pages,
+    _fetch_ugoira_meta,
+    _replace_image_domain,
     _cleanup_recent_images,
+    RECENT_IMAGES,
+    RECENT_IMAGES_LOCK,
+    DEDUP_INDEX,
+    ACCOUNT_POOL,
     _find_optimal_size,
     _fine_tune_quality
 )
 from ..config.config import (
-    PROXY,
-    USE_PROXY, 
     MAX_ATTEMPTS,
     MAX_DOWNLOAD_CHUNK, 
-    DOWNLOAD_TIMEOUT
+    DOWNLOAD_TIMEOUT,
+    TAG_NEGATIVE_TTL,
+    TAG_STRATEGY_TTL,
+    PREFETCH_ENABLED,
+    PREFETCH_PAGE_TTL,
+    PREFETCH_IDLE_TTL,
+    DETAIL_FAST_PATH,
+    TEMP_QUOTA_MB,
+    TEMP_MAX_AGE,
+    TEMP_ORPHAN_AGE,
+    RENDITION_CACHE_MB,
+    BATCH_CONCURRENCY,
+    PAGE_MAX_COUNT,
+    UGOIRA_FORMAT,
+    DATA_DIR,
+    DEDUP_ENABLED,
+    DEDUP_WARM_COUNT
     )
-# 基础项目目录
-BASE_DIR = Path(__file__).parent.parent.parent.absolute()
-DATA_DIR = BASE_DIR / "data"
+from ..utils.error_utils import PixivAPIError
+from ..utils.artwork_utils import Artwork
+from ..utils.retry_utils import (
+    RetryBudget,
+    RetryBudgetExceeded,
+    classify,
+    RETRY,
+    NEXT_CANDIDATE,
+    NEXT_ACCOUNT,
+    FATAL
+)
+from ..utils.tag_stats_utils import TagStatsStore
+from ..utils.janitor_utils import DiskJanitor
+from ..utils.rendition_utils import RenditionCache
+from ..utils.prefetch_utils import SearchPrefetcher
+from ..utils.rate_limit_utils import PRIORITY_LOW
+from ..utils.profile_utils import profile_stage
+from ..utils import metrics_utils
+from ..utils.http_utils import upstream_request, KIND_IMAGE
+from ..utils.timeout_utils import DEFAULT_EXPECTED_BYTES
+from ..utils.pool_utils import run_in_process
+from ..utils.ugoira_utils import encode_ugoira
+from ..utils.dedup_utils import dhash_many
 TEMP_DIR = DATA_DIR / "pixiv_temp"  # 专用临时目录
+PROFILE_DIR = DATA_DIR / "pixiv_profiles"  # 命令分析报告目录（按需创建）
+TAG_STATS_FILE = DATA_DIR / "pixiv_tag_stats.json"  # 标签搜索统计
+UGOIRA_DIR = DATA_DIR / "pixiv_ugoira"  # 动图编码结果缓存（按作品ID）
+RENDITION_DIR = DATA_DIR / "pixiv_renditions"  # 超大原图压缩结果缓存（按作品ID/页码）
+# 可发送的单张图片大小上限
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# 已创建的目录（首次写入前创建，导入插件时不访问磁盘）
+_CREATED_DIRS = set()
 
-# 创建目录
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-TEMP_DIR.mkdir(parents=True, exist_ok=True)
+def _ensure_dir(path: Path) -> Path:
+    """确保目录存在（每个目录只创建一次）"""
+    if path not in _CREATED_DIRS:
+        path.mkdir(parents=True, exist_ok=True)
+        _CREATED_DIRS.add(path)
+    return path
 
-# 近期图片缓存排除机制
-RECENT_IMAGES = {}
+# 临时/缓存目录后台清理
+JANITOR = DiskJanitor([TEMP_DIR, UGOIRA_DIR], TEMP_QUOTA_MB * 1024 * 1024, TEMP_MAX_AGE, TEMP_ORPHAN_AGE)
+# 超大原图压缩结果缓存（自行按配额淘汰，不交给后台清理）
+RENDITION_CACHE = RenditionCache(RENDITION_DIR, RENDITION_CACHE_MB * 1024 * 1024)
+# 标签搜索统计（学习策略顺序与空结果页）
+TAG_STATS = TagStatsStore(TAG_STATS_FILE, TAG_NEGATIVE_TTL, TAG_STRATEGY_TTL)
 
 # 创建日志
 logger = logging.getLogger()
-logging.basicConfig(level = logging.INFO,format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 async def search_pixiv_by_tag(tags: list, max_results=10) -> dict:
     """通过角色标签搜索Pixiv图片（智能适应新角色/冷门角色）"""
+    return (await search_pixiv_works(tags, 1))[0]
+
+async def search_pixiv_works(tags: list, count: int) -> list:
+    """通过标签搜索，从同一批搜索结果中选出最多 count 个不同作品（批量模式）"""
+    async def select(candidates, strategy, is_explicit_r18_request, encoded_tag, budget):
+        return await _select_and_validate(
+            candidates, strategy, is_explicit_r18_request, encoded_tag, budget, count
+        )
+    return await _search_with_strategies(tags, select)
+
+async def search_pixiv_thumbnails(tags: list, count: int) -> list:
+    """拼图模式：返回评分最高的 count 个候选作品的缩略图信息（不请求作品详情）"""
+    async def select(candidates, strategy, is_explicit_r18_request, encoded_tag, budget):
+        ranked = _process_search_results(candidates, is_explicit_r18_request, datetime.now(timezone.utc))
+        picked = [item for item in ranked if item.thumb_url][:count]
+        if not picked:
+            raise PixivAPIError(error_type="all_filtered", strategy_name=strategy['name'])
+        return [
+            {
+                "pid": item.pid,
+                "title": item.title,
+                "thumb_url": _replace_image_domain(item.thumb_url),
+            }
+            for item in picked
+        ]
+    return await _search_with_strategies(tags, select)
+
+async def search_pixiv_by_pid(pid: str) -> dict:
+    """按作品ID获取作品（拼图中选定的作品）"""
+    return await _validate_and_build_response(Artwork(pid, strategy="pid"), False, [])
+
+async def _search_with_strategies(tags: list, select):
+    """按策略搜索并过滤候选，select(候选, 策略, 是否R-18请求, 编码标签, 重试预算) 从候选中产出结果"""
     # 1. 预处理标签和搜索模式
     search_tag = " ".join(tags)
-    logger.info(f"搜索标签：{search_tag}")
+    logger.info("搜索标签：%s", search_tag)
     encoded_tag = urllib.parse.quote(search_tag)
     is_explicit_r18_request = _is_r18_request(tags)
     # 2. 清理过期的近期图片ID
     _cleanup_recent_images()
-    # 3. 三阶段策略配置
-    strategies = _build_search_strategies()
-    # 4. 三阶段搜索重试
+    # 3. 三阶段策略配置（按该标签的历史结果调整顺序）
+    strategies = TAG_STATS.order_strategies(search_tag, _build_search_strategies())
+    # 4. 三阶段搜索重试（按错误类型决定重试/换作品/换策略/放弃，总次数与耗时受预算限制）
+    budget = RetryBudget()
+    last_error = None
     for strategy in strategies:
-        for attempt in range(8):  # 每个策略最多尝试8次
+        used_pages = set()
+        while True:
+            # 优先使用预取的候选页，否则跳过该标签已知为空的页
+            cached = PREFETCHER.cached_page(search_tag, strategy['name'], used_pages)
+            page = cached[0] if cached else TAG_STATS.pick_page(search_tag, strategy)
+            if page is None:
+                logger.info("策略[%s]近期均无结果，跳过", strategy['name'])
+                break
+            used_pages.add(page)
             try:
                 # 5. 执行策略搜索
-                results = await _execute_search_strategy(
-                    search_tag, encoded_tag, strategy
-                )
-                # 6. 修复：正确过滤近期图片和R-18内容
-                filtered_results = []
-                for r in results:
-                    # 检查图片ID是否在缓存中（如果缓存为空，跳过ID检查）
-                    if RECENT_IMAGES and 'illust_id' in r:
-                        # 关键修复：将ID转换为整数，而非字符串
-                        try:
-                            image_id = int(r['illust_id'])
-                        except (TypeError, ValueError):
-                            continue  # 无效ID，跳过
-                        if image_id in RECENT_IMAGES:
-                            continue  # 已缓存，跳过
-
-                    # 修复R-18过滤逻辑：非R-18请求时排除R-18内容
-                    if not is_explicit_r18_request and _is_r18_content(_extract_tag_names(r)):
-                        continue  # 非R-18请求时排除R-18内容
-                    filtered_results.append(r)
+                if cached:
+                    results = cached[1]
+                else:
+                    await budget.acquire()
+                    results = await _execute_search_strategy(
+                        search_tag, encoded_tag, strategy, page
+                    )
+                    PREFETCHER.store_page(search_tag, strategy['name'], page, results)
+                TAG_STATS.record_success(search_tag, strategy['name'])
+                if PREFETCH_ENABLED:
+                    PREFETCHER.schedule(
+                        search_tag, encoded_tag, strategy, TAG_STATS.empty_pages(search_tag, strategy['name'])
+                    )
+                # 6. 非R-18请求时排除R-18内容（近期发送过的作品在选择时降低优先级）
+                filtered_results = [
+                    r for r in results if is_explicit_r18_request or not r.is_r18
+                ]
                 # 7. 处理结果
-                if not filtered_results and not is_explicit_r18_request:
-                    # 非R-18请求但全是R-18内容，调整策略参数
-                    logger.info(f"策略[{strategy['name']}]全是R-18内容，调整参数重试")
-                    strategy["params"]["mode"] = "safe"  # 添加安全模式参数
-                    continue  # 重试当前策略
-                # 8. 处理结果并选择作品
-                selected = _select_best_image(filtered_results, is_explicit_r18_request)
-                # 9. 获取作品详情并验证
-                result = await _validate_and_build_response(
-                    selected, is_explicit_r18_request, [encoded_tag]
-                )
-                # 10. 添加新图片ID到缓存
-                if selected and 'illust_id' in selected:
-                    try:
-                        image_id = int(selected['illust_id'])
-                    except (TypeError, ValueError):
-                        # 无效ID，不添加到缓存
-                        continue
-                    RECENT_IMAGES[image_id] = time.time()
-                    # 限制缓存大小
-                    if len(RECENT_IMAGES) > 500:
-                        oldest_id = min(RECENT_IMAGES.items(), key=lambda x: x[1])[0]
-                        del RECENT_IMAGES[oldest_id]
-                return result
+                if not filtered_results:
+                    if not is_explicit_r18_request and strategy["params"].get("mode") != "safe":
+                        # 非R-18请求但全是R-18内容，调整策略参数
+                        logger.info("策略[%s]全是R-18内容，调整参数重试", strategy['name'])
+                        strategy["params"]["mode"] = "safe"  # 添加安全模式参数
+                        continue  # 重试当前策略
+                    raise PixivAPIError(error_type="all_filtered", strategy_name=strategy['name'])
+                # 8. 选择作品并获取详情（作品不可用时换一个候选，不重新搜索）
+                return await select(filtered_results, strategy, is_explicit_r18_request, encoded_tag, budget)
+            except RetryBudgetExceeded as e:
+                logger.warning("策略[%s]放弃: %s", strategy['name'], e)
+                raise Exception(f"搜索失败，{str(e)}: {str(last_error or e)}") from e
             except Exception as e:
-                logger.warning(f"策略[{strategy['name']}]尝试#{attempt+1}失败: {str(e)}")
-                if attempt == 7:
-                    break
-                else:
+                last_error = e
+                action = classify(e)
+                logger.warning("策略[%s]尝试#%d失败(%s): %s", strategy['name'], budget.attempts, action, e)
+                if action == NEXT_ACCOUNT:
+                    if ACCOUNT_POOL.has_healthy():
+                        metrics_utils.incr("retry.next_account")
+                        continue  # 被拒绝的账号已隔离，立即用下一个正常账号重试当前策略
+                    raise Exception(f"Pixiv 拒绝访问，Cookie 可能已失效: {str(e)}") from e
+                if action == FATAL:
+                    raise
+                if action == RETRY:
+                    await budget.backoff()
                     continue
+                if isinstance(e, PixivAPIError) and e.error_type == "empty_data":
+                    TAG_STATS.record_empty(search_tag, strategy['name'], e.details.get("page"))
+                    if "page_range" in strategy:
+                        continue  # 换该策略的其他页
+                break  # 换下一个策略
     raise Exception("所有搜索策略均失败或搜索均命中限制级内容请重试")
 
+async def _prefetch_page(search_tag: str, encoded_tag: str, strategy: dict, page: int) -> list:
+    """后台预取一页搜索结果（低优先级），空页记入标签统计"""
+    try:
+        return await _execute_search_strategy(
+            search_tag, encoded_tag, strategy, page, priority=PRIORITY_LOW
+        )
+    except PixivAPIError as e:
+        if e.error_type != "empty_data":
+            raise
+        TAG_STATS.record_empty(search_tag, strategy['name'], page)
+        return []
+
+# 搜索页预取
+PREFETCHER = SearchPrefetcher(_prefetch_page, PREFETCH_PAGE_TTL, PREFETCH_IDLE_TTL)
+
+async def _select_and_validate(
+    candidates: list,
+    strategy: dict,
+    is_explicit_r18_request: bool,
+    encoded_tag: str,
+    budget: RetryBudget,
+    count: int = 1
+) -> list:
+    """从候选中选出 count 个不同作品并并发获取详情（受 BATCH_CONCURRENCY 限制），
+    作品被拒绝（R-18/已删除）时换下一个候选"""
+    candidates = list(candidates)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    results = []
+    while candidates and len(results) < count:
+        selected = []
+        for _ in range(min(count - len(results), len(candidates))):
+            item = _select_best_image(candidates, is_explicit_r18_request)
+            selected.append(item)
+            candidates = [c for c in candidates if c is not item]
+        outcomes = await asyncio.gather(*(
+            _build_candidate(item, is_explicit_r18_request, encoded_tag, budget, semaphore)
+            for item in selected
+        ), return_exceptions=True)
+        for item, outcome in zip(selected, outcomes):
+            if not isinstance(outcome, BaseException):
+                _remember_image(item)
+                results.append(outcome)
+                continue
+            action = classify(outcome) if isinstance(outcome, PixivAPIError) else FATAL
+            if action == NEXT_CANDIDATE:
+                logger.info("作品[%s]不可用，更换候选: %s", item.pid, outcome)
+                continue
+            if action == NEXT_ACCOUNT and ACCOUNT_POOL.has_healthy():
+                logger.info("作品[%s]请求被拒绝，换账号重试: %s", item.pid, outcome)
+                metrics_utils.incr("retry.next_account")
+                candidates.append(item)
+                continue
+            if not results:
+                raise outcome
+            # 已有可用作品时不再重试，直接返回
+            logger.warning("作品[%s]获取失败，跳过: %s", item.pid, outcome)
+            candidates = []
+    if not results:
+        raise PixivAPIError(error_type="all_filtered", strategy_name=strategy['name'])
+    _warm_candidate_hashes(candidates)
+    return results
+
+async def _build_candidate(
+    selected: dict,
+    is_explicit_r18_request: bool,
+    encoded_tag: str,
+    budget: RetryBudget,
+    semaphore: asyncio.Semaphore
+) -> dict:
+    """构建单个候选作品的结果"""
+    # 快速路径：由搜索结果推测原图地址，信息不足时才请求作品详情
+    result = _build_response_from_search(selected, is_explicit_r18_request) if DETAIL_FAST_PATH else None
+    if result is None:
+        async with semaphore:
+            await budget.acquire()
+            result = await _validate_and_build_response(
+                selected, is_explicit_r18_request, [encoded_tag]
+            )
+    return result
+
+# 后台哈希任务（不在命令的关键路径上等待）/ 正在后台下载缩略图的作品ID（避免重复下载）
+_HASH_TASKS = set()
+_HASHING = set()
+
+def _run_hash_task(coro) -> None:
+    task = asyncio.create_task(coro)
+    _HASH_TASKS.add(task)
+    task.add_done_callback(_HASH_TASKS.discard)
+
+async def cancel_hash_tasks() -> None:
+    """关闭时取消后台哈希任务（需在关闭 HTTP 会话之前调用）"""
+    tasks = list(_HASH_TASKS)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def record_sent_hash(pid: str, image_data: bytes) -> None:
+    """用已发送的图片数据（预览图或原图）在后台计算差值哈希，作为近似重复比较的基准"""
+    if DEDUP_ENABLED and image_data and DEDUP_INDEX.get(pid) is None:
+        _run_hash_task(_hash_images([(pid, image_data)]))
+
+def _warm_candidate_hashes(candidates: list) -> None:
+    """后台下载排名靠前、尚无哈希的候选缩略图并计算哈希，供之后的选择直接跳过近似重复作品"""
+    if not DEDUP_ENABLED or DEDUP_WARM_COUNT <= 0:
+        return
+    pending = [
+        item for item in candidates[:30]
+        if item.thumb_url and DEDUP_INDEX.get(item.pid) is None and item.pid not in _HASHING
+    ][:DEDUP_WARM_COUNT]
+    if pending:
+        _HASHING.update(item.pid for item in pending)
+        _run_hash_task(_hash_thumbnails(pending))
+
+async def _hash_thumbnails(items: list) -> None:
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def _fetch(item):
+        async with semaphore:
+            try:
+                return item.pid, await download_and_process_preview(_replace_image_domain(item.thumb_url))
+            except Exception as e:
+                logger.debug("作品[%s]缩略图下载失败: %s", item.pid, e)
+                return item.pid, None
+
+    try:
+        thumbs = await asyncio.gather(*(_fetch(item) for item in items))
+        await _hash_images([(pid, data) for pid, data in thumbs if data])
+    finally:
+        _HASHING.difference_update(item.pid for item in items)
+
+async def _hash_images(images: list) -> None:
+    """在进程池中计算 [(作品ID, 图片数据)] 的差值哈希并记入去重索引"""
+    if not images:
+        return
+    try:
+        hashes = await run_in_process(dhash_many, [data for _, data in images])
+    except Exception as e:
+        logger.info("差值哈希计算失败: %s", e)
+        return
+    for (pid, _), value in zip(images, hashes):
+        if value is not None:
+            DEDUP_INDEX.add(pid, value)
+    metrics_utils.incr("dedup.hashed", len(images))
+
+async def record_thumbnail_hashes(works: list, thumbs: list) -> None:
+    """拼图已下载的缩略图顺带计算差值哈希（之后选择这些作品时可直接判断是否重复）"""
+    if DEDUP_ENABLED:
+        await _hash_images([
+            (work["pid"], data) for work, data in zip(works, thumbs)
+            if data and DEDUP_INDEX.get(work["pid"]) is None
+        ])
+
+def _remember_image(selected: Artwork) -> None:
+    """添加新图片ID到缓存（_select_best_image 优先选择不在缓存中的作品）"""
+    with RECENT_IMAGES_LOCK:
+        RECENT_IMAGES[selected.pid] = time.time()
+        DEDUP_INDEX.remember(selected.pid)
+        # 限制缓存大小
+        if len(RECENT_IMAGES) > 500:
+            oldest_id = min(RECENT_IMAGES.items(), key=lambda x: x[1])[0]
+            del RECENT_IMAGES[oldest_id]
+
 async def get_remote_file_size(url: str) -> int:
     """获取远程文件大小，避免下载大文件"""
     try:
-        proxy = PROXY if USE_PROXY else None
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             "Referer": "https://www.pixiv.net/"
         }
-        async with aiohttp.ClientSession() as session:
-            async with session.head(
-                url, headers=headers, proxy=proxy, timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                if response.status in (200, 206):
-                    content_range = response.headers.get('Content-Range', '')
-                    if content_range:
-                        # 从Content-Range中提取文件大小：bytes 0-0/12345678
-                        return int(content_range.split('/')[-1])
-                    content_length = response.headers.get('Content-Length')
-                    if content_length:
-                        return int(content_length)
-                    else:
-                        # 尝试GET请求前1KB
-                        headers['Range'] = 'bytes=0-1023'
-                        async with session.get(
-                            url, headers=headers, proxy=proxy, timeout=aiohttp.ClientTimeout(total=10)
-                        ) as response:
-                            if response.status in (200, 206):
-                                content_length = response.headers.get('Content-Length')
-                                if content_length:
-                                    # 估算完整文件大小（1024字节是头部，总大小通常大于头部）
-                                    estimated_size = int(content_length)
-                                    return estimated_size * 10  # 粗略估计
+        async with upstream_request(
+            "HEAD", url, kind=KIND_IMAGE, request_class="size", headers=headers, timeout=10,
+            allow_redirects=False
+        ) as response:
+            if response.status in (200, 206):
+                content_range = response.headers.get('Content-Range', '')
+                if content_range:
+                    # 从Content-Range中提取文件大小：bytes 0-0/12345678
+                    return int(content_range.split('/')[-1])
+                content_length = response.headers.get('Content-Length')
+                if content_length:
+                    return int(content_length)
+            else:
                 return 0
+        # 尝试GET请求前1KB
+        headers['Range'] = 'bytes=0-1023'
+        async with upstream_request(
+            "GET", url, kind=KIND_IMAGE, request_class="size", headers=headers, timeout=10
+        ) as response:
+            if response.status in (200, 206):
+                content_length = response.headers.get('Content-Length')
+                if content_length:
+                    # 估算完整文件大小（1024字节是头部，总大小通常大于头部）
+                    estimated_size = int(content_length)
+                    return estimated_size * 10  # 粗略估计
+        return 0
     except Exception as e:
-        logger.warning(f"获取文件大小失败: {str(e)}")
+        logger.warning("获取文件大小失败: %s", e)
         return 0
 
 async def compress_image(file_path: Path, max_size: int = 10 * 1024 * 1024) -> Path:
-    """智能压缩图片，最大化利用10MB上限保持质量（已修复EXIF问题）"""
+    """智能压缩图片，最大化利用10MB上限保持质量（已修复EXIF问题）
+    解码/缩放/多次编码在线程中执行（Pillow 处理图像时释放 GIL），压缩期间事件循环不被阻塞"""
     try:
         original_size = file_path.stat().st_size
         if original_size <= max_size:
             return file_path
-        logger.warning(f"⚠️ 图片过大 ({original_size/1024/1024:.2f}MB)，开始智能压缩...")
+        logger.warning("⚠️ 图片过大 (%.2fMB)，开始智能压缩...", original_size/1024/1024)
+        return await asyncio.to_thread(_compress_image_sync, file_path, max_size, original_size)
+    except Exception as e:
+        logger.error("图片压缩失败: %s", e, exc_info=True)
+        return None
+
+def _verify_image_sync(file_path: Path) -> Path:
+    """用 Pillow 验证下载的图片，无效时尝试修正扩展名，返回最终路径"""
+    try:
+        from PIL import Image
         with Image.open(file_path) as img:
-            # 🔥 关键修复1：强制移除EXIF数据（避免过长问题）
-            if 'exif' in img.info:
-                del img.info['exif']
-            # 1. 预处理：转换为RGB
+            img.verify()  # 验证是否为有效的图片格式
+    except Exception as e:
+        logger.warning("图片验证失败，尝试修复: %s", e)
+        # 尝试修复：重命名扩展名
+        if not str(file_path).lower().endswith(('.jpg', '.jpeg', '.png')):
+            new_path = file_path.with_suffix('.jpg')
+            file_path.rename(new_path)
+            file_path = new_path
+    return file_path
+
+def _prepare_original_sync(file_path: Path, max_size: int) -> tuple:
+    """验证下载的原图，超过 max_size 时压缩（在线程中执行）
+
+    返回 (原图路径, 可发送的路径)：未超限时两者相同，压缩失败时后者为 None
+    """
+    file_path = _verify_image_sync(file_path)
+    original_size = file_path.stat().st_size
+    if original_size <= max_size:
+        return file_path, file_path
+    try:
+        return file_path, _compress_image_sync(file_path, max_size, original_size)
+    except Exception as e:
+        logger.error("图片压缩失败: %s", e, exc_info=True)
+        return file_path, None
+
+def _compress_image_sync(file_path: Path, max_size: int, original_size: int) -> Path:
+    """compress_image 的同步部分：尺寸搜索 + 质量微调，写出 *_compressed.jpg，未达目标返回 None"""
+    from PIL import Image
+    with Image.open(file_path) as img:
+        # 🔥 关键修复1：强制移除EXIF数据（避免过长问题）
+        if 'exif' in img.info:
+            del img.info['exif']
+        # 1. 预处理：转换为RGB
+        with profile_stage("decode"):
+            img.load()
             if img.mode in ('RGBA', 'LA', 'P'):
                 background = Image.new('RGB', img.size, (255, 255, 255))
                 background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
                 img = background
-            orig_width, orig_height = img.size
-            target_size_range = (max_size * 0.95, max_size * 0.98)  # 更宽松的目标范围
-            # 2. 阶段1: 尺寸优化
-            optimal_img = await _find_optimal_size(img, orig_width, orig_height, target_size_range)
-            # 3. 阶段2: 质量微调（关键优化）
-            result = await _fine_tune_quality(optimal_img, target_size_range)
-            if result:
-                compressed_img, best_quality, compressed_size = result
-                new_file_path = file_path.with_name(f"{file_path.stem}_compressed.jpg")
-                # 🔥 关键修复2：保存时不再传递exif（已移除EXIF）
-                with open(new_file_path, 'wb') as f:
-                    compressed_img.seek(0)
-                    f.write(compressed_img.getvalue())
-                logger.info(
-                    f"✅ 压缩成功: {original_size/1024/1024:.2f}MB → "
-                    f"{compressed_size/1024/1024:.2f}MB "
-                    f"(质量: {best_quality}%, 尺寸: {optimal_img.size[0]}x{optimal_img.size[1]})"
-                )
-                return new_file_path
-            logger.warning("⚠️ 智能压缩未达目标，使用预览图替代")
-            return None
-    except Exception as e:
-        logger.error(f"图片压缩失败: {str(e)}", exc_info=True)
+        orig_width, orig_height = img.size
+        target_size_range = (max_size * 0.95, max_size * 0.98)  # 更宽松的目标范围
+        # 2. 阶段1: 尺寸优化
+        with profile_stage("resize"):
+            optimal_img = _find_optimal_size(img, orig_width, orig_height, target_size_range)
+        # 3. 阶段2: 质量微调（关键优化）
+        with profile_stage("encode"):
+            result = _fine_tune_quality(optimal_img, target_size_range)
+        if result:
+            compressed_img, best_quality, compressed_size = result
+            new_file_path = file_path.with_name(f"{file_path.stem}_compressed.jpg")
+            # 🔥 关键修复2：保存时不再传递exif（已移除EXIF）
+            with open(new_file_path, 'wb') as f:
+                compressed_img.seek(0)
+                f.write(compressed_img.getvalue())
+            logger.info(
+                "✅ 压缩成功: %.2fMB → %.2fMB (质量: %d%%, 尺寸: %dx%d)",
+                original_size/1024/1024, compressed_size/1024/1024,
+                best_quality, optimal_img.size[0], optimal_img.size[1]
+            )
+            return new_file_path
+        logger.warning("⚠️ 智能压缩未达目标，使用预览图替代")
         return None
 
-async def download_original_image(url: str) -> Path:
-    """安全下载大文件到临时位置，返回文件路径（确保不超过10MB）"""
-    file_size = await get_remote_file_size(url)
+async def _probe_image(url: str):
+    """HEAD 探测图片地址，返回 (状态码, 文件大小)"""
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Referer": "https://www.pixiv.net/"
+    }
+    async with upstream_request(
+        "HEAD", url, kind=KIND_IMAGE, request_class="size", headers=headers, timeout=10,
+        allow_redirects=False
+    ) as response:
+        return response.status, int(response.headers.get('Content-Length') or 0)
+
+async def resolve_original_url(result: dict) -> int:
+    """确认快速路径推测的原图地址：依次探测 jpg/png，均不存在时请求作品详情。
+    原地更新 result 中的地址，返回探测到的文件大小（未知为 0）"""
+    if not result.pop("url_guessed", False):
+        return 0
+    original = result["original_url"]
+    stem = original.rsplit(".", 1)[0]
+    try:
+        for candidate in (f"{stem}.jpg", f"{stem}.png"):
+            status, size = await _probe_image(_replace_image_domain(candidate))
+            if status == HTTPStatus.OK:
+                if candidate != original:
+                    metrics_utils.incr("fast_path.extension_png")
+                    result["original_url"] = candidate
+                    result["image_url"] = _replace_image_domain(candidate)
+                return size
+            if status != HTTPStatus.NOT_FOUND:
+                return 0  # 非地址问题（代理异常等），交给下载流程处理
+    except Exception as e:
+        logger.warning("原图地址探测失败: %s", e)
+        return 0
+    # 推测失败，回退到作品详情接口
+    metrics_utils.incr("fast_path.detail_fallback")
+    logger.info("作品[%s]原图地址推测失败，请求作品详情", result['pid'])
+    body = await _fetch_illust_detail(result["pid"], [])
+    result["original_url"] = body["urls"]["original"]
+    result["image_url"] = _replace_image_domain(body["urls"]["original"])
+    result["preview_url"] = _replace_image_domain(body["urls"]["regular"])
+    return 0
+
+async def resolve_page_urls(result: dict) -> list:
+    """多页作品：获取各页的原图/预览图地址（最多 PAGE_MAX_COUNT 页）"""
+    pages = await _fetch_illust_pages(result["pid"])
+    return [
+        {
+            "pid": f"{result['pid']}_p{index}",
+            "illust_id": result["pid"],
+            "page": index,
+            "image_url": _replace_image_domain(urls["original"]),
+            "preview_url": _replace_image_domain(urls["regular"]),
+        }
+        for index, urls in enumerate(pages[:PAGE_MAX_COUNT])
+    ]
+
+def rendition_key(result: dict) -> tuple:
+    """作品（或多页作品的某一页）原图压缩结果的缓存键：(作品ID, 页码, 字节上限, 格式)"""
+    return (result.get("illust_id", result["pid"]), result.get("page", 0), MAX_IMAGE_BYTES, "jpg")
+
+async def get_cached_rendition(result: dict):
+    """取缓存的原图压缩结果，未命中返回 None"""
+    return await RENDITION_CACHE.get(rendition_key(result))
+
+async def download_original_image(url: str, file_size: int = 0, cache_key: tuple = None) -> Path:
+    """安全下载大文件到临时位置，返回文件路径（确保不超过10MB）
+    cache_key: 需要压缩时按该键缓存压缩结果（见 rendition_key）"""
+    if not file_size:
+        file_size = await get_remote_file_size(url)
     # 生成唯一文件名
     timestamp = int(time.time() * 1000)
     random_str = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=8))
@@ -208,9 +573,10 @@ async def download_original_image(url: str) -> Path:
     elif ext == '.svg':
         ext = '.png'
     filename = f"pixiv_{timestamp}_{random_str}{ext}"
-    temp_path = TEMP_DIR / filename
-    logger.info(f"开始下载原图到: {temp_path} (预估大小: {file_size/1024/1024:.2f}MB)")
-    proxy = PROXY if USE_PROXY else None
+    temp_path = _ensure_dir(TEMP_DIR) / filename
+    # 下载中先写入 .part 文件，完成后再改名（中断残留由后台清理任务删除）
+    part_path = temp_path.with_name(f"{filename}.part")
+    logger.info("开始下载原图到: %s (预估大小: %.2fMB)", temp_path, file_size/1024/1024)
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
         "Referer": "https://www.pixiv.net/"
@@ -222,10 +588,10 @@ async def download_original_image(url: str) -> Path:
     # 重试机制
     for attempt in range(MAX_ATTEMPTS):
         try:
-            async with aiohttp.ClientSession() as session, \
-                session.get(
-                    url, headers=headers, proxy=proxy,
-                    timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT),
+            async with upstream_request(
+                    "GET", url, kind=KIND_IMAGE, request_class="original", headers=headers,
+                    timeout=DOWNLOAD_TIMEOUT,
+                    expected_size=file_size or DEFAULT_EXPECTED_BYTES,
                     ssl=ssl_context
                 ) as response:
                     if response.status != HTTPStatus.OK:
@@ -234,76 +600,135 @@ async def download_original_image(url: str) -> Path:
                     # 分块写入文件，避免内存溢出
                     total_bytes = 0
                     start_time = time.time()
-                    async with aiofiles.open(temp_path, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(MAX_DOWNLOAD_CHUNK):
-                            await f.write(chunk)
-                            total_bytes += len(chunk)
+                    with profile_stage("download"):
+                        async with aiofiles.open(part_path, 'wb') as f:
+                            async for chunk in response.content.iter_chunked(MAX_DOWNLOAD_CHUNK):
+                                await f.write(chunk)
+                                total_bytes += len(chunk)
                     # 验证文件完整性
-                    downloaded_size = temp_path.stat().st_size
+                    downloaded_size = total_bytes
                     if file_size > 0 and downloaded_size < file_size * 0.9:
                         raise Exception(f"文件不完整: 期望 {file_size} 字节, 实际 {downloaded_size} 字节")
-                    # 使用Pillow验证图片
-                    try:
-                        with Image.open(temp_path) as img:
-                            img.verify()  # 验证是否为有效的图片格式
-                    except Exception as e:
-                        logger.warning(f"图片验证失败，尝试修复: {str(e)}")
-                        # 尝试修复：重命名扩展名
-                        if not str(temp_path).lower().endswith(('.jpg', '.jpeg', '.png')):
-                            new_path = temp_path.with_suffix('.jpg')
-                            temp_path.rename(new_path)
-                            temp_path = new_path
-                    # 检查文件大小并压缩（如果需要）
-                    if downloaded_size > 10 * 1024 * 1024:  # 超过10MB
-                        logger.warning(f"⚠️ 图片过大 ({downloaded_size/1024/1024:.1f}MB)，尝试压缩...")
-                        compressed_path = await compress_image(temp_path)
-                        if compressed_path:
-                            temp_path = compressed_path
-                            logger.info(f"✅ 图片已压缩至 {temp_path.stat().st_size/1024/1024:.2f}MB")
-                        else:
-                            logger.warning("⚠️ 图片压缩失败，将使用预览图")
-                            return None  # 返回None表示需要使用预览图
-                    logger.info(f"✅ 原图下载成功: {downloaded_size/1024/1024:.2f}MB, 耗时: {time.time()-start_time:.1f}s")
+                    part_path.replace(temp_path)
+                    # 验证图片并在超过10MB时压缩（解码/编码在同一次线程调用中执行，不阻塞事件循环）
+                    if downloaded_size > MAX_IMAGE_BYTES:
+                        logger.warning("⚠️ 图片过大 (%.1fMB)，尝试压缩...", downloaded_size/1024/1024)
+                    temp_path, compressed_path = await asyncio.to_thread(
+                        _prepare_original_sync, temp_path, MAX_IMAGE_BYTES
+                    )
+                    if not compressed_path:
+                        logger.warning("⚠️ 图片压缩失败，将使用预览图")
+                        return None  # 返回None表示需要使用预览图
+                    if compressed_path != temp_path:
+                        # 删除压缩前的原文件
+                        await asyncio.to_thread(temp_path.unlink, True)
+                        temp_path = compressed_path
+                        if cache_key is not None:
+                            await RENDITION_CACHE.put_file(cache_key, temp_path)
+                        logger.info("✅ 图片已压缩至 %.2fMB", temp_path.stat().st_size/1024/1024)
+                    logger.info("✅ 原图下载成功: %.2fMB, 耗时: %.1fs", downloaded_size/1024/1024, time.time()-start_time)
                     return temp_path
+        except asyncio.CancelledError:
+            # 下载被取消（例如已先发送预览图），删除未完成的文件
+            part_path.unlink(missing_ok=True)
+            raise
         except Exception as e:
-            logger.error(f"下载尝试 {attempt+1}/{MAX_ATTEMPTS} 失败: {str(e)}")
+            await asyncio.to_thread(part_path.unlink, True)
+            logger.error("下载尝试 %d/%d 失败: %s", attempt+1, MAX_ATTEMPTS, e)
             if attempt == MAX_ATTEMPTS - 1:
                 raise
             await asyncio.sleep(2)
     # 如果没有返回，返回临时路径
     return temp_path
 
-async def cleanup_temp_files():
-    """清理6小时以上的临时文件"""
+# 正在编码的动图（同一作品并发请求时共享一次编码）
+_UGOIRA_INFLIGHT = {}
+
+async def get_ugoira_animation(result: dict) -> bytes:
+    """动图：下载帧压缩包并在进程池中编码为 GIF/WebP（10MB 以内），编码结果按作品ID缓存"""
+    pid = result["pid"]
+    cache_path = UGOIRA_DIR / f"{pid}.{UGOIRA_FORMAT.lower()}"
+    if cache_path.exists():
+        metrics_utils.incr("ugoira.cache_hit")
+        async with aiofiles.open(cache_path, 'rb') as f:
+            return await f.read()
+    task = _UGOIRA_INFLIGHT.get(pid)
+    if task is None:
+        task = asyncio.create_task(_encode_ugoira(pid, cache_path))
+        _UGOIRA_INFLIGHT[pid] = task
+
+        def _done(t):
+            _UGOIRA_INFLIGHT.pop(pid, None)
+            if not t.cancelled():
+                t.exception()  # 避免无人等待时的未取回异常警告
+
+        task.add_done_callback(_done)
+    else:
+        metrics_utils.incr("ugoira.shared")
+    # 请求被取消时不影响其他请求共享的编码任务
+    return await asyncio.shield(task)
+
+async def _encode_ugoira(pid: str, cache_path: Path) -> bytes:
+    meta = await _fetch_ugoira_meta(pid)
+    zip_path = await _download_ugoira_zip(_replace_image_domain(meta["src"]), pid)
     try:
-        now = time.time()
-        for file_path in TEMP_DIR.glob("*"):
-            if file_path.is_file():
-                file_age = now - file_path.stat().st_mtime
-                if file_age > 6 * 3600:  # 6小时
-                    try:
-                        file_path.unlink()
-                        logger.debug(f"清理旧临时文件: {file_path.name}")
-                    except Exception as e:
-                        logger.warning(f"清理文件失败 {file_path.name}: {str(e)}")
-    except Exception as e:
-        logger.warning(f"清理临时文件时出错: {str(e)}")
+        start_time = time.time()
+        with profile_stage("encode"):
+            data = await run_in_process(
+                encode_ugoira, str(zip_path), meta["frames"], 10 * 1024 * 1024, UGOIRA_FORMAT
+            )
+        metrics_utils.incr("ugoira.encoded")
+        logger.info(
+            "✅ 动图[%s]编码完成: %d 帧, %.2fMB, 耗时: %.1fs",
+            pid, len(meta["frames"]), len(data)/1024/1024, time.time()-start_time
+        )
+    finally:
+        await asyncio.to_thread(zip_path.unlink, True)
+    _ensure_dir(cache_path.parent)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.part")
+    async with aiofiles.open(tmp_path, 'wb') as f:
+        await f.write(data)
+    tmp_path.replace(cache_path)
+    return data
+
+async def _download_ugoira_zip(url: str, pid: str) -> Path:
+    """流式下载动图帧压缩包到临时目录"""
+    zip_path = _ensure_dir(TEMP_DIR) / f"ugoira_{pid}_{int(time.time() * 1000)}.zip"
+    part_path = zip_path.with_name(f"{zip_path.name}.part")
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Referer": "https://www.pixiv.net/"
+    }
+    try:
+        async with upstream_request(
+            "GET", url, kind=KIND_IMAGE, request_class="ugoira", headers=headers,
+            timeout=DOWNLOAD_TIMEOUT, expected_size=DEFAULT_EXPECTED_BYTES
+        ) as response:
+            if response.status != HTTPStatus.OK:
+                raise Exception(f"动图压缩包下载失败，状态码: {response.status}")
+            with profile_stage("download"):
+                async with aiofiles.open(part_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(MAX_DOWNLOAD_CHUNK):
+                        await f.write(chunk)
+        part_path.replace(zip_path)
+        return zip_path
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
 
 async def download_and_process_preview(image_url: str) -> bytes:
     """下载并处理预览图（小尺寸）"""
     try:
-        proxy = PROXY if USE_PROXY else None
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             "Referer": "https://www.pixiv.net/"
         }
-        async with aiohttp.ClientSession() as session,\
-            session.get(
-                image_url, headers=headers, proxy=proxy, timeout=aiohttp.ClientTimeout(total=15)
+        async with upstream_request(
+                "GET", image_url, kind=KIND_IMAGE, request_class="preview", headers=headers, timeout=15
             ) as response:
                 if response.status != 200:
                     raise Exception(f"预览图下载失败，状态码: {response.status}")
                 return await response.read()
     except Exception as e:
-        logger.error(f"预览图处理失败: {str(e)}")
+        logger.error("预览图处理失败: %s", e)
         raise Exception(f"预览图处理失败: {str(e)}")
\ No newline at end of file
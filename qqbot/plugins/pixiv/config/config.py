@@ -1,19 +1,129 @@
 import configparser
+import os
 from pathlib import Path
 
 config_dir = Path(__file__).parent.parent
-config_path = config_dir / 'config.conf'
+# 允许通过环境变量指定配置文件（离线基准测试等场景）
+config_path = Path(os.environ.get('PIXIV_PLUGIN_CONFIG', config_dir / 'config.conf'))
 
 config = configparser.ConfigParser()
 config.read(config_path)
 
 # 读取配置项
+# 数据目录（临时文件、缓存与统计），环境变量优先（离线基准测试时指向临时目录）
+DATA_DIR = Path(
+    os.environ.get('PIXIV_PLUGIN_DATA_DIR')
+    or config.get('DEFAULT', 'DATA_DIR', fallback='')
+    or config_dir.parent / 'data'
+)
 USE_PROXY = config.getboolean('DEFAULT', 'USE_PROXY', fallback=True)
 PROXY = config.get('DEFAULT', 'PROXY', fallback='http://127.0.0.1:7890')
 PROXY_URL = config.get('DEFAULT', 'PROXY_URL', fallback='https://quiet-hill-31f3.math89423.workers.dev/')
+PIXIV_API_BASE = config.get('DEFAULT', 'PIXIV_API_BASE', fallback='https://www.pixiv.net').rstrip('/')
 PIXIV_COOKIE = config.get('DEFAULT', 'PIXIV_COOKIE', fallback='PHPSESSID=14916444_EuNtNE3Yd2ZZ50A7UzivUlxP7O2hLP7s; device_token=ccd49454e972c3b547f1db56a3560575; p_ab_id=1; p_ab_id_2=1')
 EXCLUDE_DURATION = config.getint('DEFAULT', 'EXCLUDE_DURATION', fallback=3600)
 COOLDOWN_TIME = config.getint('DEFAULT', 'COOLDOWN_TIME', fallback=25)
 MAX_DOWNLOAD_CHUNK = config.getint('DEFAULT', 'MAX_DOWNLOAD_CHUNK', fallback=1024 * 64)
 DOWNLOAD_TIMEOUT = config.getint('DEFAULT', 'DOWNLOAD_TIMEOUT', fallback=60)
 MAX_ATTEMPTS = config.getint('DEFAULT', 'MAX_ATTEMPTS', fallback=2)
+# 事件循环阻塞检测（默认关闭）
+LOOP_MONITOR_ENABLED = config.getboolean('DEFAULT', 'LOOP_MONITOR_ENABLED', fallback=False)
+LOOP_MONITOR_INTERVAL = config.getfloat('DEFAULT', 'LOOP_MONITOR_INTERVAL', fallback=0.5)
+LOOP_LAG_THRESHOLD = config.getfloat('DEFAULT', 'LOOP_LAG_THRESHOLD', fallback=0.2)
+# 日志队列长度（后台线程写出，队列满时丢弃）/ 同一位置的重复警告每个窗口最多输出条数 / 窗口长度（秒）
+LOG_QUEUE_SIZE = config.getint('DEFAULT', 'LOG_QUEUE_SIZE', fallback=10000)
+LOG_REPEAT_LIMIT = config.getint('DEFAULT', 'LOG_REPEAT_LIMIT', fallback=5)
+LOG_REPEAT_WINDOW = config.getfloat('DEFAULT', 'LOG_REPEAT_WINDOW', fallback=60)
+# 命令分析模式 CPU 采样间隔（秒）
+PROFILE_SAMPLE_INTERVAL = config.getfloat('DEFAULT', 'PROFILE_SAMPLE_INTERVAL', fallback=0.005)
+# 上游线路与熔断（线路按顺序故障切换：direct 直连 / local_proxy 本地代理 / worker 图片代理）
+# API 线路只支持 local_proxy / direct（worker 只代理图片）
+API_ROUTES = [r.strip() for r in config.get('DEFAULT', 'API_ROUTES', fallback='local_proxy,direct').split(',') if r.strip()]
+IMAGE_ROUTES = [r.strip() for r in config.get('DEFAULT', 'IMAGE_ROUTES', fallback='worker,local_proxy,direct').split(',') if r.strip()]
+ROUTE_CONNECT_TIMEOUT = config.getfloat('DEFAULT', 'ROUTE_CONNECT_TIMEOUT', fallback=5)
+BREAKER_FAILURE_THRESHOLD = config.getint('DEFAULT', 'BREAKER_FAILURE_THRESHOLD', fallback=3)
+BREAKER_RESET_TIMEOUT = config.getfloat('DEFAULT', 'BREAKER_RESET_TIMEOUT', fallback=30)
+BREAKER_PROBE_INTERVAL = config.getfloat('DEFAULT', 'BREAKER_PROBE_INTERVAL', fallback=10)
+# 图片代理端点池（逗号分隔，未配置时仅使用 PROXY_URL）
+IMAGE_PROXY_ENDPOINTS = [u.strip() for u in config.get('DEFAULT', 'IMAGE_PROXY_ENDPOINTS', fallback='').split(',') if u.strip()]
+IMAGE_PROXY_DAILY_QUOTA = config.getint('DEFAULT', 'IMAGE_PROXY_DAILY_QUOTA', fallback=100000)
+HEDGE_DELAY = config.getfloat('DEFAULT', 'HEDGE_DELAY', fallback=2.0)
+HEDGE_MIN_DELAY = config.getfloat('DEFAULT', 'HEDGE_MIN_DELAY', fallback=0.3)
+# 自适应超时（按各线路历史首字节延迟分位数 × 倍数，样本不足时使用各接口默认超时）
+TIMEOUT_PERCENTILE = config.getfloat('DEFAULT', 'TIMEOUT_PERCENTILE', fallback=99)
+TIMEOUT_MULTIPLIER = config.getfloat('DEFAULT', 'TIMEOUT_MULTIPLIER', fallback=3.0)
+TIMEOUT_MIN = config.getfloat('DEFAULT', 'TIMEOUT_MIN', fallback=2.0)
+TIMEOUT_MIN_SAMPLES = config.getint('DEFAULT', 'TIMEOUT_MIN_SAMPLES', fallback=20)
+TIMEOUT_MIN_THROUGHPUT = config.getint('DEFAULT', 'TIMEOUT_MIN_THROUGHPUT', fallback=64 * 1024)
+# 搜索重试预算（每条命令）与退避
+RETRY_MAX_ATTEMPTS = config.getint('DEFAULT', 'RETRY_MAX_ATTEMPTS', fallback=8)
+RETRY_TIME_BUDGET = config.getfloat('DEFAULT', 'RETRY_TIME_BUDGET', fallback=60)
+RETRY_BASE_DELAY = config.getfloat('DEFAULT', 'RETRY_BASE_DELAY', fallback=0.5)
+RETRY_MAX_DELAY = config.getfloat('DEFAULT', 'RETRY_MAX_DELAY', fallback=8)
+RATE_LIMIT_BACKOFF = config.getfloat('DEFAULT', 'RATE_LIMIT_BACKOFF', fallback=30)
+# 标签搜索统计（空结果页缓存时间 / 成功策略记忆时间，秒）
+TAG_NEGATIVE_TTL = config.getfloat('DEFAULT', 'TAG_NEGATIVE_TTL', fallback=6 * 3600)
+TAG_STRATEGY_TTL = config.getfloat('DEFAULT', 'TAG_STRATEGY_TTL', fallback=7 * 86400)
+TAG_STATS_FLUSH_INTERVAL = config.getfloat('DEFAULT', 'TAG_STATS_FLUSH_INTERVAL', fallback=60)
+# Pixiv API 全局出站限速（令牌桶，每秒请求数 / 突发数，0 为不限速）
+OUTBOUND_RATE = config.getfloat('DEFAULT', 'OUTBOUND_RATE', fallback=2)
+OUTBOUND_BURST = config.getint('DEFAULT', 'OUTBOUND_BURST', fallback=6)
+# 搜索页后台预取（候选页有效期 / 标签多久未被请求后停止预取，秒）
+PREFETCH_ENABLED = config.getboolean('DEFAULT', 'PREFETCH_ENABLED', fallback=True)
+PREFETCH_PAGE_TTL = config.getfloat('DEFAULT', 'PREFETCH_PAGE_TTL', fallback=1800)
+PREFETCH_IDLE_TTL = config.getfloat('DEFAULT', 'PREFETCH_IDLE_TTL', fallback=3600)
+# 近似重复作品过滤（转载的同一张图）：差值哈希的汉明距离不超过阈值视为重复 /
+# 已发送作品的记忆时间（秒）/ 每次搜索后额外下载并计算哈希的候选缩略图数（默认 0，不额外下载）
+DEDUP_ENABLED = config.getboolean('DEFAULT', 'DEDUP_ENABLED', fallback=True)
+DEDUP_THRESHOLD = config.getint('DEFAULT', 'DEDUP_THRESHOLD', fallback=6)
+DEDUP_WINDOW = config.getfloat('DEFAULT', 'DEDUP_WINDOW', fallback=24 * 3600)
+DEDUP_WARM_COUNT = config.getint('DEFAULT', 'DEDUP_WARM_COUNT', fallback=0)
+# 由搜索结果推测原图地址，跳过作品详情请求
+DETAIL_FAST_PATH = config.getboolean('DEFAULT', 'DETAIL_FAST_PATH', fallback=True)
+# 临时/缓存目录后台清理（总配额 MB / 最长保留时间 / 残留文件保留时间 / 清理间隔，秒）
+TEMP_QUOTA_MB = config.getint('DEFAULT', 'TEMP_QUOTA_MB', fallback=512)
+TEMP_MAX_AGE = config.getfloat('DEFAULT', 'TEMP_MAX_AGE', fallback=6 * 3600)
+TEMP_ORPHAN_AGE = config.getfloat('DEFAULT', 'TEMP_ORPHAN_AGE', fallback=1800)
+JANITOR_INTERVAL = config.getfloat('DEFAULT', 'JANITOR_INTERVAL', fallback=300)
+# 超大原图压缩结果缓存（总配额 MB，0 为不缓存）
+RENDITION_CACHE_MB = config.getint('DEFAULT', 'RENDITION_CACHE_MB', fallback=256)
+# 原图发送时限（秒，超时先发送预览图，0 为原图失败后才发送预览图）/ 超时后是否补发原图
+DELIVERY_SLA = config.getfloat('DEFAULT', 'DELIVERY_SLA', fallback=8)
+DELIVERY_LATE_ORIGINAL = config.getboolean('DEFAULT', 'DELIVERY_LATE_ORIGINAL', fallback=True)
+# 批量模式（/p 标签 N）：单次最多张数 / 单个命令的并发下载数
+BATCH_MAX_COUNT = config.getint('DEFAULT', 'BATCH_MAX_COUNT', fallback=5)
+BATCH_CONCURRENCY = config.getint('DEFAULT', 'BATCH_CONCURRENCY', fallback=3)
+# 多页作品：最多发送页数 / 单个作品的并发下载数 / 每条合并转发消息的页数
+PAGE_MAX_COUNT = config.getint('DEFAULT', 'PAGE_MAX_COUNT', fallback=20)
+PAGE_CONCURRENCY = config.getint('DEFAULT', 'PAGE_CONCURRENCY', fallback=3)
+PAGE_CHUNK_SIZE = config.getint('DEFAULT', 'PAGE_CHUNK_SIZE', fallback=5)
+# 动图（ugoira）：是否编码为动图发送 / 编码格式（GIF 或 WEBP）
+UGOIRA_ENABLED = config.getboolean('DEFAULT', 'UGOIRA_ENABLED', fallback=True)
+UGOIRA_FORMAT = config.get('DEFAULT', 'UGOIRA_FORMAT', fallback='GIF').strip().upper()
+# 拼图模式（/拼图 标签）：缩略图数量 / 每格边长（像素）
+COLLAGE_COUNT = config.getint('DEFAULT', 'COLLAGE_COUNT', fallback=9)
+COLLAGE_CELL = config.getint('DEFAULT', 'COLLAGE_CELL', fallback=240)
+# 图片处理进程池大小（拼图、动图编码等 CPU 密集任务）
+PROCESS_POOL_WORKERS = config.getint('DEFAULT', 'PROCESS_POOL_WORKERS', fallback=2)
+# 搜图作业队列（worker 数 / 全局排队上限 / 单群排队上限 / 作业超时，秒）
+JOB_WORKERS = config.getint('DEFAULT', 'JOB_WORKERS', fallback=3)
+JOB_QUEUE_SIZE = config.getint('DEFAULT', 'JOB_QUEUE_SIZE', fallback=30)
+JOB_GROUP_MAX_PENDING = config.getint('DEFAULT', 'JOB_GROUP_MAX_PENDING', fallback=5)
+JOB_TIMEOUT = config.getfloat('DEFAULT', 'JOB_TIMEOUT', fallback=180)
+# 群调度权重（群号:权重，逗号分隔，未配置的群权重为 1）
+JOB_GROUP_WEIGHTS = {
+    key.strip(): float(value)
+    for key, _, value in (
+        item.partition(':') for item in config.get('DEFAULT', 'JOB_GROUP_WEIGHTS', fallback='').split(',')
+    )
+    if key.strip() and value.strip()
+}
+# Pixiv 账号池（多个 Cookie 用换行或 | 分隔，未配置时使用 PIXIV_COOKIE）
+PIXIV_COOKIES = [
+    c.strip().strip('"') for c in config.get('DEFAULT', 'PIXIV_COOKIES', fallback='').replace('|', '\n').splitlines()
+    if c.strip().strip('"')
+] or [PIXIV_COOKIE]
+ACCOUNT_BUDGET_PER_MINUTE = config.getint('DEFAULT', 'ACCOUNT_BUDGET_PER_MINUTE', fallback=30)
+ACCOUNT_SELECTION = config.get('DEFAULT', 'ACCOUNT_SELECTION', fallback='least_loaded')
+ACCOUNT_QUARANTINE_SECONDS = config.getfloat('DEFAULT', 'ACCOUNT_QUARANTINE_SECONDS', fallback=600)
+ACCOUNT_HEALTH_INTERVAL = config.getfloat('DEFAULT', 'ACCOUNT_HEALTH_INTERVAL', fallback=300)
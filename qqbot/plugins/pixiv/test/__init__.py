@@ -12,8 +12,10 @@ from nonebot.adapters.onebot.v11 import MessageSegment, Bot, Event
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 
+from ..utils.log_utils import setup_logging
+
 logger = logging.getLogger()
-logging.basicConfig(level = logging.INFO,format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+setup_logging()
 
 
 
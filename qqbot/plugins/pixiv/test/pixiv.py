@@ -34,16 +34,11 @@ BASE_DIR = Path(__file__).parent.parent.parent.absolute()
 DATA_DIR = BASE_DIR / "data"
 TEMP_DIR = DATA_DIR / "pixiv_temp"  # 专用临时目录
 
-# 创建目录
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-TEMP_DIR.mkdir(parents=True, exist_ok=True)
-
 # 近期图片缓存排除机制
 RECENT_IMAGES = {}  # {pid: last_used_time}
 
 # 创建日志
 logger = logging.getLogger()
-logging.basicConfig(level = logging.INFO,format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 # ====== PIXIV逻辑核心函数 ======
 async def search_pixiv_by_tag(tags: list, max_results=10) -> dict:
@@ -443,6 +438,7 @@ async def download_original_image(url: str) -> Path:
         ext = '.png'
 
     filename = f"pixiv_{timestamp}_{random_str}{ext}"
+    TEMP_DIR.mkdir(parents=True, exist_ok=True)  # 首次下载时创建
     temp_path = TEMP_DIR / filename
 
     logger.info(f"开始下载原图到: {temp_path} (预估大小: {file_size/1024/1024:.2f}MB)")
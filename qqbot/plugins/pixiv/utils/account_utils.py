@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from http import HTTPStatus
+from . import metrics_utils
+
+logger = logging.getLogger()
+
+# 响应消息中表示未登录/登录失效的关键字
+LOGIN_REQUIRED_KEYWORDS = ("ログイン", "login", "log in", "登录", "登入")
+SELECTION_ROUND_ROBIN = "round_robin"
+SELECTION_LEAST_LOADED = "least_loaded"
+
+
+class PixivAccount:
+    """单个 Pixiv 账号（Cookie）及其请求预算与隔离状态"""
+
+    def __init__(self, cookie: str, budget_per_minute: int) -> None:
+        self.cookie = cookie
+        self.label = _cookie_label(cookie)
+        self.budget_per_minute = budget_per_minute
+        self.recent = deque()
+        self.inflight = 0
+        self.total_requests = 0
+        self.quarantined_until = 0.0
+        self.quarantine_reason = ""
+        self.quarantine_count = 0
+
+    def _trim(self, now: float) -> None:
+        while self.recent and now - self.recent[0] > 60:
+            self.recent.popleft()
+
+    def is_quarantined(self) -> bool:
+        return bool(self.quarantine_reason)
+
+    def has_budget(self, now: float) -> bool:
+        """最近一分钟内的请求数是否仍在预算内"""
+        self._trim(now)
+        return not self.budget_per_minute or len(self.recent) < self.budget_per_minute
+
+    def load(self, now: float) -> float:
+        """负载：进行中请求数 + 最近一分钟预算占用率"""
+        self._trim(now)
+        used = len(self.recent) / self.budget_per_minute if self.budget_per_minute else 0.0
+        return self.inflight + used
+
+    def next_free_at(self, now: float) -> float:
+        """预算释放的最早时间"""
+        self._trim(now)
+        if self.has_budget(now) or not self.recent:
+            return now
+        return self.recent[0] + 60
+
+    def publish(self) -> None:
+        state = f"隔离({self.quarantine_reason})" if self.is_quarantined() else "正常"
+        metrics_utils.set_gauge(f"account.{self.label}", state)
+        metrics_utils.set_gauge(f"account.{self.label}.requests", self.total_requests)
+
+
+class AccountPool:
+    """Pixiv 账号池：轮询/最少负载选择、每账号请求预算、异常账号自动隔离"""
+
+    def __init__(self, cookies: list, budget_per_minute: int, selection: str, quarantine_seconds: float) -> None:
+        self.accounts = [PixivAccount(cookie, budget_per_minute) for cookie in cookies]
+        self.selection = selection
+        self.quarantine_seconds = quarantine_seconds
+        self._round_robin = itertools.cycle(range(len(self.accounts))) if self.accounts else None
+        for account in self.accounts:
+            account.publish()
+
+    def _pick(self, now: float):
+        healthy = [a for a in self.accounts if not a.is_quarantined() and a.has_budget(now)]
+        if not healthy:
+            return None
+        if self.selection == SELECTION_ROUND_ROBIN:
+            for _ in range(len(self.accounts)):
+                account = self.accounts[next(self._round_robin)]
+                if account in healthy:
+                    return account
+        return min(healthy, key=lambda a: a.load(now))
+
+    def has_healthy(self) -> bool:
+        """是否还有未被隔离的账号（预算暂时用尽的也算）"""
+        return any(not a.is_quarantined() for a in self.accounts)
+
+    async def acquire(self, max_wait: float = 30.0) -> PixivAccount:
+        """获取一个可用账号；预算用尽时等待，全部被隔离时降级使用最早到期的账号"""
+        if not self.accounts:
+            raise Exception("未配置 Pixiv Cookie")
+        deadline = time.monotonic() + max_wait
+        while True:
+            now = time.monotonic()
+            account = self._pick(now)
+            if account is not None:
+                break
+            usable = [a for a in self.accounts if not a.is_quarantined()]
+            if not usable:
+                account = min(self.accounts, key=lambda a: a.quarantined_until)
+                metrics_utils.incr("account.all_quarantined")
+                logger.warning("⚠️ 所有Pixiv账号均已隔离，临时使用账号[%s]", account.label)
+                break
+            wake_at = min(a.next_free_at(now) for a in usable)
+            if wake_at > deadline:
+                account = min(usable, key=lambda a: a.load(now))
+                metrics_utils.incr("account.budget_exceeded")
+                break
+            metrics_utils.incr("account.budget_wait")
+            await asyncio.sleep(max(0.05, wake_at - now))
+        account.recent.append(time.monotonic())
+        account.inflight += 1
+        account.total_requests += 1
+        account.publish()
+        return account
+
+    def release(self, account: PixivAccount) -> None:
+        """请求结束"""
+        account.inflight = max(0, account.inflight - 1)
+
+    def report(self, account: PixivAccount, status: int, data=None, retry_after=None) -> None:
+        """根据响应判断账号是否被限流/失效，必要时隔离"""
+        if status == HTTPStatus.TOO_MANY_REQUESTS:
+            self.quarantine(account, "429限流", _parse_retry_after(retry_after))
+        elif status in (HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN):
+            self.quarantine(account, f"{status}拒绝访问")
+        elif isinstance(data, dict) and data.get("error") and _is_login_required(data.get("message", "")):
+            self.quarantine(account, "需要登录")
+
+    def quarantine(self, account: PixivAccount, reason: str, seconds: float = None) -> None:
+        """隔离账号（连续隔离时间翻倍，最长 6 小时）"""
+        account.quarantine_count += 1
+        duration = seconds or min(self.quarantine_seconds * 2 ** (account.quarantine_count - 1), 6 * 3600)
+        account.quarantined_until = time.monotonic() + duration
+        account.quarantine_reason = reason
+        metrics_utils.incr(f"account.{account.label}.quarantined")
+        logger.warning("🚫 Pixiv账号[%s]已隔离 %.0fs: %s", account.label, duration, reason)
+        account.publish()
+
+    def reinstate(self, account: PixivAccount) -> None:
+        """健康检查通过，恢复账号"""
+        if account.is_quarantined():
+            logger.info("✅ Pixiv账号[%s]已恢复", account.label)
+        account.quarantined_until = 0.0
+        account.quarantine_reason = ""
+        account.quarantine_count = 0
+        account.publish()
+
+
+def _cookie_label(cookie: str) -> str:
+    """用 PHPSESSID 中的用户ID作为账号标识（避免日志中出现完整 Cookie）"""
+    for part in cookie.split(";"):
+        key, _, value = part.strip().partition("=")
+        if key == "PHPSESSID" and value:
+            return value.split("_")[0]
+    return f"cookie#{abs(hash(cookie)) % 10000:04d}"
+
+
+def _is_login_required(message: str) -> bool:
+    message = message.lower()
+    return any(keyword.lower() in message for keyword in LOGIN_REQUIRED_KEYWORDS)
+
+
+def _parse_retry_after(value):
+    """解析 Retry-After 头（仅支持秒数）"""
+    try:
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
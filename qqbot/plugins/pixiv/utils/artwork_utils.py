@@ -0,0 +1,114 @@
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+# 原始标签 -> (小写标签, 是否R-18标签)；同一标签在各作品间共享同一个字符串
+_TAG_INFO = {}
+MAX_TAG_INFO = 20000
+
+
+class Artwork:
+    """搜索结果中的一个作品（只保留搜索流程用到的字段，标签与 R-18 标记在解析时预先计算）"""
+
+    __slots__ = (
+        "pid", "title", "user_name", "user_id", "thumb_url", "illust_type", "page_count",
+        "bookmarks", "likes", "views", "created", "tags", "is_r18", "strategy",
+    )
+
+    def __init__(self, pid: str, title: str = "", user_name: str = "", user_id: str = None,
+                 thumb_url: str = "", illust_type: int = 0, page_count: int = 1,
+                 bookmarks: int = 0, likes: int = 0, views: int = 0,
+                 created: Optional[datetime] = None, tags: tuple = (),
+                 is_r18: bool = False, strategy: str = "unknown") -> None:
+        self.pid = pid
+        self.title = title
+        self.user_name = user_name
+        self.user_id = user_id
+        self.thumb_url = thumb_url          # 搜索结果缩略图地址
+        self.illust_type = illust_type      # 0=插画 1=漫画 2=动图
+        self.page_count = page_count
+        self.bookmarks = bookmarks
+        self.likes = likes
+        self.views = views
+        self.created = created              # 发布日期（UTC 零点），无法解析时为 None
+        self.tags = tags                    # 小写标签名（元组，比集合省内存）
+        self.is_r18 = is_r18
+        self.strategy = strategy            # 命中该作品的搜索策略
+
+    @property
+    def is_ugoira(self) -> bool:
+        return self.illust_type == 2
+
+    def __repr__(self) -> str:
+        return f"Artwork({self.pid!r}, {self.title!r})"
+
+
+def _parse_date(value) -> Optional[datetime]:
+    """createDate（如 2024-01-01T00:00:00+09:00）只取日期部分"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.split("T")[0]).replace(tzinfo=timezone.utc)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _tag_info(tag: str) -> tuple:
+    info = _TAG_INFO.get(tag)
+    if info is None:
+        if len(_TAG_INFO) >= MAX_TAG_INFO:
+            _TAG_INFO.clear()
+        name = sys.intern(tag.lower())
+        info = _TAG_INFO[tag] = (name, "r-18" in name or "r18" in name)
+    return info
+
+
+def _parse_tags(tags_info) -> tuple:
+    """返回 (小写标签元组, 是否含R-18标签)"""
+    if isinstance(tags_info, dict):
+        tags_info = tags_info.get("tags", [])
+    names = []
+    r18 = False
+    for tag in tags_info or ():
+        # 作品详情中为 {"tag": ...} 对象，搜索结果中为字符串
+        if isinstance(tag, dict):
+            tag = tag.get("tag", "")
+        elif not isinstance(tag, str):
+            continue
+        name, is_r18 = _tag_info(tag)
+        names.append(name)
+        r18 = r18 or is_r18
+    return tuple(names), r18
+
+
+def parse_search_item(item, strategy_name: str = "unknown") -> Optional[Artwork]:
+    """把一条搜索结果转换为 Artwork，广告位与无效条目返回 None"""
+    if not isinstance(item, dict) or not item.get("id") or item.get("isAdContainer", 0):
+        return None
+    tags, r18_tag = _parse_tags(item.get("tags"))
+    return Artwork(
+        pid=str(item["id"]),
+        title=item.get("title") or "",
+        user_name=item.get("userName") or "",
+        user_id=item.get("userId"),
+        thumb_url=item.get("url") or "",
+        illust_type=item.get("illustType") or 0,
+        page_count=int(item.get("pageCount") or 1),
+        bookmarks=item.get("bookmarkCount") or 0,
+        likes=item.get("likeCount") or 0,
+        views=item.get("viewCount") or 0,
+        created=_parse_date(item.get("createDate")),
+        tags=tags,
+        is_r18=r18_tag or (item.get("xRestrict") or 0) > 0,
+        strategy=strategy_name,
+    )
+
+
+def parse_search_items(items: list, strategy_name: str = "unknown") -> list:
+    """解析一页搜索结果（原始 dict 用完即可释放，缓存中只保留 Artwork）"""
+    artworks = []
+    for item in items:
+        artwork = parse_search_item(item, strategy_name)
+        if artwork is not None:
+            artworks.append(artwork)
+    return artworks
@@ -0,0 +1,84 @@
+import logging
+import time
+from . import metrics_utils
+
+logger = logging.getLogger()
+
+# 熔断器状态
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """单个上游线路的熔断器（关闭 → 打开 → 半开 → 关闭）"""
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self._state = STATE_CLOSED
+        self._publish()
+
+    @property
+    def state(self) -> str:
+        """当前状态（打开超过 reset_timeout 后自动转为半开）"""
+        if self._state == STATE_OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state(STATE_HALF_OPEN)
+        return self._state
+
+    def allow_request(self) -> bool:
+        """是否允许请求通过；半开状态只放行一个试探请求"""
+        state = self.state
+        if state == STATE_CLOSED:
+            return True
+        if state == STATE_HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """请求成功：清零失败计数并关闭熔断"""
+        self.failures = 0
+        self.trial_in_flight = False
+        if self._state != STATE_CLOSED:
+            logger.info("🔌 线路[%s]已恢复", self.name)
+            self._set_state(STATE_CLOSED)
+
+    def record_failure(self) -> None:
+        """请求失败：半开状态或连续失败达到阈值时打开熔断"""
+        self.failures += 1
+        self.trial_in_flight = False
+        metrics_utils.incr(f"breaker.{self.name}.failures")
+        if self._state == STATE_HALF_OPEN or (self._state == STATE_CLOSED and self.failures >= self.failure_threshold):
+            logger.warning("⛔ 线路[%s]连续失败 %d 次，熔断 %.0fs", self.name, self.failures, self.reset_timeout)
+            self.opened_at = time.monotonic()
+            self._set_state(STATE_OPEN)
+
+    def release(self) -> None:
+        """请求结果与线路健康无关（如被取消），仅释放半开试探名额"""
+        self.trial_in_flight = False
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            metrics_utils.incr(f"breaker.{self.name}.to_{state}")
+        self._state = state
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics_utils.set_gauge(f"breaker.{self.name}", self._state)
+
+
+# 全部熔断器 {名称: CircuitBreaker}
+BREAKERS = {}
+
+
+def get_breaker(name: str, failure_threshold: int = 3, reset_timeout: float = 30.0) -> CircuitBreaker:
+    """获取（或创建）指定线路的熔断器"""
+    breaker = BREAKERS.get(name)
+    if breaker is None:
+        breaker = BREAKERS[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+    return breaker
@@ -0,0 +1,44 @@
+import io
+import math
+
+# 拼图标签栏高度（像素）
+LABEL_HEIGHT = 28
+BACKGROUND = (245, 245, 245)
+
+
+def _load_font(size: int):
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 不支持指定字号
+        return ImageFont.load_default()
+
+
+def compose_collage(tiles: list, cell: int, columns: int = 0) -> bytes:
+    """把缩略图拼成带作品ID标签的网格图，返回 JPEG 数据（在进程池中执行）
+
+    tiles: [(作品ID, 图片数据或 None)]，None 时显示占位格
+    """
+    from PIL import Image, ImageDraw
+    columns = columns or math.ceil(math.sqrt(len(tiles)))
+    rows = math.ceil(len(tiles) / columns)
+    canvas = Image.new("RGB", (columns * cell, rows * (cell + LABEL_HEIGHT)), BACKGROUND)
+    draw = ImageDraw.Draw(canvas)
+    font = _load_font(LABEL_HEIGHT - 8)
+    for index, (pid, data) in enumerate(tiles):
+        left = (index % columns) * cell
+        top = (index // columns) * (cell + LABEL_HEIGHT)
+        if data:
+            try:
+                with Image.open(io.BytesIO(data)) as thumb:
+                    thumb = thumb.convert("RGB")
+                    thumb.thumbnail((cell, cell))
+                    canvas.paste(thumb, (left + (cell - thumb.width) // 2, top + (cell - thumb.height) // 2))
+            except Exception:
+                data = None
+        if not data:
+            draw.rectangle((left + 4, top + 4, left + cell - 4, top + cell - 4), outline=(200, 200, 200), width=2)
+        draw.text((left + 6, top + cell + 4), f"#{index + 1} {pid}", fill=(40, 40, 40), font=font)
+    output = io.BytesIO()
+    canvas.save(output, format="JPEG", quality=85, optimize=True)
+    return output.getvalue()
@@ -0,0 +1,131 @@
+import io
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# 差值哈希边长（8 → 64 位）
+HASH_SIZE = 8
+# 最多缓存的作品缩略图哈希数
+MAX_HASHES = 5000
+# 最多记住的已发送作品数
+MAX_SENT = 500
+
+
+def dhash(data: bytes) -> int:
+    """计算图片的 64 位差值哈希（dHash）：取中央正方形区域缩到 9x8 灰度图，比较每行相邻像素的明暗
+
+    取中央正方形使预览图/原图与搜索结果的正方形缩略图可以互相比较。
+    """
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as img:
+        # JPEG 解码时直接按 1/2~1/8 缩小，预览图和原图上的开销也很小
+        img.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))
+        gray = img.convert("L")
+    side = min(gray.size)
+    left, top = (gray.width - side) // 2, (gray.height - side) // 2
+    square = gray.crop((left, top, left + side, top + side))
+    pixels = list(square.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def dhash_many(images: list) -> list:
+    """批量计算差值哈希（在进程池中执行），数据为空或无法解码时结果为 None"""
+    hashes = []
+    for data in images:
+        try:
+            hashes.append(dhash(data) if data else None)
+        except Exception:
+            hashes.append(None)
+    return hashes
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class DuplicateIndex:
+    """近似重复作品索引：缓存各作品缩略图的差值哈希，记录近期发送过的作品，
+    哈希汉明距离不超过 threshold 的不同作品视为同一张图的转载"""
+
+    def __init__(self, threshold: int, window: float) -> None:
+        self.threshold = threshold
+        self.window = window
+        self.hashes = OrderedDict()     # {作品ID: 哈希}，最近使用的在末尾
+        self.sent = OrderedDict()       # {作品ID: [发送时间, 哈希或 None]}，按发送时间排序
+        # 抽屉原理：64 位哈希分成 threshold+1 段，汉明距离不超过 threshold 的两个哈希至少有一段完全相同，
+        # 按段值建立已发送哈希的倒排表，查重时只需比较同段的少数几个哈希
+        count = min(max(threshold, 0) + 1, HASH_SIZE * HASH_SIZE)
+        bits = HASH_SIZE * HASH_SIZE
+        self._bands = [((bits * i) // count, (1 << (bits * (i + 1) // count - bits * i // count)) - 1)
+                       for i in range(count)]   # [(右移位数, 掩码)]
+        self._buckets = [{} for _ in range(count)]  # 每段 {段值: {作品ID}}
+
+    def _index(self, pid: str, value: int) -> None:
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            buckets.setdefault((value >> shift) & mask, set()).add(pid)
+
+    def _unindex(self, pid: str, value: Optional[int]) -> None:
+        if value is None:
+            return
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            key = (value >> shift) & mask
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.discard(pid)
+                if not bucket:
+                    del buckets[key]
+
+    def get(self, pid: str) -> Optional[int]:
+        value = self.hashes.get(pid)
+        if value is not None:
+            self.hashes.move_to_end(pid)
+        return value
+
+    def add(self, pid: str, value: int) -> None:
+        self.hashes[pid] = value
+        self.hashes.move_to_end(pid)
+        if len(self.hashes) > MAX_HASHES:
+            self.hashes.popitem(last=False)
+        entry = self.sent.get(pid)
+        if entry is not None and entry[1] is None:
+            entry[1] = value    # 发送时哈希尚未算出
+            self._index(pid, value)
+
+    def remember(self, pid: str) -> None:
+        """记录已发送的作品（哈希稍后算出时补记）"""
+        now = time.time()
+        previous = self.sent.pop(pid, None)
+        if previous is not None:
+            self._unindex(pid, previous[1])
+        value = self.hashes.get(pid)
+        self.sent[pid] = [now, value]
+        if value is not None:
+            self._index(pid, value)
+        while self.sent:
+            oldest = next(iter(self.sent.values()))
+            if len(self.sent) <= MAX_SENT and now - oldest[0] <= self.window:
+                break
+            old_pid, (_, old_hash) = self.sent.popitem(last=False)
+            self._unindex(old_pid, old_hash)
+
+    def find_duplicate(self, pid: str) -> Optional[str]:
+        """返回与该作品近似重复的已发送作品ID（哈希未知或无重复时为 None）"""
+        value = self.hashes.get(pid)
+        if value is None or not self.sent:
+            return None
+        deadline = time.time() - self.window
+        seen = set()
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            for sent_pid in buckets.get((value >> shift) & mask, ()):
+                if sent_pid == pid or sent_pid in seen:
+                    continue
+                seen.add(sent_pid)
+                sent_at, sent_hash = self.sent[sent_pid]
+                if sent_at >= deadline and hamming_distance(value, sent_hash) <= self.threshold:
+                    return sent_pid
+        return None
@@ -15,6 +15,12 @@ class PixivAPIError(Exception):
             msg = f"Pixiv API 请求失败 [策略: {strategy_name}, 状态码: {details.get('status')}]"
         elif error_type == "empty_data":
             msg = f"Pixiv API 返回空数据 [策略: {strategy_name}]"
+        elif error_type == "all_filtered":
+            msg = f"搜索结果均已被过滤（近期已发送或限制级内容） [策略: {strategy_name}]"
+        elif error_type == "detail_error":
+            msg = f"获取作品详情失败 [作品: {self.details.get('pid')}, 状态码: {self.details.get('status')}, {self.details.get('message', '')}]"
+        elif error_type == "r18_rejected":
+            msg = f"检测到R-18内容但未明确请求 [作品: {self.details.get('pid')}]"
         else:
             msg = f"Pixiv API 错误 [策略: {strategy_name}]"
 
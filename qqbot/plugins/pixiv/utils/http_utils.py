@@ -0,0 +1,345 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, NamedTuple, Optional
+from . import metrics_utils
+from .breaker_utils import BREAKERS, STATE_HALF_OPEN, get_breaker
+from .proxy_pool_utils import ImageEndpoint, ImageProxyPool
+from .timeout_utils import Timeouts, get_tracker
+from ..config.config import (
+    PROXY,
+    PROXY_URL,
+    USE_PROXY,
+    PIXIV_API_BASE,
+    API_ROUTES,
+    IMAGE_ROUTES,
+    ROUTE_CONNECT_TIMEOUT,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    IMAGE_PROXY_ENDPOINTS,
+    IMAGE_PROXY_DAILY_QUOTA,
+    HEDGE_DELAY,
+    HEDGE_MIN_DELAY
+)
+
+if TYPE_CHECKING:
+    import aiohttp  # 运行时在首次请求前导入（导入较慢，避免拖慢插件加载）
+
+logger = logging.getLogger()
+
+
+def _select_json_loads():
+    """优先使用 orjson（可选依赖 qqbot[fast]，解析搜索结果等大响应时比标准库快数倍），未安装时回退到标准库 json"""
+    try:
+        from orjson import loads
+    except ImportError:
+        return json.loads
+    return loads
+
+
+json_loads = _select_json_loads()
+
+# 线路名称
+ROUTE_DIRECT = "direct"            # 直连
+ROUTE_LOCAL_PROXY = "local_proxy"  # 本地代理 (PROXY)
+ROUTE_WORKER = "worker"            # Cloudflare 图片代理端点池 (IMAGE_PROXY_POOL)
+# 流量类型
+KIND_API = "api"
+KIND_IMAGE = "image"
+
+PXIMG_HOST = "https://i.pximg.net"
+# 图片代理端点池（未配置时只有 PROXY_URL 一个端点）
+IMAGE_PROXY_POOL = ImageProxyPool(IMAGE_PROXY_ENDPOINTS or [PROXY_URL], IMAGE_PROXY_DAILY_QUOTA)
+
+# 全插件共享的 HTTP 会话（首次使用时创建）
+_SESSION = None
+
+
+class UpstreamUnavailable(Exception):
+    """所有上游线路均不可用（连接失败/超时/5xx/熔断中）"""
+
+
+class Route(NamedTuple):
+    """一条候选线路"""
+    name: str
+    url: str
+    proxy: Optional[str]
+    endpoint: Optional[ImageEndpoint] = None
+
+
+class _RouteFailed(Exception):
+    """单条线路失败（已计入熔断器），调用方应切换到下一条线路"""
+
+
+def get_session() -> "aiohttp.ClientSession":
+    """获取共享的 aiohttp 会话"""
+    import aiohttp
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = aiohttp.ClientSession()
+    return _SESSION
+
+
+async def close_session() -> None:
+    """关闭共享会话（驱动关闭时调用）"""
+    global _SESSION
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+    _SESSION = None
+
+
+def _to_pximg(url: str) -> str:
+    """把代理域名还原为 i.pximg.net 原始地址"""
+    endpoint = IMAGE_PROXY_POOL.match(url)
+    if endpoint is not None:
+        return PXIMG_HOST + url[len(endpoint.base):]
+    return url
+
+
+def _to_endpoint(url: str, endpoint: ImageEndpoint) -> str:
+    """把 i.pximg.net 地址改写为指定代理端点的地址"""
+    if url.startswith(PXIMG_HOST):
+        return endpoint.base + url[len(PXIMG_HOST):]
+    return url
+
+
+def _build_routes(kind: str, url: str) -> list:
+    """按配置顺序生成候选线路（worker 展开为按评分排序的代理端点，只用于图片）"""
+    local_proxy = PROXY if USE_PROXY else None
+    routes = []
+    if kind == KIND_API:
+        for name in API_ROUTES:
+            if name == ROUTE_LOCAL_PROXY and local_proxy:
+                routes.append(Route(name, url, local_proxy))
+            elif name == ROUTE_DIRECT:
+                routes.append(Route(name, url, None))
+        return routes
+    original = _to_pximg(url)
+    for name in IMAGE_ROUTES:
+        if name == ROUTE_WORKER:
+            for endpoint in IMAGE_PROXY_POOL.ordered():
+                routes.append(Route(endpoint.route_name, _to_endpoint(original, endpoint), local_proxy, endpoint))
+        elif name == ROUTE_LOCAL_PROXY and local_proxy:
+            routes.append(Route(name, original, local_proxy))
+        elif name == ROUTE_DIRECT:
+            routes.append(Route(name, original, None))
+    return routes
+
+
+def _route_breaker(kind: str, name: str):
+    return get_breaker(f"{kind}.{name}", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
+
+def _client_timeout(timeouts: Timeouts) -> "aiohttp.ClientTimeout":
+    """sock_read 为传输空闲超时（空闲超时不小于首字节超时，更严格的首字节超时见 _open_route）"""
+    import aiohttp
+    return aiohttp.ClientTimeout(
+        total=timeouts.total, sock_connect=timeouts.connect, sock_read=timeouts.idle
+    )
+
+
+async def _open_route(session, kind: str, route: Route, method: str, timeouts_for, kwargs: dict):
+    """在单条线路上发起请求直到收到响应头（调用前需已通过熔断器放行）"""
+    import aiohttp
+    breaker = _route_breaker(kind, route.name)
+    tracker, timeouts = timeouts_for(route)
+    started = time.monotonic()
+    if route.endpoint:
+        route.endpoint.inflight += 1
+        route.endpoint.count_request()
+    try:
+        request = session.request(
+            method, route.url, proxy=route.proxy, timeout=_client_timeout(timeouts), **kwargs
+        )
+        if timeouts.first_byte < timeouts.idle:
+            # 首字节超时比空闲超时更严格时，单独限制等待响应头的时间
+            request = asyncio.wait_for(request, timeouts.connect + timeouts.first_byte)
+        response = await request
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        if isinstance(e, asyncio.TimeoutError):
+            tracker.observe_first_byte(time.monotonic() - started)
+            metrics_utils.incr(f"route.{kind}.{route.name}.timeout")
+        breaker.record_failure()
+        if route.endpoint:
+            route.endpoint.record_error()
+        metrics_utils.incr(f"route.{kind}.{route.name}.failover")
+        raise _RouteFailed(f"{route.name}: {type(e).__name__} {str(e)}") from e
+    except BaseException:
+        breaker.release()
+        if route.endpoint:
+            route.endpoint.record_slow(time.monotonic() - started)
+        raise
+    finally:
+        if route.endpoint:
+            route.endpoint.inflight -= 1
+    tracker.observe_first_byte(time.monotonic() - started)
+    if response.status >= 500:
+        response.release()
+        breaker.record_failure()
+        if route.endpoint:
+            route.endpoint.record_error()
+        metrics_utils.incr(f"route.{kind}.{route.name}.failover")
+        raise _RouteFailed(f"{route.name}: 状态码 {response.status}")
+    if route.endpoint:
+        route.endpoint.record_first_byte(time.monotonic() - started)
+    return response
+
+
+async def _open_hedged(session, kind: str, primary: Route, backup: Route, method: str, timeouts_for, kwargs: dict):
+    """对冲请求：primary 首字节过慢时向 backup 再发一次，先返回者胜出，另一个取消"""
+    tasks = {asyncio.create_task(_open_route(session, kind, primary, method, timeouts_for, kwargs)): primary}
+    pending = set(tasks)
+    winner = None
+    errors = []
+    try:
+        delay = primary.endpoint.hedge_delay(HEDGE_MIN_DELAY, HEDGE_DELAY)
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done or not _route_breaker(kind, backup.name).allow_request():
+            pending = set()
+            return primary, await next(iter(tasks)), False
+        metrics_utils.incr("proxy_pool.hedge_fired")
+        second = asyncio.create_task(_open_route(session, kind, backup, method, timeouts_for, kwargs))
+        tasks[second] = backup
+        pending.add(second)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(str(task.exception()))
+                elif winner is None:
+                    winner = task
+                else:
+                    # 两边同时返回，释放较慢的一个
+                    task.result().release()
+                    _route_breaker(kind, tasks[task].name).record_success()
+    finally:
+        # 取消仍未完成的请求（包括外层被取消的情况）
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*(task for task in tasks if not task.done()), return_exceptions=True)
+    if winner is None:
+        raise _RouteFailed("; ".join(errors))
+    if tasks[winner] is backup:
+        metrics_utils.incr("proxy_pool.hedge_won")
+    return tasks[winner], winner.result(), True
+
+
+@asynccontextmanager
+async def upstream_request(method: str, url: str, *, kind: str, timeout: float,
+                           request_class: str = None, expected_size: int = 0, **kwargs):
+    """经熔断器保护的上游请求：连接失败/超时/5xx 时立即切换到下一条可用线路
+
+    timeout 为冷启动时的超时与上限；有足够样本后按该请求类型在各线路上的
+    首字节延迟分位数收紧连接/首字节/空闲超时，expected_size 不为 0 时总超时按体积估算。
+    """
+    import aiohttp
+    session = get_session()
+    request_class = request_class or kind
+
+    def timeouts_for(route: Route):
+        tracker = get_tracker(request_class, route.name)
+        return tracker, tracker.plan(timeout, expected_size)
+
+    errors = []
+    routes = _build_routes(kind, url)
+    tried = set()
+    for index, route in enumerate(routes):
+        if route.name in tried:
+            continue
+        breaker = _route_breaker(kind, route.name)
+        if not breaker.allow_request():
+            errors.append(f"{route.name}: 熔断中")
+            metrics_utils.incr(f"route.{kind}.{route.name}.skipped")
+            continue
+        tried.add(route.name)
+        # 下一条同为代理端点的线路可作为对冲备选
+        backup = routes[index + 1] if index + 1 < len(routes) else None
+        try:
+            if HEDGE_DELAY > 0 and method == "GET" and route.endpoint and backup and backup.endpoint:
+                route, response, hedged = await _open_hedged(
+                    session, kind, route, backup, method, timeouts_for, kwargs
+                )
+                if hedged:
+                    tried.add(backup.name)
+            else:
+                response = await _open_route(session, kind, route, method, timeouts_for, kwargs)
+        except _RouteFailed as e:
+            errors.append(str(e))
+            continue
+        breaker = _route_breaker(kind, route.name)
+        metrics_utils.incr(f"route.{kind}.{route.name}.requests")
+        started = time.monotonic()
+        healthy = None
+        try:
+            yield response
+            healthy = True
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            healthy = False
+            raise
+        finally:
+            response.release()
+            if healthy is True:
+                breaker.record_success()
+                received = response.content.total_bytes
+                if method == "GET" and received >= 64 * 1024:
+                    elapsed = time.monotonic() - started
+                    get_tracker(request_class, route.name).observe_transfer(received, elapsed)
+                    if route.endpoint:
+                        route.endpoint.record_transfer(received, elapsed)
+            elif healthy is False:
+                breaker.record_failure()
+                if route.endpoint:
+                    route.endpoint.record_error()
+            else:
+                breaker.release()
+        return
+    raise UpstreamUnavailable(f"所有上游线路均不可用（代理/直连）: {'; '.join(errors) or '未配置线路'}")
+
+
+def _probe_target(kind: str, name: str):
+    """健康探测地址与代理"""
+    local_proxy = PROXY if USE_PROXY else None
+    if kind == KIND_API:
+        return f"{PIXIV_API_BASE}/", local_proxy if name == ROUTE_LOCAL_PROXY else None
+    endpoint = IMAGE_PROXY_POOL.by_route_name.get(name)
+    if endpoint is not None:
+        return f"{endpoint.base}/", local_proxy
+    return f"{PXIMG_HOST}/", local_proxy if name == ROUTE_LOCAL_PROXY else None
+
+
+async def probe_breakers() -> None:
+    """对处于半开状态的线路发送轻量探测请求，决定恢复或继续熔断"""
+    import aiohttp
+    session = get_session()
+    for breaker_name, breaker in list(BREAKERS.items()):
+        kind, _, name = breaker_name.partition(".")
+        if breaker.state != STATE_HALF_OPEN or not breaker.allow_request():
+            continue
+        url, proxy = _probe_target(kind, name)
+        try:
+            async with session.head(
+                url, proxy=proxy, allow_redirects=False,
+                headers={"Referer": "https://www.pixiv.net/"},
+                timeout=aiohttp.ClientTimeout(total=ROUTE_CONNECT_TIMEOUT * 2),
+            ) as response:
+                if response.status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug("线路[%s]探测失败: %s", breaker_name, e)
+            breaker.record_failure()
+        metrics_utils.incr(f"breaker.{breaker_name}.probes")
+
+
+async def run_health_probe(interval: float) -> None:
+    """后台健康探测循环"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await probe_breakers()
+        except Exception as e:
+            logger.warning("线路健康探测出错: %s", e)
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from . import metrics_utils
+
+logger = logging.getLogger()
+
+# 下载中断/压缩残留的文件名后缀
+ORPHAN_SUFFIXES = (".part", "_compressed.jpg")
+# 超出配额时不删除最近该时间（秒）内写入的文件（可能正在发送）
+MIN_EVICT_AGE = 120
+
+
+class DiskJanitor:
+    """临时/缓存目录清理：按最长保留时间、残留文件时间和总字节配额删除文件"""
+
+    def __init__(self, directories: list, quota_bytes: int, max_age: float, orphan_age: float) -> None:
+        self.directories = [Path(d) for d in directories]
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.orphan_age = orphan_age
+
+    def add_directory(self, directory: Path) -> None:
+        """加入需要清理的目录（各缓存模块调用）"""
+        if Path(directory) not in self.directories:
+            self.directories.append(Path(directory))
+
+    def _remove(self, path: str, reason: str) -> int:
+        try:
+            size = os.stat(path).st_size
+            os.unlink(path)
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning("清理文件失败 %s: %s", path, e)
+            return 0
+        metrics_utils.incr(f"janitor.removed.{reason}")
+        logger.debug("清理文件(%s): %s", reason, path)
+        return size
+
+    def sweep_sync(self) -> dict:
+        """扫描并清理一次（在线程中执行，不阻塞事件循环）"""
+        now = time.time()
+        kept = []
+        removed_bytes = 0
+        for directory in self.directories:
+            if not directory.is_dir():
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    age = now - stat.st_mtime
+                    if age > self.max_age:
+                        removed_bytes += self._remove(entry.path, "expired")
+                    elif entry.name.endswith(ORPHAN_SUFFIXES) and age > self.orphan_age:
+                        removed_bytes += self._remove(entry.path, "orphan")
+                    else:
+                        kept.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in kept)
+        if self.quota_bytes and total > self.quota_bytes:
+            # 超出配额：从最旧的文件开始删除
+            for mtime, size, path in sorted(kept):
+                if total <= self.quota_bytes:
+                    break
+                if now - mtime < MIN_EVICT_AGE:
+                    continue
+                freed = self._remove(path, "quota")
+                total -= freed
+                removed_bytes += freed
+        metrics_utils.set_gauge("janitor.bytes", total)
+        metrics_utils.set_gauge("janitor.files", len(kept))
+        return {"bytes": total, "removed_bytes": removed_bytes}
+
+    async def sweep(self) -> None:
+        try:
+            stats = await asyncio.to_thread(self.sweep_sync)
+        except Exception as e:
+            logger.warning("清理临时文件时出错: %s", e)
+            return
+        if stats["removed_bytes"]:
+            logger.info(
+                "🧹 临时文件清理: 释放 %.1fMB，剩余 %.1fMB",
+                stats["removed_bytes"]/1024/1024, stats["bytes"]/1024/1024
+            )
+
+
+async def run_janitor(janitor: DiskJanitor, interval: float) -> None:
+    """后台定期清理（启动时先清理一次）"""
+    while True:
+        await janitor.sweep()
+        await asyncio.sleep(interval)
@@ -0,0 +1,184 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from . import metrics_utils
+
+logger = logging.getLogger()
+
+
+class QueueFullError(Exception):
+    """作业队列已满（全局或单个群的排队上限）"""
+
+
+class Job:
+    """一个排队中的作业"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, group: str, label: str, factory, timeout: float, on_timeout=None) -> None:
+        self.id = next(Job._ids)
+        self.group = group
+        self.label = label
+        self.factory = factory          # 无参协程函数，执行实际工作
+        self.on_timeout = on_timeout    # 超时后调用的无参协程函数（通知用户）
+        self.enqueued_at = time.monotonic()
+        self.deadline = self.enqueued_at + timeout
+        self.done = asyncio.get_running_loop().create_future()
+
+    async def wait(self):
+        """等待作业结束（成功、失败或超时）"""
+        return await asyncio.shield(self.done)
+
+    def finish(self, result=None) -> None:
+        if not self.done.done():
+            self.done.set_result(result)
+
+
+class FairJobQueue:
+    """有界作业队列 + 固定数量的 asyncio worker，按群加权公平调度（起始时间公平排队）
+
+    每个群按权重分享处理能力：群每被调度一个作业，其虚拟时间增加 1/权重，
+    worker 总是取虚拟时间最小的群的队首作业，因此刷屏的群不会饿死其他群。
+    """
+
+    def __init__(self, workers: int, max_pending: int, max_pending_per_group: int,
+                 timeout: float, weights: dict = None) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_pending_per_group = max_pending_per_group
+        self.timeout = timeout
+        self.weights = weights or {}
+        self.queues = {}        # {群: deque[Job]}
+        self.finish_tags = {}   # {群: 虚拟结束时间}
+        self.clock = 0.0        # 最近调度作业的虚拟开始时间
+        self.pending = 0
+        self.running = 0
+        # 在 start() 中（运行中的事件循环内）创建：Python 3.9 的 asyncio 原语在创建时绑定当时的事件循环，
+        # 而队列作为模块全局对象在 NoneBot 启动事件循环之前就已构造
+        self._available = None
+
+    def _weight(self, group: str) -> float:
+        return max(float(self.weights.get(group, 1)), 0.01)
+
+    def _next_group(self, finish_tags: dict, clock: float, heads: dict):
+        """按虚拟开始时间（同值时按入队先后）选择下一个群"""
+        best = None
+        for group, queue in self.queues.items():
+            index = heads.get(group, 0)
+            if index >= len(queue):
+                continue
+            key = (max(clock, finish_tags.get(group, 0.0)), queue[index].enqueued_at)
+            if best is None or key < best[0]:
+                best = (key, group)
+        return best
+
+    def submit(self, group: str, label: str, factory, on_timeout=None):
+        """提交作业，返回 (作业, 前面等待的作业数)；队列已满时抛出 QueueFullError"""
+        queue = self.queues.setdefault(group, deque())
+        if self.pending >= self.max_pending or len(queue) >= self.max_pending_per_group:
+            metrics_utils.incr("jobs.rejected")
+            raise QueueFullError(f"队列已满（{self.pending} 个作业排队中）")
+        job = Job(group, label, factory, self.timeout, on_timeout)
+        queue.append(job)
+        self.pending += 1
+        metrics_utils.incr("jobs.submitted")
+        self._publish()
+        position = self.position(job)
+        if self._available is not None:
+            self._available.release()
+        return job, position
+
+    def position(self, job: Job) -> int:
+        """按调度顺序模拟，计算排在该作业之前的作业数"""
+        finish_tags = dict(self.finish_tags)
+        clock = self.clock
+        heads = {}
+        ahead = 0
+        while True:
+            chosen = self._next_group(finish_tags, clock, heads)
+            if chosen is None:
+                return ahead
+            (start, _), group = chosen
+            if self.queues[group][heads.get(group, 0)] is job:
+                return ahead
+            heads[group] = heads.get(group, 0) + 1
+            clock = start
+            finish_tags[group] = start + 1 / self._weight(group)
+            ahead += 1
+
+    def _pop(self):
+        chosen = self._next_group(self.finish_tags, self.clock, {})
+        if chosen is None:
+            return None
+        (start, _), group = chosen
+        job = self.queues[group].popleft()
+        if not self.queues[group]:
+            del self.queues[group]
+        self.clock = start
+        self.finish_tags[group] = start + 1 / self._weight(group)
+        self.pending -= 1
+        return job
+
+    async def _run_job(self, job: Job) -> None:
+        remaining = job.deadline - time.monotonic()
+        metrics_utils.observe("jobs.wait_s", time.monotonic() - job.enqueued_at)
+        if remaining <= 0:
+            metrics_utils.incr("jobs.expired")
+            logger.warning("作业[%s]排队超时，已取消", job.label)
+            await self._notify_timeout(job)
+            return
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(job.factory(), remaining)
+        except asyncio.TimeoutError:
+            metrics_utils.incr("jobs.timeout")
+            logger.warning("作业[%s]执行超时，已取消", job.label)
+            await self._notify_timeout(job)
+        except Exception as e:
+            metrics_utils.incr("jobs.failed")
+            logger.error("作业[%s]执行出错: %s", job.label, e, exc_info=True)
+        finally:
+            metrics_utils.observe("jobs.run_s", time.monotonic() - started)
+
+    async def _notify_timeout(self, job: Job) -> None:
+        if job.on_timeout is None:
+            return
+        try:
+            await job.on_timeout()
+        except Exception as e:
+            logger.warning("作业超时通知失败: %s", e)
+
+    async def _worker(self) -> None:
+        while True:
+            await self._available.acquire()
+            job = self._pop()
+            if job is None:
+                continue
+            self.running += 1
+            self._publish()
+            try:
+                await self._run_job(job)
+            finally:
+                self.running -= 1
+                job.finish()
+                self._publish()
+
+    def start(self) -> list:
+        """启动 worker，返回任务列表（由调用方在关闭时取消）"""
+        self._available = asyncio.Semaphore(self.pending)
+        return [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def cancel_pending(self) -> None:
+        """关闭时结束所有排队中的作业"""
+        for queue in self.queues.values():
+            for job in queue:
+                job.finish()
+        self.queues.clear()
+        self.pending = 0
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics_utils.set_gauge("jobs.pending", self.pending)
+        metrics_utils.set_gauge("jobs.running", self.running)
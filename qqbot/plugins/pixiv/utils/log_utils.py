@@ -0,0 +1,107 @@
+import copy
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from . import metrics_utils
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+class RepeatFilter(logging.Filter):
+    """按调用位置限制重复的警告/错误：每个位置每 window 秒最多输出 limit 条，
+    其余丢弃，窗口结束后的下一条附带省略条数"""
+
+    def __init__(self, limit: int, window: float, level: int = logging.WARNING) -> None:
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.level = level
+        self.sites = {}     # {(文件, 行号): [窗口开始时间, 已输出条数, 已省略条数]}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level or self.limit <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site else 0
+                self.sites[key] = [now, 1, 0]
+                if len(self.sites) > 1000:
+                    self._evict(now)
+            elif site[1] < self.limit:
+                site[1] += 1
+                return True
+            else:
+                site[2] += 1
+                metrics_utils.incr("logging.suppressed")
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()}（前 {self.window:.0f} 秒内同类日志省略 {suppressed} 条）"
+            record.args = None
+        return True
+
+    def _evict(self, now: float) -> None:
+        for key in [k for k, site in self.sites.items() if now - site[0] >= self.window]:
+            del self.sites[key]
+
+
+class _LoopQueueHandler(QueueHandler):
+    """事件循环中只格式化消息文本；异常堆栈在监听线程中格式化，队列满时丢弃"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics_utils.incr("logging.dropped")
+
+
+def setup_logging(level: int = logging.INFO, queue_size: int = 10000,
+                  repeat_limit: int = 5, repeat_window: float = 60) -> None:
+    """把根日志器的输出改为经队列由后台线程写出（只生效一次）
+
+    已有的根日志处理器（如 basicConfig 或宿主程序添加的）移到监听线程中执行。
+    """
+    global _listener
+    if _listener is not None:
+        return
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    if not handlers:
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers = [stream]
+    for handler in handlers:
+        root.removeHandler(handler)
+    queue_handler = _LoopQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(RepeatFilter(repeat_limit, repeat_window))
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """停止监听线程（写完队列中剩余的日志）"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, _LoopQueueHandler)]:
+        root.removeHandler(handler)
+    for handler in _listener.handlers:
+        root.addHandler(handler)
+    _listener = None
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from pathlib import Path
+from . import metrics_utils
+
+logger = logging.getLogger()
+
+# 插件源码目录，用于在堆栈中定位插件自身的阻塞点
+PLUGIN_DIR = str(Path(__file__).parent.parent.absolute())
+
+
+class LoopLagMonitor:
+    """事件循环阻塞检测器：心跳协程测量调度延迟，看门狗线程在卡顿时抓取循环线程堆栈"""
+
+    def __init__(self, interval: float = 0.5, threshold: float = 0.2, max_reports: int = 20) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.loop = None
+        self.loop_thread_id = None
+        self.last_beat = 0.0
+        self.running = False
+        self.task = None
+        self.watchdog = None
+        # 当前这次卡顿期间抓到的堆栈（每次卡顿只抓一次）
+        self.pending_stack = None
+        self.recent_stalls = deque(maxlen=max_reports)
+        self.hot_spots = Counter()
+
+    def start(self) -> None:
+        """在事件循环中启动心跳与看门狗"""
+        if self.running:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.running = True
+        self.task = self.loop.create_task(self._heartbeat())
+        self.watchdog = threading.Thread(target=self._watch, name="pixiv-loop-watchdog", daemon=True)
+        self.watchdog.start()
+        logger.info("🩺 事件循环阻塞检测已启动 (间隔: %ss, 阈值: %ss)", self.interval, self.threshold)
+
+    async def stop(self) -> None:
+        """停止检测"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _heartbeat(self) -> None:
+        """定时唤醒，实际唤醒时间与预期之差即为调度延迟"""
+        while self.running:
+            expected = self.loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self.loop.time() - expected)
+            self.last_beat = time.monotonic()
+            metrics_utils.observe("loop.lag", lag)
+            metrics_utils.set_gauge("loop.last_lag_ms", round(lag * 1000, 1))
+            if lag >= self.threshold:
+                self._report(lag)
+
+    def _watch(self) -> None:
+        """看门狗线程：心跳超时即视为循环被阻塞，抓取循环线程当前堆栈"""
+        captured_for = None
+        while self.running:
+            time.sleep(min(self.interval, self.threshold) / 2)
+            beat = self.last_beat
+            if time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            if captured_for == beat:
+                continue  # 本次卡顿已抓取
+            captured_for = beat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is not None:
+                self.pending_stack = traceback.extract_stack(frame)
+
+    def _report(self, lag: float) -> None:
+        """输出一次卡顿报告并累计热点"""
+        stack = self.pending_stack
+        self.pending_stack = None
+        metrics_utils.incr("loop.stalls")
+        if not stack:
+            logger.warning("🐢 事件循环延迟 %.0fms（阻塞时间过短，未捕获堆栈）", lag * 1000)
+            return
+        hot_spot = _locate_hot_spot(stack)
+        self.hot_spots[hot_spot] += 1
+        self.recent_stalls.append((time.time(), lag, hot_spot))
+        logger.warning(
+            "🐢 事件循环被阻塞 %.0fms，阻塞点: %s\n%s",
+            lag * 1000, hot_spot, "".join(traceback.format_list(stack[-12:]))
+        )
+
+    def format_report(self, top: int = 5) -> str:
+        """生成阻塞热点汇总文本"""
+        if not self.hot_spots:
+            return "🩺 暂未检测到事件循环阻塞"
+        lines = [f"🩺 事件循环阻塞热点 (阈值 {self.threshold*1000:.0f}ms):"]
+        for spot, count in self.hot_spots.most_common(top):
+            lines.append(f"• {spot} ×{count}")
+        return "\n".join(lines)
+
+
+def _locate_hot_spot(stack) -> str:
+    """优先定位到插件自身代码中最内层的帧"""
+    for frame in reversed(stack):
+        if frame.filename.startswith(PLUGIN_DIR):
+            relative = frame.filename[len(PLUGIN_DIR):].lstrip("/\\")
+            return f"{relative}:{frame.lineno} {frame.name}"
+    frame = stack[-1]
+    return f"{Path(frame.filename).name}:{frame.lineno} {frame.name}"
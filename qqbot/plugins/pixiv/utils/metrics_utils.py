@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import deque
+
+# 插件内部指标（计数器 / 仪表值 / 采样分布），供状态命令和日志使用
+_METRICS_LOCK = threading.Lock()
+COUNTERS = {}
+GAUGES = {}
+SAMPLES = {}
+# 每个分布指标最多保留的样本数
+MAX_SAMPLES = 512
+
+def incr(name: str, value: int = 1) -> None:
+    """计数器累加"""
+    with _METRICS_LOCK:
+        COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+def set_gauge(name: str, value) -> None:
+    """设置仪表值（覆盖旧值）"""
+    with _METRICS_LOCK:
+        GAUGES[name] = value
+
+def observe(name: str, value: float) -> None:
+    """记录一个分布样本（如耗时、延迟）"""
+    with _METRICS_LOCK:
+        samples = SAMPLES.get(name)
+        if samples is None:
+            samples = SAMPLES[name] = deque(maxlen=MAX_SAMPLES)
+        samples.append((time.time(), value))
+
+def percentile(values: list, pct: float) -> float:
+    """计算百分位数（最近邻法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def summarize(name: str) -> dict:
+    """汇总分布指标：样本数/最大值/p50/p95/p99"""
+    with _METRICS_LOCK:
+        values = [v for _, v in SAMPLES.get(name, ())]
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "max": max(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+def snapshot() -> dict:
+    """导出当前全部指标"""
+    with _METRICS_LOCK:
+        counters = dict(COUNTERS)
+        gauges = dict(GAUGES)
+        names = list(SAMPLES)
+    return {
+        "counters": counters,
+        "gauges": gauges,
+        "samples": {name: summarize(name) for name in names},
+    }
+
+def format_report() -> str:
+    """生成可直接发送的指标文本"""
+    data = snapshot()
+    lines = ["📊 搜图插件运行指标"]
+    if data["counters"]:
+        lines.append("\n[计数]")
+        lines.extend(f"{k}: {v}" for k, v in sorted(data["counters"].items()))
+    if data["gauges"]:
+        lines.append("\n[状态]")
+        lines.extend(f"{k}: {v}" for k, v in sorted(data["gauges"].items()))
+    if data["samples"]:
+        lines.append("\n[分布]")
+        for name, stats in sorted(data["samples"].items()):
+            if not stats["count"]:
+                continue
+            lines.append(
+                f"{name}: n={stats['count']} p50={stats['p50']:.3f} "
+                f"p95={stats['p95']:.3f} p99={stats['p99']:.3f} max={stats['max']:.3f}"
+            )
+    return "\n".join(lines)
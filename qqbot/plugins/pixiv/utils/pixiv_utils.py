@@ -1,30 +1,51 @@
 import urllib.parse
+import asyncio
+import re
 import random
-import aiohttp
 import time
 import threading
 import math
 import logging
 import io
-from PIL import Image
 from http import HTTPStatus
 from datetime import datetime, timedelta, timezone
 from .error_utils import PixivAPIError
+from .http_utils import upstream_request, json_loads, KIND_API, PXIMG_HOST
+from .artwork_utils import Artwork, parse_search_items
+from .dedup_utils import DuplicateIndex
+from .account_utils import AccountPool, _parse_retry_after
+from . import retry_utils
+from .rate_limit_utils import OutboundRateLimiter, PRIORITY_HIGH, PRIORITY_LOW
 from ..config.config import (
-    PIXIV_COOKIE, 
-    PROXY, 
+    PIXIV_COOKIES,
+    ACCOUNT_BUDGET_PER_MINUTE,
+    ACCOUNT_SELECTION,
+    ACCOUNT_QUARANTINE_SECONDS,
+    OUTBOUND_RATE,
+    OUTBOUND_BURST,
+    PIXIV_API_BASE,
     PROXY_URL, 
-    USE_PROXY, 
-    EXCLUDE_DURATION
+    EXCLUDE_DURATION,
+    DEDUP_THRESHOLD,
+    DEDUP_WINDOW
 )
 
 # 创建日志
 logger = logging.getLogger()
-logging.basicConfig(level = logging.INFO,format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 RECENT_IMAGES = {}
+# Pixiv 账号池（多 Cookie 轮换）
+ACCOUNT_POOL = AccountPool(
+    PIXIV_COOKIES, ACCOUNT_BUDGET_PER_MINUTE, ACCOUNT_SELECTION, ACCOUNT_QUARANTINE_SECONDS
+)
+# 搜索结果缩略图地址中的日期路径与作品ID，如 .../img-master/img/2024/01/01/00/00/00/12345_p0_square1200.jpg
+THUMBNAIL_PATH_PATTERN = re.compile(r"/img/(\d{4}/\d{2}/\d{2}/\d{2}/\d{2}/\d{2})/(\d+)_p0")
+# Pixiv API 全局出站限速
+OUTBOUND_LIMITER = OutboundRateLimiter(OUTBOUND_RATE, OUTBOUND_BURST)
 # 添加全局锁
 RECENT_IMAGES_LOCK = threading.Lock()
+# 近似重复作品索引（缩略图差值哈希，与 RECENT_IMAGES 一样不区分群）
+DEDUP_INDEX = DuplicateIndex(DEDUP_THRESHOLD, DEDUP_WINDOW)
 
 # 核心辅助函数
 def _is_r18_request(tags: list) -> bool:
@@ -69,25 +90,95 @@ def _build_pixiv_headers(tags: list) -> dict:
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
         "Referer": f"https://www.pixiv.net/tags/{urllib.parse.quote(search_tag)}/artworks",
         "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-        "Cookie": PIXIV_COOKIE,
         "Sec-Fetch-Dest": "empty",
         "Sec-Fetch-Mode": "cors",
         "Sec-Fetch-Site": "same-origin",
         "X-Requested-With": "XMLHttpRequest"
     }
 
+async def _fetch_pixiv_json(
+    url: str,
+    headers: dict,
+    request_class: str,
+    timeout: float,
+    params: dict = None,
+    priority: int = PRIORITY_HIGH
+):
+    """使用账号池中的 Cookie 请求 Pixiv Ajax 接口，返回 (状态码, JSON数据)"""
+    await OUTBOUND_LIMITER.acquire(priority)
+    account = await ACCOUNT_POOL.acquire()
+    headers = {**headers, "Cookie": account.cookie}
+    try:
+        async with upstream_request(
+                "GET",
+                url,
+                kind=KIND_API,
+                request_class=request_class,
+                headers=headers,
+                params=params,
+                timeout=timeout
+            ) as response:
+                data = await response.json(loads=json_loads) if response.status == HTTPStatus.OK else None
+                retry_after = response.headers.get("Retry-After")
+                ACCOUNT_POOL.report(account, response.status, data, retry_after)
+                if response.status == HTTPStatus.TOO_MANY_REQUESTS:
+                    retry_utils.note_rate_limited(_parse_retry_after(retry_after))
+                return response.status, data
+    finally:
+        ACCOUNT_POOL.release(account)
+
+async def check_account_health(account) -> None:
+    """用需要登录的接口检查账号 Cookie 是否有效"""
+    headers = {**_build_pixiv_headers([]), "Cookie": account.cookie}
+    await OUTBOUND_LIMITER.acquire(PRIORITY_LOW)
+    try:
+        async with upstream_request(
+                "GET",
+                f"{PIXIV_API_BASE}/ajax/user/extra",
+                kind=KIND_API,
+                request_class="account",
+                headers=headers,
+                params={"lang": "zh"},
+                timeout=15
+            ) as response:
+                status = response.status
+                retry_after = response.headers.get("Retry-After")
+                data = await response.json(loads=json_loads) if status == HTTPStatus.OK else None
+    except Exception as e:
+        # 网络问题不代表账号异常
+        logger.debug("账号[%s]健康检查请求失败: %s", account.label, e)
+        return
+    if status == HTTPStatus.OK and isinstance(data, dict) and not data.get("error"):
+        ACCOUNT_POOL.reinstate(account)
+    else:
+        ACCOUNT_POOL.report(account, status, data, retry_after)
+
+async def run_account_health_check(interval: float) -> None:
+    """后台账号健康检查：定期检查正常账号，隔离到期的账号检查通过后恢复"""
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        for account in ACCOUNT_POOL.accounts:
+            if account.is_quarantined() and now < account.quarantined_until:
+                continue
+            try:
+                await check_account_health(account)
+            except Exception as e:
+                logger.warning("账号健康检查出错: %s", e)
+
 async def _execute_search_strategy(
     search_tag: str,
     encoded_tag: str,
     strategy: dict,
+    page: int = None,
+    priority: int = PRIORITY_HIGH
 ) -> list:
-    """执行单次搜索策略并返回原始结果列表"""
+    """执行单次搜索策略并返回该页作品（Artwork 列表）"""
     headers = _build_pixiv_headers(search_tag)
-    proxy = PROXY if USE_PROXY else None
-       # 从策略获取页码 (精准模式固定第一页)
-    if "page" in strategy:
+       # 从策略获取页码 (精准模式固定第一页，调用方已指定时直接使用)
+    if page is None and "page" in strategy:
         page = strategy["page"]
-    else:
+    elif page is None:
         page_range = strategy.get("page_range", (1, 3))
         page = random.randint(*page_range)
     # 从策略获取搜索模式
@@ -103,39 +194,39 @@ async def _execute_search_strategy(
         **strategy["params"]
     }
     # 添加调试日志
-    logger.debug(f"请求策略: {strategy['name']}, 页码: {page}, 参数: {params}")
-    async with aiohttp.ClientSession() as session, \
-        session.get(
-            f"https://www.pixiv.net/ajax/search/artworks/{encoded_tag}",
-            headers=headers,
-            params=params,
-            proxy=proxy,
-            timeout=30
-        ) as response:
-            if response.status != HTTPStatus.OK:
-                raise PixivAPIError(
-                    error_type = "api_failure",
-                    strategy_name = strategy['name'],
-                    details={"status": response.status}
-                )
-            data = await response.json()
-            if not data.get("body") or not data["body"].get("illustManga", {}).get("data"):
-                raise PixivAPIError(
-                    error_type = "empty_data",
-                    strategy_name = strategy['name'],
-                    details={"status": response.status}
-                )
-            return data["body"]["illustManga"]["data"]
+    logger.debug("请求策略: %s, 页码: %s, 参数: %s", strategy['name'], page, params)
+    status, data = await _fetch_pixiv_json(
+        f"{PIXIV_API_BASE}/ajax/search/artworks/{encoded_tag}",
+        headers,
+        request_class="search",
+        timeout=30,
+        params=params,
+        priority=priority
+    )
+    if status != HTTPStatus.OK:
+        raise PixivAPIError(
+            error_type = "api_failure",
+            strategy_name = strategy['name'],
+            details={"status": status}
+        )
+    if not data.get("body") or not data["body"].get("illustManga", {}).get("data"):
+        raise PixivAPIError(
+            error_type = "empty_data",
+            strategy_name = strategy['name'],
+            details={"status": status, "page": page}
+        )
+    return parse_search_items(data["body"]["illustManga"]["data"], strategy['name'])
 
 def _extract_tag_names(item: dict) -> list:
-    """提取作品标签"""
+    """提取作品详情中的标签（搜索结果的标签在解析为 Artwork 时已预先计算）"""
     tags_info = item.get("tags", [])
     if isinstance(tags_info, dict):
         tags_info = tags_info.get("tags", [])
+    # 作品详情中为 {"tag": ...} 对象，搜索结果中为字符串
     return [
-        tag.get("tag", "").lower()
+        (tag.get("tag", "") if isinstance(tag, dict) else tag).lower()
         for tag in tags_info
-        if isinstance(tag, dict)
+        if isinstance(tag, (dict, str))
     ]
 
 def _is_r18_content(tag_names: list) -> bool:
@@ -150,9 +241,9 @@ def _calculate_quality_scores(
     scored_items = []
     for item in items:
         # 基础指标
-        bookmark_count = item.get("bookmarkCount", 0)  # 收藏数
-        like_count = item.get("likeCount", 0)          # 点赞数
-        view_count = max(1, item.get("viewCount", 1))  # 浏览量，至少为1
+        bookmark_count = item.bookmarks     # 收藏数
+        like_count = item.likes             # 点赞数
+        view_count = max(1, item.views)     # 浏览量，至少为1
         # 1. 计算基础质量得分
         # 1.1 绝对互动分（收藏权重更高，反映Pixiv平台特性）
         absolute_score = bookmark_count * 5 + like_count * 3
@@ -171,53 +262,41 @@ def _calculate_quality_scores(
         # 1.4 综合基础质量得分
         quality_score = absolute_score + ratio_score
         # 2. 新鲜度加成
-        if create_date := item.get("createDate"):
-            try:
-                clean_date = create_date.split("T")[0]
-                create_time = datetime.strptime(clean_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-                days_old = (current_time - create_time).days
-                # 新鲜度因子（更平滑的衰减曲线）
-                if days_old <= 3:      # 3天内
-                    freshness_factor = 2.0
-                elif days_old <= 7:    # 一周内
-                    freshness_factor = 1.6
-                elif days_old <= 14:   # 两周内
-                    freshness_factor = 1.3
-                elif days_old <= 30:   # 一个月内
-                    freshness_factor = 1.15
-                elif days_old <= 60:   # 两个月内
-                    freshness_factor = 1.05
-                elif days_old <= 90:   # 三个月内
-                    freshness_factor = 1.0
-                else:
-                    # 90天以上，每多30天衰减0.05，最低0.5
-                    decay_factor = max(0, (days_old - 90) / 30) * 0.05
-                    freshness_factor = max(0.5, 1.0 - decay_factor)
-                quality_score *= freshness_factor
-            except Exception:
-                pass  # 跳过日期解析错误
+        # 发布日期在解析搜索结果时已转换，无法解析的为 None
+        if item.created is not None:
+            days_old = (current_time - item.created).days
+            # 新鲜度因子（更平滑的衰减曲线）
+            if days_old <= 3:      # 3天内
+                freshness_factor = 2.0
+            elif days_old <= 7:    # 一周内
+                freshness_factor = 1.6
+            elif days_old <= 14:   # 两周内
+                freshness_factor = 1.3
+            elif days_old <= 30:   # 一个月内
+                freshness_factor = 1.15
+            elif days_old <= 60:   # 两个月内
+                freshness_factor = 1.05
+            elif days_old <= 90:   # 三个月内
+                freshness_factor = 1.0
+            else:
+                # 90天以上，每多30天衰减0.05，最低0.5
+                decay_factor = max(0, (days_old - 90) / 30) * 0.05
+                freshness_factor = max(0.5, 1.0 - decay_factor)
+            quality_score *= freshness_factor
         scored_items.append((quality_score, item))
     return scored_items
 
 def _process_search_results(
-    raw_results: list,
+    artworks: list,
     is_explicit_r18_request: bool,
     current_time: datetime
 ) -> list:
-    """处理原始搜索结果（过滤/R-18验证/评分排序）"""
-    # 过滤无效结果
-    all_results = [
-        item for item in raw_results
-        if item and isinstance(item, dict)
-        and item.get("id")
-        and item.get("isAdContainer", 0) == 0
-    ]
+    """处理搜索结果（R-18过滤/评分排序，广告位与无效条目已在解析时去除）"""
     # R-18内容过滤
-    filtered_results = []
-    for item in all_results:
-        tag_names = _extract_tag_names(item)
-        if is_explicit_r18_request or not _is_r18_content(tag_names):
-            filtered_results.append(item)
+    filtered_results = [
+        item for item in artworks
+        if is_explicit_r18_request or not item.is_r18
+    ]
     # 质量评分排序
     scored_items = _calculate_quality_scores(filtered_results, current_time)
     scored_items.sort(key=lambda x: x[0], reverse=True)
@@ -229,30 +308,43 @@ def _clean_old_cache(current_timestamp: float):
         if current_timestamp - timestamp > EXCLUDE_DURATION:
             del RECENT_IMAGES[pid]
 
+def _pick_distinct(items: list):
+    """随机选择一个作品，只对选中的作品检查是否与近期发送的作品近似重复，重复则换一个"""
+    while items:
+        index = random.randrange(len(items))
+        item = items[index]
+        if DEDUP_INDEX.find_duplicate(item.pid) is None:
+            return item
+        items[index] = items[-1]
+        items.pop()
+    return None
+
 def _select_best_image(candidates: list, is_explicit_r18_request: bool) -> dict:
-    """从候选作品中选择最佳作品（考虑历史使用）"""
+    """从候选作品中选择最佳作品（考虑历史使用与近似重复）"""
     current_timestamp = time.time()
     # 使用锁来保护全局缓存
     with RECENT_IMAGES_LOCK:
         # 1. 优先选择高质量且未使用过的作品
         unused_high_quality = [
             item for item in candidates[:30] 
-            if str(item["id"]) not in RECENT_IMAGES
+            if item.pid not in RECENT_IMAGES
         ]
-        if unused_high_quality:
-            return random.choice(unused_high_quality)
+        picked = _pick_distinct(unused_high_quality)
+        if picked is not None:
+            return picked
         # 2. 次选：所有未使用过的作品
         unused_all = [
             item for item in candidates
-            if str(item["id"]) not in RECENT_IMAGES
+            if item.pid not in RECENT_IMAGES
         ]
-        if unused_all:
-            return random.choice(unused_all)
+        picked = _pick_distinct(unused_all)
+        if picked is not None:
+            return picked
         # 3. 保底：使用最久未用的作品
         _clean_old_cache(current_timestamp)
         oldest_pid = min(RECENT_IMAGES.items(), key=lambda x: x[1])[0] if RECENT_IMAGES else None
         return next(
-            (item for item in candidates if str(item["id"]) == oldest_pid),
+            (item for item in candidates if item.pid == oldest_pid),
             candidates[0]
         )
 
@@ -276,51 +368,122 @@ def _replace_image_domain(url: str) -> str:
     url = url.replace(' ', '%20').replace('&', '%26').replace('?', '%3F')
     return url
 
+async def _fetch_illust_detail(illust_id: str, encoded_tag: list, strategy_name: str = "unknown") -> dict:
+    """请求作品详情接口，返回 body"""
+    illust_url = f"{PIXIV_API_BASE}/ajax/illust/{illust_id}"
+    headers = _build_pixiv_headers(encoded_tag)
+    headers.update({"Referer": f"https://www.pixiv.net/artworks/{illust_id}"})
+    status, data = await _fetch_pixiv_json(illust_url, headers, request_class="detail", timeout=20)
+    if status != HTTPStatus.OK or data.get("error"):
+        raise PixivAPIError(
+            error_type = "detail_error",
+            strategy_name = strategy_name,
+            details={"status": status, "pid": illust_id, "message": (data or {}).get("message", "")}
+        )
+    return data["body"]
+
+async def _fetch_illust_pages(illust_id: str) -> list:
+    """请求多页作品的分页接口，返回各页的 urls 列表"""
+    pages_url = f"{PIXIV_API_BASE}/ajax/illust/{illust_id}/pages"
+    headers = _build_pixiv_headers([])
+    headers.update({"Referer": f"https://www.pixiv.net/artworks/{illust_id}"})
+    status, data = await _fetch_pixiv_json(pages_url, headers, request_class="pages", timeout=20)
+    if status != HTTPStatus.OK or data.get("error") or not data.get("body"):
+        raise PixivAPIError(
+            error_type = "detail_error",
+            strategy_name = "pages",
+            details={"status": status, "pid": illust_id, "message": (data or {}).get("message", "")}
+        )
+    return [page["urls"] for page in data["body"]]
+
+async def _fetch_ugoira_meta(illust_id: str) -> dict:
+    """请求动图元数据接口，返回 body（帧压缩包地址 src/originalSrc 与帧列表 frames）"""
+    meta_url = f"{PIXIV_API_BASE}/ajax/illust/{illust_id}/ugoira_meta"
+    headers = _build_pixiv_headers([])
+    headers.update({"Referer": f"https://www.pixiv.net/artworks/{illust_id}"})
+    status, data = await _fetch_pixiv_json(meta_url, headers, request_class="ugoira_meta", timeout=20)
+    if status != HTTPStatus.OK or data.get("error") or not (data.get("body") or {}).get("frames"):
+        raise PixivAPIError(
+            error_type = "detail_error",
+            strategy_name = "ugoira",
+            details={"status": status, "pid": illust_id, "message": (data or {}).get("message", "")}
+        )
+    return data["body"]
+
+def _build_response(selected: Artwork, illust_id, title: str, author: str, author_id, urls: dict) -> dict:
+    """构建搜索结果"""
+    return {
+        "image_url": _replace_image_domain(urls["original"]),
+        "pid": str(illust_id),
+        "title": title,
+        "author": author,
+        "author_id": author_id,
+        "work_url": f"https://www.pixiv.net/artworks/{illust_id}",
+        "preview_url": _replace_image_domain(urls["regular"]),
+        "original_url": urls["original"],
+        "stats": {
+            "bookmarks": selected.bookmarks,
+            "likes": selected.likes,
+            "views": selected.views
+        },
+        "strategy_used": selected.strategy,
+        "page_count": selected.page_count,
+        "is_ugoira": selected.is_ugoira
+    }
+
+def _guess_image_urls(item: Artwork):
+    """从搜索结果的缩略图地址推测原图/预览图地址（原图扩展名先按 jpg 推测），无法推测时返回 None"""
+    match = THUMBNAIL_PATH_PATTERN.search(item.thumb_url)
+    # 动图（illustType=2）的原图是 zip，需要走详情接口
+    if not match or item.is_ugoira:
+        return None
+    date_path, illust_id = match.groups()
+    return {
+        "original": f"{PXIMG_HOST}/img-original/img/{date_path}/{illust_id}_p0.jpg",
+        "regular": f"{PXIMG_HOST}/img-master/img/{date_path}/{illust_id}_p0_master1200.jpg",
+    }
+
+def _build_response_from_search(selected: Artwork, is_explicit_r18_request: bool):
+    """快速路径：直接用搜索结果构建返回值（不请求作品详情），信息不足时返回 None"""
+    urls = _guess_image_urls(selected)
+    if urls is None or not selected.title or not selected.user_name:
+        return None
+    illust_id = selected.pid
+    if not is_explicit_r18_request and selected.is_r18:
+        raise PixivAPIError(
+            error_type = "r18_rejected",
+            strategy_name = selected.strategy,
+            details={"pid": illust_id}
+        )
+    result = _build_response(
+        selected, illust_id, selected.title, selected.user_name, selected.user_id, urls
+    )
+    result["url_guessed"] = True
+    return result
+
 async def _validate_and_build_response(
-    selected: dict,
+    selected: Artwork,
     is_explicit_r18_request: bool,
     encoded_tag: list
 ) -> dict:
     """获取作品详情并验证R-18内容"""
     # 获取作品详情
-    illust_id = selected["id"]
-    illust_url = f"https://www.pixiv.net/ajax/illust/{illust_id}"
-    headers = _build_pixiv_headers(encoded_tag)
-    headers.update({"Referer": f"https://www.pixiv.net/artworks/{illust_id}"})
-    async with aiohttp.ClientSession() as session, \
-        session.get(
-            illust_url,
-            headers=headers,
-            proxy=PROXY if USE_PROXY else None,
-            timeout=20
-        ) as response:
-            if response.status != HTTPStatus.OK:
-                raise Exception(f"获取作品详情失败: {response.status}")
-            data = await response.json()
-            if data.get("error"):
-                raise Exception(f"作品详情错误: {data.get('message', '未知错误')}")
-            # 二次R-18验证
-            work_tags = _extract_tag_names(data["body"])
-            if not is_explicit_r18_request and (_is_r18_content(work_tags)):
-                raise Exception("检测到R-18内容但未明确请求")
-            # 构建返回结果
-            body = data["body"]
-            return {
-                "image_url": _replace_image_domain(body["urls"]["original"]),
-                "pid": str(illust_id),
-                "title": body["title"],
-                "author": body["userName"],
-                "author_id": body["userId"],
-                "work_url": f"https://www.pixiv.net/artworks/{illust_id}",
-                "preview_url": _replace_image_domain(body["urls"]["regular"]),
-                "original_url": body["urls"]["original"],
-                "stats": {
-                    "bookmarks": selected.get("bookmarkCount", 0),
-                    "likes": selected.get("likeCount", 0),
-                    "views": selected.get("viewCount", 0)
-                },
-                "strategy_used": selected.get("strategy_used", "unknown")
-            }
+    illust_id = selected.pid
+    strategy_name = selected.strategy
+    body = await _fetch_illust_detail(illust_id, encoded_tag, strategy_name)
+    # 二次R-18验证
+    work_tags = _extract_tag_names(body)
+    if not is_explicit_r18_request and (_is_r18_content(work_tags)):
+        raise PixivAPIError(
+            error_type = "r18_rejected",
+            strategy_name = strategy_name,
+            details={"pid": illust_id}
+        )
+    # 构建返回结果
+    result = _build_response(selected, illust_id, body["title"], body["userName"], body["userId"], body["urls"])
+    result["page_count"] = int(body.get("pageCount") or result["page_count"])
+    result["is_ugoira"] = body.get("illustType", selected.illust_type) == 2
+    return result
 
 def _cleanup_recent_images():
     """清理超过24小时的图片ID"""
@@ -329,8 +492,9 @@ def _cleanup_recent_images():
         if now - timestamp > 24 * 3600:  # 24小时
             del RECENT_IMAGES[image_id]
 
-async def _find_optimal_size(img, orig_width, orig_height, target_size_range):
-    """找到最佳尺寸，使95%质量的JPEG接近目标大小范围"""
+def _find_optimal_size(img, orig_width, orig_height, target_size_range):
+    """找到最佳尺寸，使95%质量的JPEG接近目标大小范围（CPU 密集，在线程中执行）"""
+    from PIL import Image
     min_size, max_size = target_size_range
     current_img = img.copy()
     # 1. 先测试原始尺寸
@@ -339,7 +503,7 @@ async def _find_optimal_size(img, orig_width, orig_height, target_size_range):
     current_size = buffer.tell()
     # 2. 如果原始尺寸在目标范围内，直接返回
     if min_size <= current_size <= max_size:
-        logger.info(f"🎯 原始尺寸完美匹配目标: {current_size/1024/1024:.2f}MB")
+        logger.info("🎯 原始尺寸完美匹配目标: %.2fMB", current_size/1024/1024)
         return current_img
     # 3. 如果原始尺寸太大，缩小
     if current_size > max_size:
@@ -351,12 +515,12 @@ async def _find_optimal_size(img, orig_width, orig_height, target_size_range):
             buffer = io.BytesIO()
             resized_img.save(buffer, format="JPEG", quality=95, optimize=True, progressive=True)
             current_size = buffer.tell()
-            logger.debug(f"🔍 尺寸测试: {new_width}x{new_height} → {current_size/1024/1024:.2f}MB")
+            logger.debug("🔍 尺寸测试: %dx%d → %.2fMB", new_width, new_height, current_size/1024/1024)
             if min_size <= current_size <= max_size:
-                logger.info(f"🎯 找到完美尺寸: {new_width}x{new_height} ({current_size/1024/1024:.2f}MB)")
+                logger.info("🎯 找到完美尺寸: %dx%d (%.2fMB)", new_width, new_height, current_size/1024/1024)
                 return resized_img
             scale -= 0.05
-        logger.info(f"📏 尺寸缩小至: {current_img.size[0]}x{current_img.size[1]} ({current_size/1024/1024:.2f}MB)")
+        logger.info("📏 尺寸缩小至: %dx%d (%.2fMB)", current_img.size[0], current_img.size[1], current_size/1024/1024)
         return current_img
     # 4. 如果原始尺寸太小，尝试增大（仅当原始尺寸小于目标时）
     if current_size < min_size and orig_width < 4096 and orig_height < 4096:
@@ -370,21 +534,21 @@ async def _find_optimal_size(img, orig_width, orig_height, target_size_range):
             buffer = io.BytesIO()
             resized_img.save(buffer, format="JPEG", quality=95, optimize=True, progressive=True)
             current_size = buffer.tell()
-            logger.debug(f"🔍 尺寸放大测试: {new_width}x{new_height} → {current_size/1024/1024:.2f}MB")
+            logger.debug("🔍 尺寸放大测试: %dx%d → %.2fMB", new_width, new_height, current_size/1024/1024)
             if current_size <= max_size:
                 best_img = resized_img
                 best_size = current_size
             if min_size <= current_size <= max_size:
-                logger.info(f"🎯 找到完美放大尺寸: {new_width}x{new_height} ({current_size/1024/1024:.2f}MB)")
+                logger.info("🎯 找到完美放大尺寸: %dx%d (%.2fMB)", new_width, new_height, current_size/1024/1024)
                 return resized_img
             scale += 0.1
         if best_size > current_size:  # 如果有改进
-            logger.info(f"📈 尺寸优化至: {best_img.size[0]}x{best_img.size[1]} ({best_size/1024/1024:.2f}MB)")
+            logger.info("📈 尺寸优化至: %dx%d (%.2fMB)", best_img.size[0], best_img.size[1], best_size/1024/1024)
             return best_img
     return current_img
 
-async def _fine_tune_quality(img, target_size_range):
-    """在最佳尺寸基础上微调质量，精确匹配目标大小"""
+def _fine_tune_quality(img, target_size_range):
+    """在最佳尺寸基础上微调质量，精确匹配目标大小（CPU 密集，在线程中执行）"""
     min_size, max_size = target_size_range
     # 1. 先测试95%质量
     buffer = io.BytesIO()
@@ -403,7 +567,7 @@ async def _fine_tune_quality(img, target_size_range):
             buffer = io.BytesIO()
             img.save(buffer, format="JPEG", quality=mid, optimize=True, progressive=True)
             size = buffer.tell()
-            logger.debug(f"🔍 质量微调: {mid}% → {size/1024/1024:.2f}MB")
+            logger.debug("🔍 质量微调: %d%% → %.2fMB", mid, size/1024/1024)
             if size <= max_size:
                 best_quality = mid
                 best_buffer = buffer
@@ -419,7 +583,7 @@ async def _fine_tune_quality(img, target_size_range):
         buffer = io.BytesIO()
         img.save(buffer, format="JPEG", quality=95, optimize=True, progressive=True, exif=exif_data)
         if buffer.tell() <= max_size:
-            logger.info(f"🏷️ 通过EXIF元数据优化文件大小: {current_size/1024/1024:.2f}MB → {buffer.tell()/1024/1024:.2f}MB")
+            logger.info("🏷️ 通过EXIF元数据优化文件大小: %.2fMB → %.2fMB", current_size/1024/1024, buffer.tell()/1024/1024)
             return buffer, 95, buffer.tell()
     # 5. 返回最接近的结果
     return buffer, 95, current_size
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from . import metrics_utils
+
+logger = logging.getLogger()
+
+# 共享进程池（首次使用时创建，CPU 密集的图片处理在子进程中执行，不阻塞事件循环）
+_POOL = None
+_POOL_WORKERS = 2
+
+
+def configure_process_pool(workers: int) -> None:
+    """设置进程池大小（需在首次使用前调用）"""
+    global _POOL_WORKERS
+    _POOL_WORKERS = max(1, workers)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=_POOL_WORKERS)
+    return _POOL
+
+
+async def run_in_process(func, *args):
+    """在共享进程池中执行 func(*args)（func 与参数需可序列化），进程池损坏时重建一次"""
+    loop = asyncio.get_running_loop()
+    global _POOL
+    for attempt in range(2):
+        try:
+            return await loop.run_in_executor(_get_pool(), func, *args)
+        except BrokenProcessPool:
+            metrics_utils.incr("process_pool.broken")
+            logger.warning("图片处理进程池已损坏，重新创建")
+            _POOL = None
+            if attempt:
+                raise
+
+
+def shutdown_process_pool() -> None:
+    """关闭进程池（插件关闭时调用）"""
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import random
+import time
+from . import metrics_utils
+
+logger = logging.getLogger()
+
+# 最多缓存候选页的标签数
+MAX_TAGS = 200
+# 预取队列长度（队列满时丢弃新的预取任务）
+MAX_QUEUE = 100
+
+
+class SearchPrefetcher:
+    """标签候选页存储 + 后台预取：用户请求命中某策略后，低优先级抓取该策略的其余页码"""
+
+    def __init__(self, fetch_page, page_ttl: float, idle_ttl: float) -> None:
+        # fetch_page(search_tag, encoded_tag, strategy, page) -> list，空页返回 []
+        self.fetch_page = fetch_page
+        self.page_ttl = page_ttl
+        self.idle_ttl = idle_ttl
+        # {标签: {"requested": 最近请求时间, "pages": {(策略名, 页码): (抓取时间, 结果)}}}
+        self.tags = {}
+        self.pending = set()
+        # 在 run() 中（运行中的事件循环内）创建：Python 3.9 的 asyncio 原语在创建时绑定当时的事件循环
+        self.queue = None
+
+    @staticmethod
+    def _key(tag: str) -> str:
+        return tag.strip().lower()
+
+    def _evict(self, now: float) -> None:
+        """淘汰长时间未被请求的标签（不再为其预取）"""
+        for key in [k for k, v in self.tags.items() if now - v["requested"] > self.idle_ttl]:
+            del self.tags[key]
+        while len(self.tags) > MAX_TAGS:
+            del self.tags[min(self.tags, key=lambda k: self.tags[k]["requested"])]
+
+    def _entry(self, tag: str):
+        now = time.time()
+        key = self._key(tag)
+        entry = self.tags.get(key)
+        if entry is None:
+            entry = self.tags[key] = {"requested": now, "pages": {}}
+            self._evict(now)
+        entry["requested"] = now
+        return entry
+
+    def cached_page(self, tag: str, strategy_name: str, exclude: set):
+        """随机取一个未过期的已缓存页 (页码, 结果)，没有时返回 None"""
+        entry = self.tags.get(self._key(tag))
+        if entry is None:
+            return None
+        now = time.time()
+        fresh = [
+            (page, items) for (name, page), (fetched_at, items) in entry["pages"].items()
+            if name == strategy_name and page not in exclude and now - fetched_at <= self.page_ttl
+        ]
+        if not fresh:
+            return None
+        metrics_utils.incr("prefetch.hit")
+        return random.choice(fresh)
+
+    def store_page(self, tag: str, strategy_name: str, page: int, items: list) -> None:
+        """保存一页搜索结果"""
+        self._entry(tag)["pages"][(strategy_name, page)] = (time.time(), items)
+
+    def schedule(self, tag: str, encoded_tag: str, strategy: dict, skip_pages: set) -> None:
+        """标签被请求后，把该策略中未缓存（或已过期）的页加入预取队列"""
+        entry = self._entry(tag)
+        if "page_range" not in strategy or self.queue is None:
+            return  # 预取循环未运行
+        now = time.time()
+        low, high = strategy["page_range"]
+        for page in range(low, high + 1):
+            cached = entry["pages"].get((strategy["name"], page))
+            job_key = (self._key(tag), strategy["name"], page)
+            if page in skip_pages or job_key in self.pending or (cached and now - cached[0] <= self.page_ttl):
+                continue
+            try:
+                self.queue.put_nowait((tag, encoded_tag, dict(strategy), page))
+            except asyncio.QueueFull:
+                metrics_utils.incr("prefetch.dropped")
+                return
+            self.pending.add(job_key)
+
+    async def run(self) -> None:
+        """后台预取循环（请求本身通过低优先级令牌限速）"""
+        self.queue = asyncio.Queue(maxsize=MAX_QUEUE)
+        self.pending.clear()
+        while True:
+            tag, encoded_tag, strategy, page = await self.queue.get()
+            key = self._key(tag)
+            try:
+                if key not in self.tags or time.time() - self.tags[key]["requested"] > self.idle_ttl:
+                    metrics_utils.incr("prefetch.skipped_idle")
+                    continue
+                items = await self.fetch_page(tag, encoded_tag, strategy, page)
+                metrics_utils.incr("prefetch.fetched")
+                if items and key in self.tags:
+                    self.tags[key]["pages"][(strategy["name"], page)] = (time.time(), items)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics_utils.incr("prefetch.failed")
+                logger.debug("预取[%s]第%s页失败: %s", tag, page, e)
+            finally:
+                self.pending.discard((key, strategy["name"], page))
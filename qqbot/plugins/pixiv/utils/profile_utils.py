@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger()
+
+# 剩余需要分析的命令次数（由管理员命令设置，0 表示关闭）
+PROFILE_REMAINING = 0
+_PROFILE_LOCK = threading.Lock()
+# 当前任务上下文中正在进行的分析（未开启时为 None，阶段标记直接跳过）
+_ACTIVE_PROFILER = contextvars.ContextVar("pixiv_active_profiler", default=None)
+# 正在进行的分析：tracemalloc 的追踪状态与内存峰值是进程全局的，同一时间只分析一条命令
+_RUNNING_PROFILER = None
+
+
+def arm(count: int) -> None:
+    """开启分析模式：对接下来 count 次搜图命令进行采样分析"""
+    global PROFILE_REMAINING
+    with _PROFILE_LOCK:
+        PROFILE_REMAINING = max(0, count)
+
+
+def begin_command(label: str, output_dir: Path, sample_interval: float = 0.005):
+    """若分析模式已开启且没有其他命令正在分析，为当前命令创建并启动分析器，否则返回 None"""
+    global PROFILE_REMAINING, _RUNNING_PROFILER
+    if not PROFILE_REMAINING or _RUNNING_PROFILER is not None:
+        return None
+    with _PROFILE_LOCK:
+        if not PROFILE_REMAINING or _RUNNING_PROFILER is not None:
+            return None
+        PROFILE_REMAINING -= 1
+        profiler = _RUNNING_PROFILER = CommandProfiler(label, output_dir, sample_interval)
+    profiler.start()
+    return profiler
+
+
+@contextmanager
+def profile_stage(name: str):
+    """标记流水线阶段（下载缓冲/解码/缩放/发送等），未开启分析时无额外开销"""
+    profiler = _ACTIVE_PROFILER.get()
+    if profiler is None:
+        yield
+        return
+    profiler.enter_stage(name)
+    try:
+        yield
+    finally:
+        profiler.exit_stage(name)
+
+
+class CommandProfiler:
+    """单次命令的 CPU 采样 + tracemalloc 分阶段内存分析"""
+
+    def __init__(self, label: str, output_dir: Path, sample_interval: float) -> None:
+        self.label = label
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.stacks = Counter()
+        self.stages = []
+        self.stage_stack = []
+        self.started_tracemalloc = False
+        self.running = False
+        self.thread = None
+        self.token = None
+        self.target_thread_id = None
+        self.start_time = 0.0
+
+    def start(self) -> None:
+        """启动采样线程与内存追踪，并绑定到当前任务上下文"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self.started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self.target_thread_id = threading.get_ident()
+        self.start_time = time.perf_counter()
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, name="pixiv-profiler", daemon=True)
+        self.thread.start()
+        self.token = _ACTIVE_PROFILER.set(self)
+        logger.info("🔬 开始分析命令: %s", self.label)
+
+    def _sample(self) -> None:
+        """定时抓取事件循环线程的调用栈（折叠栈格式，可直接生成火焰图）"""
+        while self.running:
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is not None:
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(parts))] += 1
+            time.sleep(self.sample_interval)
+
+    def enter_stage(self, name: str) -> None:
+        """进入阶段：记录起始内存并重置峰值"""
+        current, peak = tracemalloc.get_traced_memory()
+        # 把外层阶段截至目前的峰值先折算进去，避免 reset_peak 丢失
+        if self.stage_stack:
+            self.stage_stack[-1]["peak"] = max(self.stage_stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        self.stage_stack.append({
+            "name": name,
+            "start": time.perf_counter(),
+            "start_bytes": current,
+            "peak": current,
+        })
+
+    def exit_stage(self, name: str) -> None:
+        """离开阶段：计算耗时与阶段内内存峰值增量"""
+        if not self.stage_stack or self.stage_stack[-1]["name"] != name:
+            return
+        stage = self.stage_stack.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        stage_peak = max(stage["peak"], peak)
+        if self.stage_stack:
+            self.stage_stack[-1]["peak"] = max(self.stage_stack[-1]["peak"], stage_peak)
+        self.stages.append({
+            "stage": name,
+            "duration_s": round(time.perf_counter() - stage["start"], 4),
+            "peak_delta_bytes": stage_peak - stage["start_bytes"],
+            "end_delta_bytes": current - stage["start_bytes"],
+        })
+
+    async def finish(self) -> None:
+        """结束分析并把报告写入 data 目录"""
+        global _RUNNING_PROFILER
+        self.running = False
+        if self.token is not None:
+            _ACTIVE_PROFILER.reset(self.token)
+            self.token = None
+        if self.thread:
+            # 采样线程最多还要睡眠一个采样间隔，不在事件循环中等待
+            await asyncio.to_thread(self.thread.join)
+        elapsed = time.perf_counter() - self.start_time
+        peak = 0
+        top_allocations = []
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            top_allocations = [
+                str(stat) for stat in tracemalloc.take_snapshot().statistics("lineno")[:15]
+            ]
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+        with _PROFILE_LOCK:
+            if _RUNNING_PROFILER is self:
+                _RUNNING_PROFILER = None
+        report = {
+            "label": self.label,
+            "elapsed_s": round(elapsed, 4),
+            "samples": sum(self.stacks.values()),
+            "peak_traced_bytes": peak,
+            "stages": self.stages,
+            "top_allocations": top_allocations,
+        }
+        try:
+            base = await asyncio.to_thread(self._write, report)
+            logger.info("🔬 分析报告已保存: %s.json / %s.collapsed (耗时 %.2fs)", base, base, elapsed)
+        except Exception as e:
+            logger.warning("分析报告保存失败: %s", e)
+
+    def _write(self, report: dict) -> Path:
+        """写出内存报告(JSON)与 CPU 折叠栈"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        base = self.output_dir / f"profile_{int(time.time() * 1000)}"
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        with open(f"{base}.collapsed", "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return base
@@ -0,0 +1,116 @@
+import random
+import urllib.parse
+from datetime import datetime, timezone
+from . import metrics_utils
+
+# 无观测数据时的先验值（保证新端点也能分到流量）
+PRIOR_TTFB = 0.5                    # 首字节延迟（秒）
+PRIOR_THROUGHPUT = 1024 * 1024      # 吞吐（字节/秒）
+# 评分时假设的典型下载体积
+EXPECTED_BYTES = 2 * 1024 * 1024
+
+
+class ImageEndpoint:
+    """单个图片镜像/代理端点及其 EWMA 统计"""
+
+    def __init__(self, base: str, alpha: float = 0.3, daily_quota: int = 0) -> None:
+        self.base = base.rstrip('/')
+        self.host = urllib.parse.urlparse(self.base).netloc or self.base
+        self.route_name = f"worker[{self.host}]"
+        self.alpha = alpha
+        self.daily_quota = daily_quota
+        self.ttfb = None
+        self.throughput = None
+        self.error_rate = 0.0
+        self.inflight = 0
+        self.quota_day = None
+        self.requests_today = 0
+
+    def _ewma(self, old, value: float) -> float:
+        return value if old is None else old + self.alpha * (value - old)
+
+    def record_first_byte(self, seconds: float) -> None:
+        """记录首字节延迟（收到响应头）与一次成功"""
+        self.ttfb = self._ewma(self.ttfb, seconds)
+        self.error_rate = self._ewma(self.error_rate, 0.0)
+        self._publish()
+
+    def record_slow(self, seconds: float) -> None:
+        """对冲落败被取消：至少等待了 seconds 仍未收到首字节"""
+        if self.ttfb is None or seconds > self.ttfb:
+            self.ttfb = self._ewma(self.ttfb, seconds)
+            self._publish()
+
+    def record_transfer(self, size: int, seconds: float) -> None:
+        """记录一次完整下载的吞吐"""
+        if seconds > 0:
+            self.throughput = self._ewma(self.throughput, size / seconds)
+            self._publish()
+
+    def record_error(self) -> None:
+        """记录一次失败"""
+        self.error_rate = self._ewma(self.error_rate, 1.0)
+        self._publish()
+
+    def count_request(self) -> None:
+        """按自然日（UTC）统计请求数，用于配额控制"""
+        today = datetime.now(timezone.utc).date()
+        if self.quota_day != today:
+            self.quota_day = today
+            self.requests_today = 0
+        self.requests_today += 1
+
+    def quota_exhausted(self) -> bool:
+        """是否已接近每日请求配额（超过 90%）"""
+        if not self.daily_quota:
+            return False
+        if self.quota_day != datetime.now(timezone.utc).date():
+            return False
+        return self.requests_today >= self.daily_quota * 0.9
+
+    def score(self) -> float:
+        """预计下载耗时（越小越好），按错误率与并发数加罚"""
+        ttfb = self.ttfb if self.ttfb is not None else PRIOR_TTFB
+        throughput = self.throughput if self.throughput is not None else PRIOR_THROUGHPUT
+        expected = ttfb + EXPECTED_BYTES / max(throughput, 1.0)
+        return expected * (1 + 5 * self.error_rate) * (1 + 0.5 * self.inflight)
+
+    def hedge_delay(self, min_delay: float, max_delay: float) -> float:
+        """对冲请求的触发延迟：约为 3 倍平时首字节延迟"""
+        if self.ttfb is None:
+            return max_delay
+        return min(max_delay, max(min_delay, self.ttfb * 3))
+
+    def _publish(self) -> None:
+        prefix = f"proxy_pool.{self.host}"
+        if self.ttfb is not None:
+            metrics_utils.set_gauge(f"{prefix}.ttfb_ms", round(self.ttfb * 1000, 1))
+        if self.throughput is not None:
+            metrics_utils.set_gauge(f"{prefix}.throughput_kbps", round(self.throughput / 1024, 1))
+        metrics_utils.set_gauge(f"{prefix}.error_rate", round(self.error_rate, 3))
+        metrics_utils.set_gauge(f"{prefix}.requests_today", self.requests_today)
+
+
+class ImageProxyPool:
+    """图片代理端点池：按实时评分加权选择，避免流量集中到单个 Worker"""
+
+    def __init__(self, bases: list, daily_quota: int = 0) -> None:
+        self.endpoints = [ImageEndpoint(base, daily_quota=daily_quota) for base in bases if base.strip()]
+        self.by_route_name = {endpoint.route_name: endpoint for endpoint in self.endpoints}
+
+    def match(self, url: str):
+        """返回 url 所属的端点（不属于任何端点时为 None）"""
+        for endpoint in self.endpoints:
+            if url.startswith(endpoint.base):
+                return endpoint
+        return None
+
+    def ordered(self) -> list:
+        """本次请求的端点顺序：首选按 1/评分² 加权随机，其余按评分升序作为备选"""
+        available = [e for e in self.endpoints if not e.quota_exhausted()] or list(self.endpoints)
+        if len(available) <= 1:
+            return available
+        weights = [1 / (e.score() ** 2) for e in available]
+        first = random.choices(available, weights=weights, k=1)[0]
+        rest = sorted((e for e in available if e is not first), key=lambda e: e.score())
+        return [first, *rest]
@@ -0,0 +1,49 @@
+import asyncio
+import time
+from . import metrics_utils
+from .retry_utils import rate_limit_remaining
+
+# 请求优先级
+PRIORITY_HIGH = 0   # 用户命令
+PRIORITY_LOW = 1    # 后台预取、健康检查
+
+
+class OutboundRateLimiter:
+    """全局 Pixiv API 出站令牌桶：用户命令优先，后台请求只使用富余令牌且在限流退避期间暂停"""
+
+    def __init__(self, rate: float, burst: int, low_priority_reserve: float = 0.5) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        # 后台请求需在桶中至少保留该比例的令牌，留给用户命令
+        self.low_priority_floor = 1 + low_priority_reserve * self.burst
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.waiting_high = 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority: int = PRIORITY_HIGH) -> None:
+        """获取一个出站令牌（rate 为 0 时不限速）"""
+        if priority == PRIORITY_HIGH:
+            self.waiting_high += 1
+        try:
+            while True:
+                if priority != PRIORITY_HIGH and (rate_limit_remaining() > 0 or self.waiting_high):
+                    metrics_utils.incr("rate_limiter.low_priority_wait")
+                    await asyncio.sleep(max(1.0, rate_limit_remaining()))
+                    continue
+                if not self.rate:
+                    return
+                now = time.monotonic()
+                self._refill(now)
+                floor = 1 if priority == PRIORITY_HIGH else self.low_priority_floor
+                if self.tokens >= floor:
+                    self.tokens -= 1
+                    metrics_utils.set_gauge("rate_limiter.tokens", round(self.tokens, 2))
+                    return
+                await asyncio.sleep((floor - self.tokens) / self.rate)
+        finally:
+            if priority == PRIORITY_HIGH:
+                self.waiting_high -= 1
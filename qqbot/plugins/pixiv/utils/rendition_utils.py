@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+from . import metrics_utils
+
+logger = logging.getLogger()
+
+
+class RenditionCache:
+    """派生图片缓存：按 (作品ID, 页码, 字节上限, 格式) 保存压缩后可直接发送的图片，
+    总大小超出配额时淘汰最久未使用的条目
+
+    索引只在事件循环中修改，文件读写在线程中执行；首次访问时扫描目录重建索引（按修改时间排序）。
+    """
+
+    def __init__(self, directory: Path, quota_bytes: int) -> None:
+        self.directory = Path(directory)
+        self.quota_bytes = quota_bytes
+        self.entries = OrderedDict()    # {文件名: 字节数}，最近使用的在末尾
+        self.total = 0
+        self._loaded = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.quota_bytes > 0
+
+    @staticmethod
+    def _name(key: tuple) -> str:
+        pid, page, max_bytes, fmt = key
+        return f"{pid}_p{page}_{max_bytes}.{fmt}"
+
+    def _scan(self) -> list:
+        """列出已有缓存文件 [(修改时间, 字节数, 文件名)]，顺带删除中断写入的残留"""
+        if not self.directory.is_dir():
+            return []
+        found = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if entry.name.endswith(".part"):
+                    Path(entry.path).unlink(missing_ok=True)
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                found.append((stat.st_mtime, stat.st_size, entry.name))
+        return sorted(found)
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        try:
+            found = await asyncio.to_thread(self._scan)
+        except OSError as e:
+            logger.warning("扫描图片缓存目录失败: %s", e)
+            found = []
+        if self._loaded:
+            return  # 扫描期间已由其他请求加载
+        for _, size, name in found:
+            self.entries[name] = size
+            self.total += size
+        self._loaded = True
+        self._update_gauges()
+
+    def _read(self, path: Path) -> bytes:
+        data = path.read_bytes()
+        # 刷新修改时间，重启后重建索引时保持最近使用顺序
+        os.utime(path)
+        return data
+
+    async def get(self, key: tuple):
+        """返回缓存的图片数据，未命中返回 None"""
+        if not self.enabled:
+            return None
+        await self._ensure_loaded()
+        name = self._name(key)
+        if name not in self.entries:
+            metrics_utils.incr("rendition.miss")
+            return None
+        self.entries.move_to_end(name)
+        try:
+            data = await asyncio.to_thread(self._read, self.directory / name)
+        except FileNotFoundError:
+            self._drop(name)
+            metrics_utils.incr("rendition.miss")
+            return None
+        metrics_utils.incr("rendition.hit")
+        return data
+
+    @staticmethod
+    def _store(source: Path, target: Path) -> int:
+        """把文件放入缓存目录（同一文件系统时硬链接，否则复制），返回字节数"""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        part = target.with_name(f"{target.name}.part")
+        part.unlink(missing_ok=True)
+        try:
+            os.link(source, part)
+        except OSError:
+            shutil.copyfile(source, part)
+        part.replace(target)
+        return target.stat().st_size
+
+    async def put_file(self, key: tuple, source: Path) -> None:
+        """缓存已生成的图片文件（调用方随后可以照常删除源文件）"""
+        if not self.enabled:
+            return
+        await self._ensure_loaded()
+        name = self._name(key)
+        try:
+            size = await asyncio.to_thread(self._store, source, self.directory / name)
+        except OSError as e:
+            logger.warning("写入图片缓存失败 %s: %s", name, e)
+            return
+        self._drop(name)
+        self.entries[name] = size
+        self.total += size
+        metrics_utils.incr("rendition.stored")
+        await self._evict()
+
+    def _drop(self, name: str) -> None:
+        size = self.entries.pop(name, None)
+        if size is not None:
+            self.total -= size
+
+    async def _evict(self) -> None:
+        """超出配额时从最久未使用的条目开始删除（最新写入的条目保留）"""
+        victims = []
+        while self.total > self.quota_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total -= size
+            victims.append(self.directory / name)
+        self._update_gauges()
+        if not victims:
+            return
+        metrics_utils.incr("rendition.evicted", len(victims))
+
+        def _remove():
+            for path in victims:
+                path.unlink(missing_ok=True)
+
+        try:
+            await asyncio.to_thread(_remove)
+        except OSError as e:
+            logger.warning("删除图片缓存失败: %s", e)
+
+    def _update_gauges(self) -> None:
+        metrics_utils.set_gauge("rendition.bytes", self.total)
+        metrics_utils.set_gauge("rendition.files", len(self.entries))
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import random
+import time
+from http import HTTPStatus
+from . import metrics_utils
+from .error_utils import PixivAPIError
+from .http_utils import UpstreamUnavailable
+from ..config.config import (
+    RETRY_MAX_ATTEMPTS,
+    RETRY_TIME_BUDGET,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    RATE_LIMIT_BACKOFF
+)
+
+logger = logging.getLogger()
+
+# 错误处理方式
+RETRY = "retry"                    # 暂时性错误（网络/超时/5xx/429）：退避后重试当前策略
+NEXT_CANDIDATE = "next_candidate"  # 当前作品不可用：换一个候选作品，无需重新搜索
+NEXT_STRATEGY = "next_strategy"    # 当前策略不会有结果：直接换下一个策略
+NEXT_ACCOUNT = "next_account"      # 当前 Cookie 被拒绝（401/403，账号池已将其隔离）：换一个正常账号重试
+FATAL = "fatal"                    # 确定性失败（请求错误/程序错误）：立即放弃
+
+# 全局限流退避截止时间（所有命令共享，收到 429 时设置）
+_RATE_LIMITED_UNTIL = 0.0
+
+
+def classify(error: Exception) -> str:
+    """根据错误类型与 HTTP 状态码决定处理方式"""
+    if not isinstance(error, PixivAPIError):
+        import aiohttp
+        # 只有网络错误、超时与所有线路不可用（含熔断中）才重试，KeyError 等程序错误直接暴露
+        if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, UpstreamUnavailable)):
+            return RETRY
+        return FATAL
+    status = error.details.get("status")
+    if status == HTTPStatus.TOO_MANY_REQUESTS or (status and status >= 500):
+        return RETRY
+    if status in (HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN):
+        return NEXT_ACCOUNT
+    if error.error_type in ("r18_rejected", "detail_error"):
+        return NEXT_CANDIDATE
+    if error.error_type in ("empty_data", "all_filtered"):
+        return NEXT_STRATEGY
+    return FATAL
+
+
+def note_rate_limited(retry_after: float = None) -> None:
+    """收到 429：所有命令在 Retry-After（缺省 RATE_LIMIT_BACKOFF）内暂停请求"""
+    global _RATE_LIMITED_UNTIL
+    until = time.monotonic() + (retry_after or RATE_LIMIT_BACKOFF)
+    if until > _RATE_LIMITED_UNTIL:
+        _RATE_LIMITED_UNTIL = until
+        logger.warning("⏳ Pixiv 限流，全局暂停请求 %.0fs", until - time.monotonic())
+    metrics_utils.incr("retry.rate_limited")
+
+
+def rate_limit_remaining() -> float:
+    """全局限流退避剩余时间（秒）"""
+    return max(0.0, _RATE_LIMITED_UNTIL - time.monotonic())
+
+
+class RetryBudgetExceeded(Exception):
+    """单条命令的重试次数或时间预算已用尽"""
+
+
+class RetryBudget:
+    """单条命令的重试预算：最多 max_attempts 次上游请求，总耗时不超过 max_seconds"""
+
+    def __init__(self, max_attempts: int = RETRY_MAX_ATTEMPTS, max_seconds: float = RETRY_TIME_BUDGET) -> None:
+        self.max_attempts = max_attempts
+        self.deadline = time.monotonic() + max_seconds
+        self.attempts = 0
+        self.retries = 0
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def exhausted(self) -> bool:
+        return self.attempts >= self.max_attempts or self.remaining() <= 0
+
+    async def acquire(self) -> None:
+        """发起一次上游请求前调用：检查预算并等待全局限流退避结束"""
+        if self.exhausted():
+            raise RetryBudgetExceeded(f"重试预算已用尽（{self.attempts} 次请求）")
+        wait = rate_limit_remaining()
+        if wait > self.remaining():
+            metrics_utils.incr("retry.budget_exceeded")
+            raise RetryBudgetExceeded(f"Pixiv 限流中，需等待 {wait:.0f}s")
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self.attempts += 1
+
+    async def backoff(self) -> None:
+        """暂时性错误后的指数退避（带随机抖动，不超过剩余预算）"""
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** self.retries))
+        self.retries += 1
+        metrics_utils.incr("retry.backoff")
+        await asyncio.sleep(min(delay, self.remaining()))
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from pathlib import Path
+from . import metrics_utils
+
+logger = logging.getLogger()
+
+# 最多记录的标签数（超出时淘汰最久未更新的）
+MAX_TAGS = 2000
+
+
+class TagStatsStore:
+    """按标签记录搜索结果：上次成功的策略、已知为空的策略页（带过期时间），持久化到 JSON"""
+
+    def __init__(self, path: Path, negative_ttl: float, strategy_ttl: float) -> None:
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.strategy_ttl = strategy_ttl
+        self.tags = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """从文件加载统计（在驱动启动时于线程中执行，加载前已记录的条目优先保留）"""
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+        except Exception as e:
+            logger.warning("加载标签搜索统计失败: %s", e)
+            return
+        with self._lock:
+            loaded.update(self.tags)
+            self.tags = loaded
+        logger.info("标签搜索统计加载成功，共 %d 个标签", len(self.tags))
+
+    @staticmethod
+    def _key(tag: str) -> str:
+        return tag.strip().lower()
+
+    def _entry(self, tag: str, create: bool = False):
+        key = self._key(tag)
+        entry = self.tags.get(key)
+        if entry is None and create:
+            if len(self.tags) >= MAX_TAGS:
+                oldest = min(self.tags, key=lambda k: self.tags[k].get("updated", 0))
+                del self.tags[oldest]
+            entry = self.tags[key] = {"best": None, "best_at": 0, "empty": {}, "updated": 0}
+        return entry
+
+    def _empty_pages(self, entry, strategy_name: str) -> set:
+        """当前仍有效的空页集合"""
+        if entry is None:
+            return set()
+        now = time.time()
+        prefix = f"{strategy_name}#"
+        return {
+            int(key[len(prefix):]) for key, expires in entry["empty"].items()
+            if key.startswith(prefix) and expires > now
+        }
+
+    def order_strategies(self, tag: str, strategies: list) -> list:
+        """上次产出结果的策略排在最前，其余保持原顺序"""
+        with self._lock:
+            entry = self._entry(tag)
+            if entry is None or not entry["best"] or time.time() - entry["best_at"] > self.strategy_ttl:
+                return strategies
+            best = entry["best"]
+        ordered = [s for s in strategies if s["name"] == best] + [s for s in strategies if s["name"] != best]
+        if ordered[0]["name"] == best:
+            metrics_utils.incr("tag_stats.learned_order")
+        return ordered
+
+    def empty_pages(self, tag: str, strategy_name: str) -> set:
+        """该标签在指定策略下已知为空的页码"""
+        with self._lock:
+            return self._empty_pages(self._entry(tag), strategy_name)
+
+    def pick_page(self, tag: str, strategy: dict):
+        """选择本次请求的页码，跳过已知为空的页；所有页都为空时返回 None"""
+        empty = self.empty_pages(tag, strategy["name"])
+        if "page" in strategy:
+            pages = [strategy["page"]]
+        else:
+            low, high = strategy.get("page_range", (1, 3))
+            pages = list(range(low, high + 1))
+        pages = [page for page in pages if page not in empty]
+        if not pages:
+            metrics_utils.incr("tag_stats.skipped")
+            return None
+        return random.choice(pages)
+
+    def record_success(self, tag: str, strategy_name: str) -> None:
+        """记录产出候选作品的策略"""
+        with self._lock:
+            entry = self._entry(tag, create=True)
+            entry["best"] = strategy_name
+            entry["best_at"] = entry["updated"] = time.time()
+            self.dirty = True
+
+    def record_empty(self, tag: str, strategy_name: str, page: int) -> None:
+        """记录空结果页（negative_ttl 后过期）"""
+        with self._lock:
+            entry = self._entry(tag, create=True)
+            now = time.time()
+            entry["empty"] = {k: v for k, v in entry["empty"].items() if v > now}
+            entry["empty"][f"{strategy_name}#{page}"] = now + self.negative_ttl
+            entry["updated"] = now
+            self.dirty = True
+
+    def _write(self) -> None:
+        with self._lock:
+            data = json.dumps(self.tags, ensure_ascii=False)
+            self.dirty = False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(data, encoding='utf-8')
+        tmp_path.replace(self.path)
+
+    async def flush(self) -> None:
+        """有变更时写入磁盘"""
+        if not self.dirty:
+            return
+        try:
+            await asyncio.to_thread(self._write)
+        except Exception as e:
+            logger.warning("保存标签搜索统计失败: %s", e)
+
+
+async def run_tag_stats_flush(store: TagStatsStore, interval: float) -> None:
+    """后台定期保存标签搜索统计"""
+    while True:
+        await asyncio.sleep(interval)
+        await store.flush()
@@ -0,0 +1,75 @@
+from collections import deque
+from typing import NamedTuple, Optional
+from . import metrics_utils
+from ..config.config import (
+    ROUTE_CONNECT_TIMEOUT,
+    TIMEOUT_PERCENTILE,
+    TIMEOUT_MULTIPLIER,
+    TIMEOUT_MIN,
+    TIMEOUT_MIN_SAMPLES,
+    TIMEOUT_MIN_THROUGHPUT
+)
+
+# 每个 (请求类型, 线路) 保留的样本数
+WINDOW = 200
+# 大小未知的下载按该体积估算超时
+DEFAULT_EXPECTED_BYTES = 16 * 1024 * 1024
+
+
+class Timeouts(NamedTuple):
+    """单次请求的超时计划（秒）"""
+    connect: float
+    first_byte: float
+    idle: float
+    total: Optional[float]
+
+
+class LatencyTracker:
+    """单个 (请求类型, 线路) 的首字节延迟与下载吞吐样本"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.ttfb = deque(maxlen=WINDOW)
+        self.throughput = deque(maxlen=WINDOW)
+
+    def observe_first_byte(self, seconds: float) -> None:
+        """记录首字节延迟（超时也按已等待的时间记录，使超时能随线路变慢而放宽）"""
+        self.ttfb.append(seconds)
+        metrics_utils.observe(f"ttfb.{self.name}", seconds)
+
+    def observe_transfer(self, size: int, seconds: float) -> None:
+        """记录一次完整下载的吞吐（字节/秒）"""
+        if seconds > 0:
+            self.throughput.append(size / seconds)
+
+    def plan(self, ceiling: float, expected_size: int = 0) -> Timeouts:
+        """根据历史分位数计算超时；样本不足时使用调用方给出的上限"""
+        if len(self.ttfb) < TIMEOUT_MIN_SAMPLES:
+            first_byte = ceiling
+            connect = min(ROUTE_CONNECT_TIMEOUT, ceiling)
+        else:
+            observed = metrics_utils.percentile(list(self.ttfb), TIMEOUT_PERCENTILE) * TIMEOUT_MULTIPLIER
+            first_byte = min(ceiling, max(TIMEOUT_MIN, observed))
+            connect = min(ROUTE_CONNECT_TIMEOUT, first_byte)
+        # 传输途中长时间收不到数据视为卡死（与首字节同一量级，至少 TIMEOUT_MIN）
+        idle = max(TIMEOUT_MIN, first_byte)
+        if not expected_size:
+            return Timeouts(connect, first_byte, idle, ceiling)
+        # 下载总超时按预估体积 / 保守吞吐（历史 p10 的一半，不低于 TIMEOUT_MIN_THROUGHPUT）
+        rate = TIMEOUT_MIN_THROUGHPUT
+        if len(self.throughput) >= TIMEOUT_MIN_SAMPLES:
+            rate = max(rate, metrics_utils.percentile(list(self.throughput), 10) / 2)
+        return Timeouts(connect, first_byte, idle, first_byte + expected_size / rate)
+
+
+# 全部延迟统计 {(请求类型, 线路): LatencyTracker}
+TRACKERS = {}
+
+
+def get_tracker(request_class: str, route_name: str) -> LatencyTracker:
+    """获取（或创建）指定请求类型与线路的延迟统计"""
+    key = (request_class, route_name)
+    tracker = TRACKERS.get(key)
+    if tracker is None:
+        tracker = TRACKERS[key] = LatencyTracker(f"{request_class}.{route_name}")
+    return tracker
@@ -0,0 +1,4 @@
+import nonebot
+
+# 导入插件包需要先初始化 NoneBot
+nonebot.init(driver="~none")
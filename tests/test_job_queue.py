@@ -0,0 +1,52 @@
+import asyncio
+
+from qqbot.plugins.pixiv.utils.job_queue_utils import FairJobQueue
+
+
+async def _process_one(queue: FairJobQueue, group: str) -> list:
+    done = []
+
+    async def _job() -> None:
+        done.append(group)
+
+    workers = queue.start()
+    # 让 worker 先阻塞在等待作业上（等待时 asyncio 原语会绑定当前事件循环）
+    await asyncio.sleep(0)
+    try:
+        job, _ = queue.submit(group, f"{group}-job", _job)
+        await asyncio.wait_for(job.wait(), 5)
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return done
+
+
+def test_queue_built_before_event_loop_processes_jobs() -> None:
+    # 与插件中的 PIXIV_JOBS 一样，在事件循环启动前构造队列
+    queue = FairJobQueue(workers=2, max_pending=10, max_pending_per_group=5, timeout=5)
+    assert asyncio.run(_process_one(queue, "g1")) == ["g1"]
+    # 重新启动事件循环（如 nb run --reload）后仍可处理作业
+    assert asyncio.run(_process_one(queue, "g2")) == ["g2"]
+
+
+def test_jobs_submitted_before_start_are_processed() -> None:
+    queue = FairJobQueue(workers=1, max_pending=10, max_pending_per_group=5, timeout=5)
+
+    async def _main() -> list:
+        done = []
+
+        async def _job() -> None:
+            done.append("early")
+
+        job, _ = queue.submit("g", "early", _job)
+        workers = queue.start()
+        try:
+            await asyncio.wait_for(job.wait(), 5)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return done
+
+    assert asyncio.run(_main()) == ["early"]
@@ -0,0 +1,34 @@
+import asyncio
+
+from qqbot.plugins.pixiv.utils.prefetch_utils import SearchPrefetcher
+
+STRATEGY = {"name": "宽松模式", "params": {}, "page_range": (1, 2)}
+
+
+def test_prefetcher_built_before_event_loop_fetches_pages() -> None:
+    fetched = []
+
+    async def _fetch_page(tag: str, encoded_tag: str, strategy: dict, page: int) -> list:
+        fetched.append(page)
+        return [page]
+
+    # 与插件中的 PREFETCHER 一样，在事件循环启动前构造
+    prefetcher = SearchPrefetcher(_fetch_page, page_ttl=600, idle_ttl=600)
+    prefetcher.schedule("tag", "tag", STRATEGY, set())   # 预取循环未运行时忽略
+
+    async def _main() -> None:
+        task = asyncio.create_task(prefetcher.run())
+        await asyncio.sleep(0)
+        try:
+            prefetcher.schedule("tag", "tag", STRATEGY, set())
+            for _ in range(100):
+                if len(fetched) == 2:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(_main())
+    assert sorted(fetched) == [1, 2]
+    assert prefetcher.cached_page("tag", "宽松模式", {1}) == (2, [2])
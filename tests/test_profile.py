@@ -0,0 +1,37 @@
+import asyncio
+import tracemalloc
+
+from qqbot.plugins.pixiv.utils import profile_utils
+
+
+def test_only_one_command_profiled_at_a_time(tmp_path) -> None:
+    async def _command(started: asyncio.Event, release: asyncio.Event):
+        profiler = profile_utils.begin_command("cmd", tmp_path, 0.001)
+        started.set()
+        with profile_utils.profile_stage("work"):
+            await release.wait()
+        if profiler:
+            await profiler.finish()
+        return profiler
+
+    async def _main() -> list:
+        release = asyncio.Event()
+        started = [asyncio.Event(), asyncio.Event()]
+        tasks = []
+        for event in started:
+            tasks.append(asyncio.create_task(_command(event, release)))
+            await event.wait()
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    profile_utils.arm(3)
+    try:
+        first, second = asyncio.run(_main())
+        assert first is not None
+        assert second is None
+        assert not tracemalloc.is_tracing()
+        assert len(list(tmp_path.glob("profile_*.json"))) == 1
+        # 未被分析的命令不占用分析次数
+        assert profile_utils.PROFILE_REMAINING == 2
+    finally:
+        profile_utils.arm(0)